@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backendMattel.settings')
 
+# Con workers async (gunicorn backendMattel.asgi:application -k uvicorn.workers.UvicornWorker) login y
+# registro esperan al pool de hashing (projects/hashing.py) y las lecturas de /api/v1/asincrono/ a la base
+# de datos (projects/asincrono.py) sin ocupar el worker; las vistas síncronas de DRF siguen funcionando
+# igual, cada una en un hilo
+
 application = get_asgi_application()
@@ -14,6 +14,7 @@ import os
 from dotenv import load_dotenv
 from pathlib import Path
 from datetime import timedelta
+from importlib.util import find_spec
 import dj_database_url
 
 load_dotenv()
@@ -29,6 +30,9 @@ ALLOWED_HOSTS = ["*"]
 CORS_ALLOWED_ORIGINS = os.getenv("CORS_ORIGINS", "").split(",")
 
 AUTH_USER_MODEL = 'projects.Usuario'
+# El de Django: el admin y los authenticate() síncronos cifran en su hilo. Solo las vistas async de login y
+# registro usan el pool de projects/hashing.py (ModelBackendPool.aautenticar)
+AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
 
 
 # Application definition
@@ -49,6 +53,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'projects.middleware.CompresionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -89,6 +94,51 @@ DATABASES = {
 
 
 
+# Caché: en local basta la de memoria, pero con varios workers (gunicorn) tiene que ser compartida (Redis)
+# para que las invalidaciones del catálogo lleguen a todos los procesos
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'backendMattel',
+        }
+    }
+
+# Caché de respuestas del catálogo (segundos)
+CATALOGO_CACHE_ACTIVA = True
+CATALOGO_CACHE_TIMEOUT = 300
+
+# Registros admitidos por petición en los endpoints /bulk/
+CATALOGO_BULK_MAX = 1000
+
+# La migración 0010 (claves naturales) se niega a seguir si encuentra registros duplicados y los lista.
+# Con True los fusiona: conserva el más antiguo de cada grupo y borra el resto
+CATALOGO_FUSIONAR_DUPLICADOS = False
+
+# Filas por trozo (una consulta con sus documentos precalculados) en la exportación en streaming de todos/exportar/
+CATALOGO_EXPORT_TROZO = 1000
+
+# Compresión de respuestas (brotli si está instalado, si no gzip): tamaño mínimo en bytes y niveles
+COMPRESION_MINIMO = 1024
+COMPRESION_NIVEL_GZIP = 6
+COMPRESION_NIVEL_BROTLI = 5
+
+# Listados construidos desde .values() sin instanciar los serializadores por fila (ver projects/lectura.py)
+CATALOGO_LECTURA_RAPIDA = True
+# Vistas async de lectura (projects/asincrono.py): cada consulta de un gather en su propio hilo y conexión
+# (que el hilo reutiliza mientras lo permita CONN_MAX_AGE), en paralelo de verdad. Con None se activa salvo
+# con SQLite o dentro de una transacción; con False el ORM async de Django las ejecuta una a una en el hilo
+# de la petición. Cada hilo del pool puede tener una conexión abierta: cuenta para max_connections
+CATALOGO_ASYNC_PARALELO = None
+
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -100,13 +150,28 @@ AUTH_PASSWORD_VALIDATORS = [
 # Django Rest Framework + JWT
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'projects.autenticacion.CachedJWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ['rest_framework.filters.OrderingFilter'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    # JSON con orjson; MessagePack si el cliente lo pide con Accept: application/msgpack (o ?format=msgpack)
+    'DEFAULT_RENDERER_CLASSES': [
+        'projects.renderers.OrjsonRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'projects.renderers.OrjsonParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# msgpack es opcional: solo se ofrece si está instalado
+if find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].insert(1, 'projects.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].insert(1, 'projects.renderers.MessagePackParser')
+
 # Configuración de Simple JWT
 SIMPLE_JWT = {
     #El access token es para verificarse, mientras que el refresh token es para que, cuando cumpla el access token, se pida uno nuevo
@@ -122,7 +187,24 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    'TOKEN_REFRESH_SERIALIZER': 'projects.serializers.TokenRefreshSerializer',
 }
+# Segundos que CachedJWTAuthentication guarda el usuario del token sin volver a leerlo (0 = sin caché)
+JWT_CACHE_USUARIO_TIMEOUT = 60
+# Lista negra de tokens (projects/tokens.py): tamaño mínimo del filtro de Bloom por proceso y purga de los
+# caducados, un lote cada JWT_PURGA_INTERVALO segundos desde token/refresh/ (y entero con purgar_tokens)
+JWT_LISTA_NEGRA_CAPACIDAD = 10000
+# El filtro solo se fía de un "no está" si la caché es compartida entre procesos (Redis, Memcached...): con la
+# de memoria cada worker no se entera de los tokens que añaden los demás y se consulta siempre la base de datos.
+# None lo decide según CACHES; True/False lo fuerzan
+JWT_LISTA_NEGRA_FILTRO = None
+JWT_PURGA_INTERVALO = 3600
+JWT_PURGA_LOTE = 1000
+# Pool de hashing de contraseñas (login y registro, projects/hashing.py): hilos que calculan a la vez
+# (None: hasta 4 según los núcleos; 0: en el hilo de la petición) y trabajos que pueden esperar turno antes
+# de contestar 503 con Retry-After
+HASHING_HILOS = None
+HASHING_COLA = 16
 
 # Configuración CORS
 CORS_ALLOWED_ORIGINS = [
@@ -150,6 +232,20 @@ MEDIA_URL = '/media/'
 BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Variantes de las fotos de perfil (projects/imagenes.py): anchos de los recortes cuadrados (WebP y JPEG),
+# calidades e hilos que las generan fuera de la petición (0: en el momento, en el hilo que guarda el usuario)
+IMAGENES_PERFIL_ANCHOS = (64, 128, 256, 512)
+IMAGENES_CALIDAD_WEBP = 80
+IMAGENES_CALIDAD_JPEG = 85
+IMAGENES_HILOS = 1
+
+# Proxy de las fotos del catálogo (projects/fotos.py, /api/v1/imagenes/): anchos de las variantes, límites de
+# la descarga y la función que descarga (ruta importable; los tests la cambian por otra)
+IMAGENES_FOTOS_ANCHOS = (160, 320, 640, 1024)
+IMAGENES_FOTOS_MAX_BYTES = 10 * 1024 * 1024
+IMAGENES_FOTOS_TIMEOUT = 10
+IMAGENES_FOTOS_DESCARGADOR = 'projects.fotos.descargar_http'
+
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -14,12 +14,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
+from projects.views import imagen_perfil
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('projects.urls')),
+    path(f"{settings.MEDIA_URL.strip('/')}/profile_images/<path:ruta>", imagen_perfil, name='imagen_perfil'),
 ]
 
@@ -1,12 +1,33 @@
 from django.forms import ValidationError
 from django.shortcuts import get_object_or_404
-from .models import Personajes, Mascotas, Ediciones, Skullectors, Usuario
-from rest_framework import viewsets, filters, status, permissions
+from django.http import StreamingHttpResponse
+from .models import Personajes, Mascotas, Ediciones, Skullectors, Usuario, ResumenPrecio
+from rest_framework import viewsets, filters, status, permissions, serializers
 from .permisions import IsAdminOrReadOnly
+from .pagination import CatalogoPagination
+from .cache import CacheRespuestaMixin, estadisticas
+from .conditional import CondicionalMixin
+from .bulk import BulkMixin, CLAVES_NATURALES, guardar_cambios, guardar_unico, pide_upsert
+from .export import exportar_csv, exportar_ndjson
+from .search import buscar_personajes
+from .documentos import DocumentoCompletoSerializer
+from .lectura import LecturaRapidaMixin
+from .campos import CamposMixin
+from .facetas import CronologiaMixin, FacetasMixin
+from .fechas import filtrar_lanzamiento
+from .precios import filtrar_precio, filtrar_resumenes, tendencia_precios
 from .serializers import PersonajesSerializer, MascotasCompletaSerializer, CompletoSerializer, EdicionCompletaSerializer, UserSerializer, SkullectorCompletaSerializer, RegisterSerializer, LoginSerializer
+from .serializers import PersonajesBulkSerializer, MascotasBulkSerializer, EdicionesBulkSerializer, SkullectorsBulkSerializer
+from .serializers import ResumenPrecioSerializer, TendenciaPrecioSerializer, respuesta_login
+from .asincrono import VistaAsincrona
+from .autenticacion import ModelBackendPool
+from .hashing import pool_hashing
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
 from rest_framework.response import Response
+from rest_framework.decorators import action
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import RefreshToken
 from django.contrib.auth import get_user_model
 from rest_framework.permissions import IsAuthenticated
 from django.core.exceptions import ValidationError as DjangoValidationError
@@ -15,18 +36,46 @@ from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from rest_framework.exceptions import NotAuthenticated, PermissionDenied, ParseError
 
 
-class CompletoViewSet(viewsets.ModelViewSet):
+class CompletoViewSet(FacetasMixin, CronologiaMixin, CondicionalMixin, CacheRespuestaMixin, CamposMixin, LecturaRapidaMixin, viewsets.ModelViewSet):
     queryset = Personajes.objects.all()
     permission_classes = [IsAdminOrReadOnly, IsAuthenticated]
     serializer_class = CompletoSerializer
 
+    pagination_class = CatalogoPagination
+
     filter_backends = [filters.SearchFilter, OrderingFilter]
     ordering_fields = '__all__'
+    cursor_ordering_fields = ('fecha_subida', 'nombre', 'id')
+    campos_facetas = {
+        'generacion': 'ediciones__generacion',
+        'monstruo': 'monstruo',
+        'sexo': 'sexo',
+        'limitada': 'skullectors__limitada',
+        'certificado': 'skullectors__certificado',
+        'tipoMascota': 'mascota__tipo',
+    }
     search_fields = ('nombre', 'generacion', 'edad', 'lanzamiento', 'cumpleanios', 'tipoMascota', 'tipo', 'ciudad', 'frase', 'colorFav', 'sexo', 'ordering')
 
 
+    # Las lecturas salen de los documentos precalculados (DocumentoCatalogo), sin recorrer las relaciones.
+    # Con ?fields= / ?expand= se serializa solo lo pedido, cargando solo eso (ver campos.py)
+    def lee_documentos(self):
+        if self.action == 'exportar':
+            return True
+        return self.action in ('list', 'retrieve') and self.seleccion().vacia()
+
+    def get_serializer_class(self):
+        if self.lee_documentos():
+            return DocumentoCompletoSerializer
+        return super().get_serializer_class()
+
     def get_queryset(self):
-        queryset = Personajes.objects.all()
+        if self.lee_documentos():
+            queryset = Personajes.objects.select_related('documento')
+        elif self.action in ('list', 'retrieve'):
+            queryset = Personajes.objects.all()
+        else:
+            queryset = Personajes.objects.completo()
         params = self.request.query_params
 
         generacion = params.get('generacion', None)
@@ -48,6 +97,7 @@ class CompletoViewSet(viewsets.ModelViewSet):
         fechaLanzamiento = params.get('lanzamiento', None)
         if fechaLanzamiento is not None:
             queryset = queryset.filter(lanzamiento__icontains=fechaLanzamiento)
+        queryset = filtrar_lanzamiento(queryset, params)
 
         fechaCumpleanios = params.get('cumpleanios', None)
         if fechaCumpleanios is not None:
@@ -77,6 +127,11 @@ class CompletoViewSet(viewsets.ModelViewSet):
         if sexo is not None:
             queryset = queryset.filter(sexo__icontains=sexo)
 
+        #Búsqueda de texto completo, ordenada por relevancia salvo que se pida otro orden
+        q = params.get('q', None)
+        if q:
+            queryset = buscar_personajes(queryset, q)
+
         ordering = params.get('ordering', None)
         if ordering:
             queryset = queryset.order_by(*ordering.split(','))
@@ -84,6 +139,18 @@ class CompletoViewSet(viewsets.ModelViewSet):
 
         return queryset
     
+    #Exporta el catálogo completo (con los mismos filtros que el listado) en streaming: ?formato=ndjson|csv
+    @action(detail=False, methods=['get'], url_path='exportar')
+    def exportar(self, request):
+        formato = request.query_params.get('formato', 'ndjson')
+        if formato == 'ndjson':
+            respuesta = StreamingHttpResponse(exportar_ndjson(self.get_queryset()), content_type='application/x-ndjson; charset=utf-8')
+        elif formato == 'csv':
+            respuesta = StreamingHttpResponse(exportar_csv(self.get_queryset()), content_type='text/csv; charset=utf-8')
+        else:
+            return Response({"error": "El formato debe ser 'ndjson' o 'csv'"}, status=status.HTTP_400_BAD_REQUEST)
+        respuesta['Content-Disposition'] = f'attachment; filename="catalogo.{formato}"'
+        return respuesta
 
 
     def list(self, request, *args, **kwargs):
@@ -121,13 +188,19 @@ class CompletoViewSet(viewsets.ModelViewSet):
 
 
 
-class EdicionesViewSet(viewsets.ModelViewSet):
+class EdicionesViewSet(BulkMixin, FacetasMixin, CronologiaMixin, CondicionalMixin, CacheRespuestaMixin, CamposMixin, LecturaRapidaMixin, viewsets.ModelViewSet):
     queryset = Ediciones.objects.all()
     permission_classes = [IsAdminOrReadOnly, IsAuthenticated]
     serializer_class = EdicionCompletaSerializer
 
+    bulk_serializer_class = EdicionesBulkSerializer
+    bulk_relaciones = {'muneca': Personajes}
+    pagination_class = CatalogoPagination
+
     filter_backends = [filters.SearchFilter, OrderingFilter]
     ordering_fields = '__all__'
+    cursor_ordering_fields = ('fecha_subida', 'serie', 'id')
+    campos_facetas = {'generacion': 'generacion', 'serie': 'serie'}
     search_fields = ('serie', 'generacion', 'lanzamiento', 'precio', 'ordering')
 
     def update(self, request, pk=None):
@@ -210,6 +283,8 @@ class EdicionesViewSet(viewsets.ModelViewSet):
         lanzamiento = params.get('lanzamiento', None)
         if lanzamiento is not None:
             queryset = queryset.filter(lanzamiento__icontains=lanzamiento)
+        # Rango sobre la fecha indexada (?lanzamiento_desde=2010-07&lanzamiento_hasta=2012)
+        queryset = filtrar_lanzamiento(queryset, params)
         precio = params.get('precio', None)
         if precio is not None:
             queryset = queryset.filter(precio__icontains=precio)
@@ -253,27 +328,31 @@ class EdicionesViewSet(viewsets.ModelViewSet):
 
 
 
-class SkullectorViewSet(viewsets.ModelViewSet):
+class SkullectorViewSet(BulkMixin, FacetasMixin, CronologiaMixin, CondicionalMixin, CacheRespuestaMixin, CamposMixin, LecturaRapidaMixin, viewsets.ModelViewSet):
     queryset = Skullectors.objects.all()
     permission_classes = [IsAdminOrReadOnly, IsAuthenticated]
     serializer_class = SkullectorCompletaSerializer
 
 
+    bulk_serializer_class = SkullectorsBulkSerializer
+    bulk_clave_natural = CLAVES_NATURALES[Skullectors]
+    bulk_relaciones = {'muneca': Personajes}
+    pagination_class = CatalogoPagination
+
     filter_backends = [filters.SearchFilter, OrderingFilter]
     ordering_fields = '__all__'
+    cursor_ordering_fields = ('fecha_subida', 'serie', 'id')
+    campos_facetas = {'limitada': 'limitada', 'certificado': 'certificado'}
     search_fields = ('serie', 'descripcion', 'lanzamiento', 'edicionLimitada', 'inspiracion', 'certificado', 'precioOriginal', 'precioMercado', 'ordering')
     def create(self, request, *args, **kwargs):
         try:
-            serie = request.data.get("serie")
-            descripcion = request.data.get("descripcion")
-            fechaLanzamiento = request.data.get("lanzamiento")
-            foto = request.data.get("foto")
-            if (Skullectors.objects.filter(serie=serie, descripcion=descripcion, lanzamiento=fechaLanzamiento).exists()):
-                return Response({"error":"Esta skullector ya existe"}, status=status.HTTP_409_CONFLICT)
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Sin exists() previo: el duplicado lo detecta la restricción única (serie, descripcion, lanzamiento)
+            serializer, creado = guardar_unico(serializer, pide_upsert(request))
+            if serializer is None:
+                return Response({"error":"Esta skullector ya existe"}, status=status.HTTP_409_CONFLICT)
+            return Response(serializer.data, status=status.HTTP_201_CREATED if creado else status.HTTP_200_OK)
         except ValidationError as e:
             return Response(
                 {"error": "Datos inválidos", "detalles": e.detail},  
@@ -296,21 +375,27 @@ class SkullectorViewSet(viewsets.ModelViewSet):
     
     def update(self, request, pk=None):
         try:
-            personaje = get_object_or_404(Personajes, id=pk)
-            serializer = self.get_serializer(personaje, data=request.data)
+            skullector = get_object_or_404(Skullectors, id=pk)
+            serializer = self.get_serializer(skullector, data=request.data)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            if not guardar_cambios(serializer):
+                return Response({"error": "Esta skullector ya existe"}, status=status.HTTP_409_CONFLICT)
             return Response(serializer.data, status=status.HTTP_200_OK)
+        except serializers.ValidationError as e:
+            return Response({"error": "Datos inválidos", "detalles": e.detail}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": f"Ocurrió un error inesperado: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def partial_update(self, request, pk=None):
         try:
-            personaje = get_object_or_404(Personajes, id=pk)
-            serializer = self.get_serializer(personaje, data=request.data, partial=True)
+            skullector = get_object_or_404(Skullectors, id=pk)
+            serializer = self.get_serializer(skullector, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            if not guardar_cambios(serializer):
+                return Response({"error": "Esta skullector ya existe"}, status=status.HTTP_409_CONFLICT)
             return Response(serializer.data, status=status.HTTP_200_OK)
+        except serializers.ValidationError as e:
+            return Response({"error": "Datos inválidos", "detalles": e.detail}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": f"Ocurrió un error inesperado: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -330,6 +415,24 @@ class SkullectorViewSet(viewsets.ModelViewSet):
     def perform_destroy(self, instance):
         instance.delete()
 
+    #Evolución del precio de mercado de una skullector, desde los resúmenes: ?periodo=dia|mes&desde=&hasta=
+    @action(detail=True, methods=['get'], url_path='precios')
+    def precios(self, request, pk=None):
+        skullector = get_object_or_404(Skullectors, id=pk)
+        try:
+            resumenes = filtrar_resumenes(ResumenPrecio.objects.filter(skullector=skullector), request.query_params)
+        except ValidationError as e:
+            return Response({"error": "Error de validación en los filtros", "detalles": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ResumenPrecioSerializer(resumenes, many=True).data)
+
+    #Tendencia de precios de todas las skullectors del listado (mismos filtros) por día o mes
+    @action(detail=False, methods=['get'], url_path='tendencias')
+    def tendencias(self, request):
+        def calcular():
+            resumenes = filtrar_resumenes(ResumenPrecio.objects.filter(skullector__in=self.base_agregados()), request.query_params)
+            return TendenciaPrecioSerializer(tendencia_precios(resumenes), many=True).data
+        return self.agregado_cacheado(request, 'tendencias', calcular, modelos=[ResumenPrecio])
+
 
 
     def get_queryset(self):
@@ -348,6 +451,8 @@ class SkullectorViewSet(viewsets.ModelViewSet):
         lanzamiento = params.get('lanzamiento', None)
         if lanzamiento is not None:
             queryset = queryset.filter(lanzamiento__icontains=lanzamiento)
+        # Rango sobre la fecha indexada (?lanzamiento_desde=2010-07&lanzamiento_hasta=2012)
+        queryset = filtrar_lanzamiento(queryset, params)
 
         edicionLimitada = params.get('edicionLimitada', None)
         if edicionLimitada is not None:
@@ -364,6 +469,8 @@ class SkullectorViewSet(viewsets.ModelViewSet):
         precioMercado = params.get('precioMercado', None)
         if precioMercado is not None:
             queryset = queryset.filter(precioMercado__icontains=precioMercado)
+        # Rango numérico sobre el precio de mercado actual (?precio_min=50&precio_max=120)
+        queryset = filtrar_precio(queryset, params)
 
         inspiracion = params.get('inspiracion', None)
         if inspiracion is not None:
@@ -409,49 +516,50 @@ class SkullectorViewSet(viewsets.ModelViewSet):
 
 
 
-class PersonajesViewSet(viewsets.ModelViewSet):
+class PersonajesViewSet(BulkMixin, FacetasMixin, CronologiaMixin, CondicionalMixin, CacheRespuestaMixin, CamposMixin, LecturaRapidaMixin, viewsets.ModelViewSet):
     queryset = Personajes.objects.all()
     permission_classes = [IsAdminOrReadOnly, IsAuthenticated]
     serializer_class = PersonajesSerializer
 
+    bulk_serializer_class = PersonajesBulkSerializer
+    bulk_clave_natural = CLAVES_NATURALES[Personajes]
+    pagination_class = CatalogoPagination
+
     filter_backends = [filters.SearchFilter, OrderingFilter]
     ordering_fields = '__all__'
+    cursor_ordering_fields = ('fecha_subida', 'nombre', 'id')
+    campos_facetas = {
+        'generacion': 'ediciones__generacion',
+        'monstruo': 'monstruo',
+        'sexo': 'sexo',
+        'limitada': 'skullectors__limitada',
+        'certificado': 'skullectors__certificado',
+        'tipoMascota': 'mascota__tipo',
+    }
     search_fields = ('nombre', 'monstruo', 'ciudad', 'edad', 'lanzamiento', 'fechaCumpleanios', 'frase', 'colorFav', 'sexo', 'ordering')
 
     def create(self, request, *args, **kwargs):
         try:
-            nombre = request.data.get("nombre")
-            tipo = request.data.get("monstruo")
-            fecha_lanzamiento = request.data.get("lanzamiento")
-            edad = request.data.get("edad")
             mascota_id = request.data.get("mascota")
             ediciones_ids = request.data.get("ediciones", [])
-            foto = request.data.get("foto")
-            frase = request.data.get("frase")
-            color_fav = request.data.get("colorFav")
-            sexo = request.data.get("sexo", "Femenino")
-
-            if Personajes.objects.filter(
-                nombre=nombre,
-                monstruo=tipo,
-                lanzamiento=fecha_lanzamiento,
-                edad=edad,
-                sexo=sexo
-            ).exists():
+
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            # Insertar o conflicto: la restricción única de la clave natural decide si ya existe
+            serializer, creado = guardar_unico(serializer, pide_upsert(request))
+            if serializer is None:
                 return Response(
                     {"error": "Este personaje ya existe"},
                     status=status.HTTP_409_CONFLICT
                 )
-            serializer = self.get_serializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            personaje = serializer.save()
+            personaje = serializer.instance
             if mascota_id:
                 personaje.mascota_id = mascota_id
                 personaje.save()
             if ediciones_ids:
                 personaje.ediciones.set(ediciones_ids)
 
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(serializer.data, status=status.HTTP_201_CREATED if creado else status.HTTP_200_OK)
 
         except ValidationError as e:
             return Response(
@@ -474,8 +582,11 @@ class PersonajesViewSet(viewsets.ModelViewSet):
             personaje = get_object_or_404(Personajes, id=pk)
             serializer = self.get_serializer(personaje, data=request.data)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            if not guardar_cambios(serializer):
+                return Response({"error": "Este personaje ya existe"}, status=status.HTTP_409_CONFLICT)
             return Response(serializer.data, status=status.HTTP_200_OK)
+        except serializers.ValidationError as e:
+            return Response({"error": "Datos inválidos", "detalles": e.detail}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": f"Ocurrió un error inesperado: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -484,8 +595,11 @@ class PersonajesViewSet(viewsets.ModelViewSet):
             personaje = get_object_or_404(Personajes, id=pk)
             serializer = self.get_serializer(personaje, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            if not guardar_cambios(serializer):
+                return Response({"error": "Este personaje ya existe"}, status=status.HTTP_409_CONFLICT)
             return Response(serializer.data, status=status.HTTP_200_OK)
+        except serializers.ValidationError as e:
+            return Response({"error": "Datos inválidos", "detalles": e.detail}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": f"Ocurrió un error inesperado: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -532,6 +646,8 @@ class PersonajesViewSet(viewsets.ModelViewSet):
         lanzamiento = params.get('lanzamiento', None)
         if lanzamiento is not None:
             queryset = queryset.filter(lanzamiento__icontains=lanzamiento)
+        # Rango sobre la fecha indexada (?lanzamiento_desde=2010-07&lanzamiento_hasta=2012)
+        queryset = filtrar_lanzamiento(queryset, params)
 
         fechaCumpleanios = params.get('cumpleanios', None)
         if fechaCumpleanios is not None:
@@ -549,6 +665,10 @@ class PersonajesViewSet(viewsets.ModelViewSet):
         if sexo is not None:
             queryset = queryset.filter(sexo=sexo)
 
+        q = params.get('q', None)
+        if q:
+            queryset = buscar_personajes(queryset, q)
+
         ordering = params.get('ordering', None)
         if ordering:
             queryset = queryset.order_by(*ordering.split(','))
@@ -587,13 +707,20 @@ class PersonajesViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class MascotasViewSet(viewsets.ModelViewSet):
+class MascotasViewSet(BulkMixin, FacetasMixin, CondicionalMixin, CacheRespuestaMixin, CamposMixin, LecturaRapidaMixin, viewsets.ModelViewSet):
     queryset = Mascotas.objects.all()
     permission_classes = [IsAdminOrReadOnly, IsAuthenticated]
     serializer_class = MascotasCompletaSerializer
 
+    bulk_serializer_class = MascotasBulkSerializer
+    bulk_clave_natural = CLAVES_NATURALES[Mascotas]
+    bulk_relaciones = {'duenio': Personajes}
+    pagination_class = CatalogoPagination
+
     filter_backends = [filters.SearchFilter, OrderingFilter]
     ordering_fields = '__all__'
+    cursor_ordering_fields = ('fecha_subida', 'nombre', 'id')
+    campos_facetas = {'tipo': 'tipo'}
     search_fields = ('nombre', 'tipo', 'ordering')
 
     def get_queryset(self):
@@ -649,26 +776,40 @@ class MascotasViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         try:
             # fields = ('Id', 'Nombre', 'Tipo', 'Foto')
-            nombre = request.data.get("nombre")
-            tipo = request.data.get("tipo")
-            if (Mascotas.objects.filter(nombre=nombre, tipo=tipo).exists()):
-                return Response({"error":"Esta mascota ya existe"}, status=status.HTTP_409_CONFLICT)
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        except ValidationError as e:
+            serializer, creado = guardar_unico(serializer, pide_upsert(request))
+            if serializer is None:
+                return Response({"error":"Esta mascota ya existe"}, status=status.HTTP_409_CONFLICT)
+            return Response(serializer.data, status=status.HTTP_201_CREATED if creado else status.HTTP_200_OK)
+        except serializers.ValidationError as e:
             return Response({"error": "Datos inválidos", "detalles": e.detail}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": "Error inesperado"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    def update(self, request, pk=None):
+        try:
+            mascota = get_object_or_404(Mascotas, id=pk)
+            serializer = self.get_serializer(mascota, data=request.data)
+            serializer.is_valid(raise_exception=True)
+            if not guardar_cambios(serializer):
+                return Response({"error": "Esta mascota ya existe"}, status=status.HTTP_409_CONFLICT)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        except serializers.ValidationError as e:
+            return Response({"error": "Datos inválidos", "detalles": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({"error": f"Ocurrió un error inesperado: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     def partial_update(self, request, pk=None):
         try:
-            mascotas = get_object_or_404(Mascotas, Id=pk)
+            mascotas = get_object_or_404(Mascotas, id=pk)
             serializer = self.get_serializer(mascotas, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            if not guardar_cambios(serializer):
+                return Response({"error": "Esta mascota ya existe"}, status=status.HTTP_409_CONFLICT)
             return Response(serializer.data, status=status.HTTP_200_OK)
+        except serializers.ValidationError as e:
+            return Response({"error": "Datos inválidos", "detalles": e.detail}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": f"Ocurrió un error inesperado: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -686,23 +827,30 @@ class MascotasViewSet(viewsets.ModelViewSet):
         instance.delete()
 
 
-class RegisterView(APIView):
-    permission_classes = [permissions.AllowAny]
-
-    def post(self, request):
-        serializer = RegisterSerializer(data=request.data)
-        if serializer.is_valid():
-            return Response(serializer.save(), status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+# Registro y login son vistas async (asincrono.py): el PBKDF2 se calcula en el pool de hashing.py y la
+# vista lo espera sin bloquear el worker; la base de datos se usa desde el hilo de la petición
+class RegisterView(VistaAsincrona):
+    async def post(self, request):
+        serializer = RegisterSerializer(data=await sync_to_async(self.datos)(request))
+        if not await sync_to_async(serializer.is_valid)():
+            return self.respuesta(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        password_cifrada = await pool_hashing.aejecutar(make_password, serializer.validated_data['password'])
+        resultado = await sync_to_async(serializer.save)(password_cifrada=password_cifrada)
+        return self.respuesta(resultado, status.HTTP_201_CREATED)
 
 #Sirve para iniciar sesión con un usuario y que le cree los token válidos
-class LoginView(APIView):
-    permission_classes = [permissions.AllowAny]
-
-    def post(self, request):
-        serializer = LoginSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        return Response(serializer.validated_data)
+class LoginView(VistaAsincrona):
+    async def post(self, request):
+        serializer = LoginSerializer(data=await sync_to_async(self.datos)(request))
+        # Solo el formato de los campos; la comprobación de la contraseña va al pool
+        try:
+            credenciales = serializer.to_internal_value(serializer.initial_data)
+        except serializers.ValidationError as e:
+            return self.respuesta(e.detail, status.HTTP_400_BAD_REQUEST)
+        user = await ModelBackendPool().aautenticar(credenciales['email'], credenciales['password'], request)
+        if user is None:
+            return self.respuesta({"non_field_errors": ["Credenciales incorrectas"]}, status.HTTP_400_BAD_REQUEST)
+        return self.respuesta(await sync_to_async(respuesta_login)(user))
 
 #Se utiliza para cerrar la sesion de un usuario e invalidar los token que tiene activos
 class LogoutView(APIView):
@@ -716,6 +864,13 @@ class LogoutView(APIView):
         except Exception:
             return Response({"error": "Token inválido o ya expirado"}, status=400)
 
+#Aciertos y fallos de la caché de respuestas del catálogo
+class CacheEstadisticasView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(estadisticas())
+
 class UsuarioViewSet(viewsets.ModelViewSet):
     queryset = Usuario.objects.all()
     serializer_class = UserSerializer
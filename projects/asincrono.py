@@ -0,0 +1,205 @@
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .cache import clave_respuesta, contar
+from .hashing import Saturado
+from .lectura import aleer, plan_lectura
+from .renderers import OrjsonRenderer
+
+
+# Segundos que se piden al cliente antes de reintentar cuando el pool de hashing está lleno
+REINTENTAR_EN = 1
+
+
+class VistaAsincrona(View):
+    # Vista async de Django para los endpoints que esperan a algo fuera del hilo de la petición (el pool de
+    # hashing.py): las APIView de DRF son síncronas. Lee el cuerpo con los parsers de DRF (JSON, msgpack,
+    # formularios) y contesta siempre en JSON. Bajo ASGI (backendMattel/asgi.py) la espera no ocupa ningún
+    # worker; bajo WSGI Django la ejecuta en su propio bucle y se comporta como una vista normal
+    http_method_names = ['post', 'options']
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Sin sesión ni cookies, como las APIView de DRF: no hace falta el token CSRF
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except Saturado:
+            respuesta = self.respuesta(
+                {"error": "Servidor ocupado, inténtalo de nuevo en unos segundos"},
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+            respuesta['Retry-After'] = str(REINTENTAR_EN)
+            return respuesta
+        except exceptions.APIException as e:
+            respuesta = self.respuesta({"detail": e.detail}, e.status_code)
+            if isinstance(e, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                respuesta['WWW-Authenticate'] = 'Bearer realm="api"'
+            return respuesta
+
+    def datos(self, request):
+        # Los ficheros de un multipart ya están en memoria o en disco: se puede leer sin salir del bucle
+        peticion = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+        return peticion.data
+
+    def respuesta(self, datos, estado=status.HTTP_200_OK):
+        return HttpResponse(OrjsonRenderer().render(datos), status=estado, content_type='application/json')
+
+
+# Conexiones de los hilos del pool de asgiref, una por hilo y base de datos (ver _leer_en_hilo)
+_hilo = threading.local()
+
+
+def _conexion_del_hilo(alias):
+    conexiones = _hilo.__dict__.setdefault('conexiones', {})
+    if alias not in conexiones:
+        conexiones[alias] = connections.create_connection(alias)
+    return conexiones[alias]
+
+
+def _leer_en_hilo(queryset):
+    # Hilo del pool de asgiref con su propia conexión, que se guarda para las siguientes consultas del mismo
+    # hilo. Como al principio y al final de cada petición, se cierra si está rota o ha pasado CONN_MAX_AGE
+    # (con 0, después de cada consulta)
+    alias = queryset.db
+    conexion = _conexion_del_hilo(alias)
+    conexion.close_if_unusable_or_obsolete()
+    anterior = next((c for c in connections.all(initialized_only=True) if c.alias == alias), None)
+    connections[alias] = conexion
+    try:
+        return list(queryset)
+    finally:
+        # La del contexto de la petición no puede quedarse con la de este hilo
+        if anterior is not None:
+            connections[alias] = anterior
+        else:
+            del connections[alias]
+        conexion.close_if_unusable_or_obsolete()
+
+
+def paralelo(alias):
+    # CATALOGO_ASYNC_PARALELO a None decide según la base de datos: en paralelo salvo con SQLite (un solo
+    # fichero que escribe una conexión a la vez y, en memoria, una base que no ven las demás) o si la
+    # petición está dentro de una transacción, cuyos cambios sin confirmar no verían las otras conexiones
+    modo = getattr(settings, 'CATALOGO_ASYNC_PARALELO', None)
+    if modo is not None:
+        return modo
+    if settings.DATABASES[alias]['ENGINE'].endswith('sqlite3'):
+        return False
+    return not any(c.alias == alias and c.in_atomic_block for c in connections.all(initialized_only=True))
+
+
+async def leer(queryset):
+    # En paralelo cada consulta va a un hilo y una conexión propios y las del gather corren de verdad a la
+    # vez; si no, el ORM async de Django las pasa una a una por el hilo de la petición
+    if paralelo(queryset.db):
+        return await sync_to_async(_leer_en_hilo, thread_sensitive=False)(queryset)
+    return await aleer(queryset)
+
+
+class LecturaAsincrona(VistaAsincrona):
+    # GET asincrono/<recurso>/ y asincrono/<recurso>/<pk>/: list y retrieve del viewset con el ORM async. La
+    # autenticación, los permisos, los filtros, ?fields=/?expand= y la paginación son los del viewset (se
+    # instancia sin ejecutar nada en la base de datos); las consultas se hacen con await y las relaciones
+    # del plan de lectura.py se cargan a la vez. Usa la caché de respuestas como el endpoint síncrono
+    http_method_names = ['get', 'head', 'options']
+    viewset = None
+    basename = None
+
+    async def get(self, request, pk=None):
+        accion = 'list' if pk is None else 'retrieve'
+        try:
+            vista, peticion, queryset = await sync_to_async(self.preparar)(request, accion, pk)
+        except ValidationError as e:
+            return self.respuesta({"error": "Error de validación en los datos enviados", "detalles": str(e)}, 400)
+
+        activa = getattr(settings, 'CATALOGO_CACHE_ACTIVA', True)
+        if activa:
+            # Entradas propias: los enlaces de la paginación apuntan a asincrono/
+            clave = f'{clave_respuesta(vista, peticion)}:asincrono'
+            datos = await cache.aget(clave)
+            if datos is not None:
+                await sync_to_async(contar)('aciertos')
+                respuesta = self.respuesta(datos)
+                respuesta['X-Cache'] = 'HIT'
+                return respuesta
+
+        try:
+            datos = await (self.listar(vista, peticion, queryset) if pk is None else self.detalle(vista, queryset, pk))
+        except ValidationError as e:
+            return self.respuesta({"error": "Error de validación en los datos enviados", "detalles": str(e)}, 400)
+        except ObjectDoesNotExist:
+            return self.respuesta({"error": "El recurso solicitado no existe"}, 404)
+
+        respuesta = self.respuesta(datos)
+        if activa:
+            await sync_to_async(contar)('fallos')
+            await cache.aset(clave, datos, getattr(settings, 'CATALOGO_CACHE_TIMEOUT', 300))
+            respuesta['X-Cache'] = 'MISS'
+        return respuesta
+
+    def preparar(self, request, accion, pk):
+        # Lo síncrono y sin consultas (salvo la autenticación, normalmente en caché): el viewset como lo
+        # montaría el router, sus comprobaciones y el queryset filtrado todavía sin ejecutar
+        vista = self.viewset(basename=self.basename, action_map={'get': accion}, detail=pk is not None)
+        vista.args, vista.kwargs = (), ({} if pk is None else {vista.lookup_field: pk})
+        vista.format_kwarg = None
+        vista.headers = {}
+        peticion = vista.initialize_request(request)
+        vista.request = peticion
+        vista.initial(peticion)
+        return vista, peticion, vista.filter_queryset(vista.get_queryset())
+
+    def convertir(self, vista, queryset):
+        # Con plan de lectura: filas de .values() armadas por el plan. Si el serializador no lo admite
+        # (p.ej. los documentos de /todos/), objetos serializados con el serializador del viewset
+        seleccion = vista.seleccion() if hasattr(vista, 'seleccion') else None
+        plan = plan_lectura(vista.get_serializer_class(), seleccion)
+        if plan is None or not getattr(settings, 'CATALOGO_LECTURA_RAPIDA', True):
+            async def serializar(objetos):
+                return await sync_to_async(lambda: vista.get_serializer(objetos, many=True).data)()
+            return queryset, serializar
+
+        queryset = queryset.prefetch_related(None).select_related(None).defer(None)
+        columnas = plan.columnas | set(getattr(vista, 'cursor_ordering_fields', ()))
+
+        async def armar(filas):
+            return await plan.aconstruir(filas, queryset.db, leer)
+        return queryset.values(*columnas), armar
+
+    async def listar(self, vista, peticion, queryset):
+        queryset, armar = self.convertir(vista, queryset)
+        paginator = vista.paginator
+        if paginator is None:
+            filas = None
+        elif hasattr(paginator, 'apaginar'):
+            filas = await paginator.apaginar(queryset, peticion, vista, leer)
+        else:
+            filas = await sync_to_async(paginator.paginate_queryset)(queryset, peticion, vista)
+        if filas is None:
+            return await armar(await leer(queryset))
+        return paginator.get_paginated_response(await armar(filas)).data
+
+    async def detalle(self, vista, queryset, pk):
+        queryset, armar = self.convertir(vista, queryset)
+        try:
+            filas = await leer(queryset.filter(**{vista.lookup_field: pk})[:1])
+        except (TypeError, ValueError, ValidationError):
+            raise exceptions.NotFound()
+        if not filas:
+            raise exceptions.NotFound(f"No {queryset.model._meta.object_name} matches the given query.")
+        return (await armar(filas))[0]
@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import PREFIJO
+from .hashing import comprobar_contrasenia, pool_hashing
+
+
+def clave_usuario(user_id):
+    return f'{PREFIJO}:usuario:{user_id}'
+
+
+def olvidar_usuario(user_id):
+    # Como invalidar() en cache.py: se borra ya y otra vez al confirmar, por si otra petición ha vuelto
+    # a cachear la fila anterior mientras la transacción seguía abierta
+    clave = clave_usuario(user_id)
+    cache.delete(clave)
+    transaction.on_commit(lambda: cache.delete(clave))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    # JWTAuthentication sin la consulta del usuario en cada petición: el Usuario resuelto se guarda en la
+    # caché por user_id durante JWT_CACHE_USUARIO_TIMEOUT segundos. Las señales de Usuario (guardar,
+    # desactivar, cambiar la contraseña, borrar) quitan la entrada; el TTL cubre los update() sin señales
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        timeout = getattr(settings, 'JWT_CACHE_USUARIO_TIMEOUT', 60)
+        if not timeout:
+            return super().get_user(validated_token)
+
+        clave = clave_usuario(user_id)
+        user = cache.get(clave)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(clave, user, timeout)
+            return user
+
+        # Las mismas comprobaciones que JWTAuthentication, sobre la copia cacheada
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+class ModelBackendPool(ModelBackend):
+    # Solo para las vistas async de login y registro: los PBKDF2 van al pool de hashing.py y, si está lleno,
+    # sale Saturado, que VistaAsincrona convierte en un 503. En AUTHENTICATION_BACKENDS sigue el ModelBackend
+    # de Django, así que el admin y cualquier authenticate() síncrono no dependen del pool
+
+    async def aautenticar(self, username, password, request=None):
+        UserModel = get_user_model()
+        try:
+            user = await UserModel._default_manager.aget(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            # Un hash igualmente, para que no se note por el tiempo si el usuario existe
+            await pool_hashing.aejecutar(make_password, password)
+            user = None
+        else:
+            correcta, actualizar = await pool_hashing.aejecutar(comprobar_contrasenia, password, user.password)
+            if not correcta or not self.user_can_authenticate(user):
+                user = None
+            elif actualizar:
+                user.password = await pool_hashing.aejecutar(make_password, password)
+                await user.asave(update_fields=['password'])
+        if user is None:
+            # La misma señal que authenticate() de Django (sender y credenciales sin la contraseña)
+            await user_login_failed.asend(
+                sender='django.contrib.auth',
+                credentials={'username': username, 'password': '********************'},
+                request=request,
+            )
+        return user
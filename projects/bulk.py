@@ -0,0 +1,273 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .cache import invalidar
+from .documentos import personajes_afectados, reconstruir_documentos
+from .models import Personajes, Mascotas, Skullectors
+from .precios import sincronizar_precios
+from .search import indexar_personajes
+
+
+# Clave natural de cada modelo: la que garantizan sus UniqueConstraint y usan create(), los endpoints
+# /bulk/ e importar_catalogo
+CLAVES_NATURALES = {
+    Personajes: ('nombre', 'monstruo', 'lanzamiento', 'edad', 'sexo'),
+    Mascotas: ('nombre', 'tipo', 'duenio_id'),
+    Skullectors: ('serie', 'descripcion', 'lanzamiento'),
+}
+
+# ?upsert=true en create(): si el registro ya existe se actualiza en lugar de devolver 409
+UPSERT_PARAM = 'upsert'
+
+
+def pide_upsert(request):
+    return request.query_params.get(UPSERT_PARAM, '').lower() in ('1', 'true', 'si', 'sí')
+
+
+def buscar_por_clave(modelo, datos):
+    # Registro con la misma clave natural que `datos` (validated_data: lo que falta toma el default del modelo)
+    filtro = {}
+    for campo in CLAVES_NATURALES[modelo]:
+        filtro[campo] = datos[campo] if campo in datos else modelo._meta.get_field(campo).get_default()
+    return modelo.objects.filter(**filtro).first()
+
+
+def guardar_unico(serializer, upsert=False):
+    # Inserta sin comprobar antes si existe: decide la restricción única de la clave natural, así que dos
+    # peticiones a la vez no pueden colar un duplicado. Devuelve (serializador guardado, creado); el
+    # serializador es None si el registro ya existía y no se pidió upsert
+    modelo = serializer.Meta.model
+    try:
+        with transaction.atomic():
+            serializer.save()
+        return serializer, True
+    except IntegrityError:
+        existente = buscar_por_clave(modelo, serializer.validated_data)
+        if existente is None:
+            # Ha saltado otra restricción (chk_sexo...), no la de la clave natural
+            raise
+    if not upsert:
+        return None, False
+    actualizado = type(serializer)(existente, data=serializer.initial_data, context=serializer.context)
+    actualizado.is_valid(raise_exception=True)
+    with transaction.atomic():
+        actualizado.save()
+    return actualizado, False
+
+
+def guardar_cambios(serializer):
+    # update/partial_update: como en guardar_unico, la clave natural la vigila la restricción única, no un
+    # exists() previo. Devuelve False si los cambios dejan el registro con la clave de otro que ya existe
+    try:
+        with transaction.atomic():
+            serializer.save()
+        return True
+    except IntegrityError:
+        instancia = serializer.instance
+        modelo = type(instancia)
+        if modelo not in CLAVES_NATURALES:
+            raise
+        # serializer.update() ya ha puesto los valores nuevos en la instancia antes de fallar el UPDATE
+        datos = {campo: getattr(instancia, campo) for campo in CLAVES_NATURALES[modelo]}
+        existente = buscar_por_clave(modelo, datos)
+        if existente is None or existente.pk == instancia.pk:
+            raise
+        return False
+
+
+def preparar(objetos):
+    # Lo que haría save(): bulk_create/bulk_update no lo llaman
+    for objeto in objetos:
+        if hasattr(objeto, 'actualizar_campos_derivados'):
+            objeto.actualizar_campos_derivados()
+
+
+def despues_de_escribir(modelo, ids, using='default', afectados=()):
+    # Lo que harían las señales post_save, que bulk_create/bulk_update tampoco disparan.
+    # afectados: personajes a los que pertenecían las filas antes de escribir (por si cambian de dueño)
+    if modelo is Personajes:
+        indexar_personajes(ids, using=using)
+    if modelo is Skullectors:
+        sincronizar_precios(ids, using=using)
+    reconstruir_documentos(set(afectados) | personajes_afectados(modelo, ids, using=using), using=using)
+    invalidar(modelo)
+
+
+class BulkMixin:
+    # POST/PATCH/DELETE <recurso>/bulk/ con una lista de registros: se validan en una pasada, se escriben en
+    # una sola transacción con bulk_create/bulk_update y se devuelve el resultado de cada elemento
+    bulk_serializer_class = None
+    # Campos que identifican un duplicado (los mismos que comprueba create()), vacío si no hay
+    bulk_clave_natural = ()
+    # FK que llegan como id: nombre del campo -> modelo al que apuntan
+    bulk_relaciones = {}
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request):
+        filas = request.data
+        if not isinstance(filas, list):
+            return Response({"error": "Se esperaba una lista de registros"}, status=status.HTTP_400_BAD_REQUEST)
+        maximo = getattr(settings, 'CATALOGO_BULK_MAX', 1000)
+        if len(filas) > maximo:
+            return Response({"error": f"Como máximo se admiten {maximo} registros por petición"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if request.method == 'POST':
+                return self.bulk_crear(filas)
+            if request.method == 'PATCH':
+                return self.bulk_actualizar(filas)
+            return self.bulk_borrar(filas)
+        except IntegrityError as e:
+            # Nada se ha escrito: la transacción entera se deshace
+            return Response({"error": "Conflicto al guardar los registros", "detalles": str(e)}, status=status.HTTP_409_CONFLICT)
+
+    def bulk_crear(self, filas):
+        modelo = self.queryset.model
+        resultados = [None] * len(filas)
+        validos = self._validar(filas, resultados, parcial=False)
+        validos = self._comprobar_relaciones(validos, resultados)
+        validos = self._descartar_duplicados(validos, resultados)
+
+        objetos = []
+        for indice, datos in validos:
+            datos.pop('id', None)
+            objetos.append(modelo(**datos))
+        if objetos:
+            preparar(objetos)
+            with transaction.atomic():
+                modelo.objects.bulk_create(objetos, batch_size=500)
+                despues_de_escribir(modelo, [objeto.pk for objeto in objetos])
+
+        for (indice, datos), objeto in zip(validos, objetos):
+            resultados[indice] = {'indice': indice, 'estado': status.HTTP_201_CREATED, 'id': objeto.pk}
+        return self._respuesta(resultados, status.HTTP_201_CREATED)
+
+    def bulk_actualizar(self, filas):
+        modelo = self.queryset.model
+        resultados = [None] * len(filas)
+        validos = []
+        for indice, datos in self._validar(filas, resultados, parcial=True):
+            if datos.get('id') is None:
+                resultados[indice] = {'indice': indice, 'estado': status.HTTP_400_BAD_REQUEST, 'errores': {'id': ['Este campo es obligatorio.']}}
+            else:
+                validos.append((indice, datos))
+        validos = self._comprobar_relaciones(validos, resultados)
+
+        existentes = modelo.objects.in_bulk([datos['id'] for _, datos in validos])
+        ahora = timezone.now()
+        campos = set()
+        actualizados = []
+        for indice, datos in validos:
+            objeto = existentes.get(datos['id'])
+            if objeto is None:
+                resultados[indice] = {'indice': indice, 'estado': status.HTTP_404_NOT_FOUND, 'error': "El registro no existe"}
+                continue
+            for campo, valor in datos.items():
+                if campo != 'id':
+                    setattr(objeto, campo, valor)
+                    campos.add(campo)
+            objeto.fecha_actualizacion = ahora
+            actualizados.append((indice, objeto))
+
+        objetos = list({objeto.pk: objeto for _, objeto in actualizados}.values())
+        if objetos and campos:
+            preparar(objetos)
+            campos.update(getattr(modelo, 'CAMPOS_DERIVADOS', ()))
+            campos.add('fecha_actualizacion')
+            ids = [objeto.pk for objeto in objetos]
+            with transaction.atomic():
+                afectados = personajes_afectados(modelo, ids)
+                modelo.objects.bulk_update(objetos, sorted(campos), batch_size=500)
+                despues_de_escribir(modelo, ids, afectados=afectados)
+
+        for indice, objeto in actualizados:
+            resultados[indice] = {'indice': indice, 'estado': status.HTTP_200_OK, 'id': objeto.pk}
+        return self._respuesta(resultados, status.HTTP_200_OK)
+
+    def bulk_borrar(self, filas):
+        modelo = self.queryset.model
+        resultados = [None] * len(filas)
+        ids = []
+        for indice, fila in enumerate(filas):
+            pk = fila.get('id') if isinstance(fila, dict) else fila
+            if isinstance(pk, bool) or not isinstance(pk, int):
+                resultados[indice] = {'indice': indice, 'estado': status.HTTP_400_BAD_REQUEST, 'errores': {'id': ['Se esperaba un id numérico.']}}
+            else:
+                ids.append((indice, pk))
+
+        existentes = set(modelo.objects.filter(pk__in=[pk for _, pk in ids]).values_list('pk', flat=True))
+        if existentes:
+            with transaction.atomic():
+                # delete() del queryset sí dispara post_delete (caché e índice de búsqueda se actualizan solos)
+                modelo.objects.filter(pk__in=existentes).delete()
+
+        for indice, pk in ids:
+            if pk in existentes:
+                resultados[indice] = {'indice': indice, 'estado': status.HTTP_204_NO_CONTENT, 'id': pk}
+            else:
+                resultados[indice] = {'indice': indice, 'estado': status.HTTP_404_NOT_FOUND, 'error': "El registro no existe"}
+        return self._respuesta(resultados, status.HTTP_200_OK)
+
+    def _validar(self, filas, resultados, parcial):
+        # Un único serializador para todas las filas: no se reconstruye el árbol de campos por registro
+        serializer = self.bulk_serializer_class(partial=parcial)
+        validos = []
+        for indice, fila in enumerate(filas):
+            try:
+                validos.append((indice, dict(serializer.run_validation(fila))))
+            except ValidationError as e:
+                resultados[indice] = {'indice': indice, 'estado': status.HTTP_400_BAD_REQUEST, 'errores': e.detail}
+        return validos
+
+    def _comprobar_relaciones(self, validos, resultados):
+        faltan = {}
+        for campo, relacionado in self.bulk_relaciones.items():
+            ids = {datos[f'{campo}_id'] for _, datos in validos if datos.get(f'{campo}_id') is not None}
+            existentes = set(relacionado.objects.filter(pk__in=ids).values_list('pk', flat=True))
+            faltan[campo] = ids - existentes
+
+        correctos = []
+        for indice, datos in validos:
+            errores = {
+                campo: [f"No existe el registro con id {datos[f'{campo}_id']}."]
+                for campo in self.bulk_relaciones if datos.get(f'{campo}_id') in faltan[campo]
+            }
+            if errores:
+                resultados[indice] = {'indice': indice, 'estado': status.HTTP_400_BAD_REQUEST, 'errores': errores}
+            else:
+                correctos.append((indice, datos))
+        return correctos
+
+    def _descartar_duplicados(self, validos, resultados):
+        if not self.bulk_clave_natural or not validos:
+            return validos
+        clave = self.bulk_clave_natural
+        modelo = self.queryset.model
+        # Una sola consulta: se filtra por el primer campo (indexado) y el resto se compara aquí
+        vistos = set(
+            modelo.objects.filter(**{f'{clave[0]}__in': {datos.get(clave[0]) for _, datos in validos}}).values_list(*clave)
+        )
+        nuevos = []
+        for indice, datos in validos:
+            valores = tuple(datos.get(campo) for campo in clave)
+            if valores in vistos:
+                resultados[indice] = {'indice': indice, 'estado': status.HTTP_409_CONFLICT, 'error': "Este registro ya existe"}
+            else:
+                vistos.add(valores)
+                nuevos.append((indice, datos))
+        return nuevos
+
+    def _respuesta(self, resultados, estado_ok):
+        errores = sum(1 for resultado in resultados if resultado['estado'] >= 400)
+        if not errores:
+            estado = estado_ok
+        elif errores < len(resultados):
+            estado = status.HTTP_207_MULTI_STATUS
+        else:
+            estado = status.HTTP_400_BAD_REQUEST
+        return Response({'resultados': resultados, 'correctos': len(resultados) - errores, 'errores': errores}, status=estado)
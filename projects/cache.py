@@ -0,0 +1,165 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from .middleware import comprimido_cacheado
+
+
+PREFIJO = 'catalogo'
+
+# Modelos que aparecen en la respuesta de cada endpoint (por basename del router), anidados incluidos:
+# si cambia cualquiera de ellos la respuesta cacheada deja de valer
+DEPENDENCIAS = {
+    'completo': ('personajes', 'mascotas', 'ediciones', 'skullectors', 'foto'),
+    'personajes': ('personajes', 'foto'),
+    'mascotas': ('mascotas', 'personajes', 'foto'),
+    'ediciones': ('ediciones', 'personajes', 'foto'),
+    'skullectors': ('skullectors', 'personajes', 'foto'),
+}
+
+
+def nombre_modelo(modelo):
+    return modelo if isinstance(modelo, str) else modelo._meta.model_name
+
+
+def clave_version(modelo):
+    return f'{PREFIJO}:version:{nombre_modelo(modelo)}'
+
+
+def versiones(modelos):
+    claves = [clave_version(modelo) for modelo in modelos]
+    encontradas = cache.get_many(claves)
+    faltan = [clave for clave in claves if clave not in encontradas]
+    if faltan:
+        # Si la versión se perdió (expulsada de la caché) arranca desde el reloj, nunca desde 0,
+        # para no resucitar entradas antiguas
+        for clave in faltan:
+            cache.add(clave, time.time_ns(), None)
+        encontradas.update(cache.get_many(faltan))
+    return [encontradas.get(clave, 0) for clave in claves]
+
+
+def _incrementar(modelos):
+    ahora = time.time()
+    for modelo in modelos:
+        clave = clave_version(modelo)
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.add(clave, time.time_ns(), None)
+        cache.set(f'{PREFIJO}:modificado:{nombre_modelo(modelo)}', ahora, None)
+
+
+def ultima_modificacion(modelos):
+    # Marca de tiempo de la última escritura conocida en cualquiera de los modelos (None si no hay)
+    datos = cache.get_many([f'{PREFIJO}:modificado:{nombre_modelo(modelo)}' for modelo in modelos])
+    return max(datos.values(), default=None)
+
+
+def invalidar(*modelos):
+    # Se sube la versión ya y otra vez al confirmar la transacción: así tampoco sirve lo que otra
+    # petición haya cacheado leyendo los datos anteriores mientras la transacción seguía abierta
+    _incrementar(modelos)
+    transaction.on_commit(lambda: _incrementar(modelos))
+
+
+def contar(nombre):
+    clave = f'{PREFIJO}:stats:{nombre}'
+    try:
+        cache.incr(clave)
+    except ValueError:
+        if not cache.add(clave, 1, None):
+            cache.incr(clave)
+
+
+def estadisticas():
+    datos = cache.get_many([f'{PREFIJO}:stats:aciertos', f'{PREFIJO}:stats:fallos'])
+    aciertos = datos.get(f'{PREFIJO}:stats:aciertos', 0)
+    fallos = datos.get(f'{PREFIJO}:stats:fallos', 0)
+    total = aciertos + fallos
+    return {
+        'aciertos': aciertos,
+        'fallos': fallos,
+        'ratio_aciertos': round(aciertos / total, 4) if total else None,
+    }
+
+
+def dependencias(vista):
+    return DEPENDENCIAS.get(vista.basename, (vista.queryset.model,))
+
+
+def clave_respuesta(vista, request):
+    # Se calcula una vez por petición (la usan la caché de respuestas y las cabeceras condicionales)
+    if getattr(vista, '_clave_respuesta', None) is None:
+        vista._clave_respuesta = _clave_respuesta(vista, request)
+    return vista._clave_respuesta
+
+
+def _clave_respuesta(vista, request):
+    # Parámetros normalizados: el mismo filtro en otro orden cae en la misma entrada
+    parametros = sorted(
+        (clave, valor) for clave in request.query_params for valor in request.query_params.getlist(clave)
+    )
+    firma = hashlib.md5(repr((request.get_host(), parametros)).encode('utf-8')).hexdigest()
+    version = '.'.join(str(v) for v in versiones(dependencias(vista)))
+    pk = vista.kwargs.get(vista.lookup_url_kwarg or vista.lookup_field, '')
+    return f'{PREFIJO}:respuesta:{vista.basename}:{vista.action}:{pk}:{version}:{firma}'
+
+
+class RespuestaCacheada(Response):
+    # Acierto de la caché: si CompresionMiddleware ya guardó esta entrada comprimida para el formato y la
+    # codificación de la petición, el cuerpo es ese y los datos no se vuelven a renderizar
+
+    @property
+    def rendered_content(self):
+        request = (getattr(self, 'renderer_context', None) or {}).get('request')
+        encontrado = comprimido_cacheado(self, request) if request is not None else None
+        if encontrado is None:
+            return super().rendered_content
+        self.codificacion_cache, comprimido = encontrado
+        # El Content-Type que habría puesto Response al renderizar
+        renderer = self.accepted_renderer
+        if self.content_type is not None:
+            self['Content-Type'] = self.content_type
+        elif renderer.charset is not None:
+            self['Content-Type'] = f'{renderer.media_type}; charset={renderer.charset}'
+        else:
+            self['Content-Type'] = renderer.media_type
+        return comprimido
+
+
+class CacheRespuestaMixin:
+    # Cachea el resultado serializado de list/retrieve; se invalida subiendo la versión de los modelos
+    # (ver signals.py), así que nunca hace falta borrar entradas a mano
+
+    def list(self, request, *args, **kwargs):
+        return self._respuesta_cacheada(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._respuesta_cacheada(super().retrieve, request, *args, **kwargs)
+
+    def _respuesta_cacheada(self, generar, request, *args, **kwargs):
+        if not getattr(settings, 'CATALOGO_CACHE_ACTIVA', True):
+            return generar(request, *args, **kwargs)
+
+        clave = clave_respuesta(self, request)
+        datos = cache.get(clave)
+        if datos is not None:
+            contar('aciertos')
+            respuesta = RespuestaCacheada(datos)
+            respuesta['X-Cache'] = 'HIT'
+            # Para que se reutilice la versión ya comprimida de esta entrada (ver CompresionMiddleware)
+            respuesta.clave_cache = clave
+            return respuesta
+
+        contar('fallos')
+        respuesta = generar(request, *args, **kwargs)
+        if respuesta.status_code == 200:
+            cache.set(clave, respuesta.data, getattr(settings, 'CATALOGO_CACHE_TIMEOUT', 300))
+            respuesta.clave_cache = clave
+        respuesta['X-Cache'] = 'MISS'
+        return respuesta
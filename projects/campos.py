@@ -0,0 +1,246 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+CAMPOS_PARAM = 'fields'
+EXPANDIR_PARAM = 'expand'
+
+
+def _lista(valor):
+    return [parte.strip() for parte in valor.split(',') if parte.strip()]
+
+
+class Seleccion:
+    # Lo que pide el cliente con ?fields= y ?expand=, ya troceado por niveles:
+    #   fields=id,nombre,duenio.nombre  -> id, nombre y duenio (solo con su nombre)
+    #   expand=duenio,duenio.fotos      -> relaciones anidadas completas; el resto van como id
+    # Sin ?fields= salen todos los campos; sin ?expand= todas las relaciones se anidan (como siempre)
+
+    def __init__(self, campos=None, expandir=None):
+        self.campos = self._por_nivel(campos)
+        self.expandir = self._por_nivel(expandir)
+
+    @staticmethod
+    def _por_nivel(rutas):
+        if rutas is None:
+            return None
+        niveles = {}
+        for ruta in rutas:
+            nombre, _, resto = ruta.partition('.')
+            hijos = niveles.setdefault(nombre, [])
+            if resto:
+                hijos.append(resto)
+        return niveles
+
+    @classmethod
+    def desde_peticion(cls, request):
+        params = request.query_params
+        campos = params.get(CAMPOS_PARAM)
+        expandir = params.get(EXPANDIR_PARAM)
+        return cls(
+            _lista(campos) if campos is not None else None,
+            _lista(expandir) if expandir is not None else None,
+        )
+
+    def vacia(self):
+        return self.campos is None and self.expandir is None
+
+    def incluye(self, nombre):
+        return self.campos is None or nombre in self.campos
+
+    def expande(self, nombre):
+        return self.expandir is None or nombre in self.expandir
+
+    def anidada(self, nombre):
+        # Selección para la relación `nombre`: sus campos son los fields "nombre.x" (todos si no hay
+        # ninguno) y dentro se expande lo que diga expand "nombre.x"
+        campos = None
+        if self.campos is not None and self.campos.get(nombre):
+            campos = self.campos[nombre]
+        expandir = None
+        if self.expandir is not None:
+            expandir = self.expandir.get(nombre, [])
+        return Seleccion(campos, expandir)
+
+    def clave(self):
+        def congelar(niveles):
+            if niveles is None:
+                return None
+            return tuple(sorted((nombre, tuple(sorted(hijos))) for nombre, hijos in niveles.items()))
+        return congelar(self.campos), congelar(self.expandir)
+
+    def __eq__(self, otra):
+        return isinstance(otra, Seleccion) and self.clave() == otra.clave()
+
+    def __hash__(self):
+        return hash(self.clave())
+
+    def normalizada(self, serializer):
+        # La misma selección sin los nombres que el serializador no tiene, a cualquier nivel: no cambian la
+        # respuesta y así una petición con nombres inventados no cuenta como una selección distinta
+        if isinstance(serializer, serializers.ListSerializer):
+            serializer = serializer.child
+        if self.vacia() or not isinstance(serializer, serializers.Serializer):
+            return Seleccion()
+        campos = [] if self.campos is not None else None
+        expandir = [] if self.expandir is not None else None
+        for nombre, campo in serializer.fields.items():
+            anidada = self.anidada(nombre).normalizada(campo) if isinstance(campo, serializers.BaseSerializer) else Seleccion()
+            if campos is not None and nombre in self.campos:
+                campos += [nombre] + [f'{nombre}.{ruta}' for ruta in _rutas(anidada.campos)]
+            if expandir is not None and nombre in self.expandir:
+                expandir += [nombre] + [f'{nombre}.{ruta}' for ruta in _rutas(anidada.expandir)]
+        return Seleccion(campos, expandir)
+
+
+def _rutas(niveles):
+    # Lo contrario de Seleccion._por_nivel
+    rutas = []
+    for nombre, hijos in (niveles or {}).items():
+        rutas += [nombre] + [f'{nombre}.{hijo}' for hijo in hijos]
+    return rutas
+
+
+def _referencia(campo, nombre):
+    # Relación sin expandir: solo el id (o la lista de ids) en lugar del objeto anidado. Los modelos con
+    # REFERENCIA_API (Foto: su URL, no su id) salen por ese campo
+    opciones = {'read_only': True}
+    if campo.source != nombre:
+        opciones['source'] = campo.source
+    if isinstance(campo, serializers.ListSerializer):
+        opciones['many'] = True
+        campo = campo.child
+    referencia = getattr(campo.Meta.model, 'REFERENCIA_API', None) if isinstance(campo, serializers.ModelSerializer) else None
+    if referencia is not None:
+        return serializers.SlugRelatedField(slug_field=referencia, **opciones)
+    return serializers.PrimaryKeyRelatedField(**opciones)
+
+
+def referencia(campo):
+    # Columna que pinta una relación sin expandir (ManyRelatedField o de una sola), o None si no es una de
+    # las que crea _referencia
+    relacion = campo.child_relation if isinstance(campo, serializers.ManyRelatedField) else campo
+    if isinstance(relacion, serializers.SlugRelatedField) and '.' not in relacion.slug_field:
+        return relacion.slug_field
+    if isinstance(relacion, serializers.PrimaryKeyRelatedField) and relacion.pk_field is None:
+        return 'pk'
+    return None
+
+
+def recortar(serializer, seleccion):
+    # Quita del serializador (ya instanciado) los campos que no se piden y cambia por su id las
+    # relaciones que no se expanden. Se aplica también a los serializadores anidados
+    if isinstance(serializer, serializers.ListSerializer):
+        recortar(serializer.child, seleccion)
+        return serializer
+    if seleccion.vacia() or not isinstance(serializer, serializers.Serializer):
+        return serializer
+    campos = serializer.fields
+    for nombre in list(campos):
+        if not seleccion.incluye(nombre):
+            del campos[nombre]
+            continue
+        campo = campos[nombre]
+        if not isinstance(campo, serializers.BaseSerializer):
+            continue
+        if seleccion.expande(nombre):
+            recortar(campo, seleccion.anidada(nombre))
+        else:
+            campos[nombre] = _referencia(campo, nombre)
+    return serializer
+
+
+class NoOptimizable(Exception):
+    pass
+
+
+def _consulta(serializer, modelo, prefijo=''):
+    # Columnas (only), select_related y prefetch_related justos para pintar `serializer`
+    solo = [prefijo + modelo._meta.pk.name]
+    relacionados = []
+    precargas = []
+    for nombre, campo in serializer.fields.items():
+        if campo.write_only:
+            continue
+        if campo.source == '*' or '.' in campo.source:
+            raise NoOptimizable(nombre)
+        try:
+            relacion = modelo._meta.get_field(campo.source)
+        except FieldDoesNotExist:
+            raise NoOptimizable(nombre)
+
+        hijo = campo.child if isinstance(campo, serializers.ListSerializer) else None
+        if isinstance(campo, serializers.ManyRelatedField) or hijo is not None:
+            if not relacion.one_to_many or (hijo is not None and not isinstance(hijo, serializers.ModelSerializer)):
+                raise NoOptimizable(nombre)
+            destino = relacion.related_model
+            if hijo is not None:
+                hijo_solo, hijo_relacionados, hijo_precargas = _consulta(hijo, destino)
+            else:
+                columna = referencia(campo)
+                if columna is None:
+                    raise NoOptimizable(nombre)
+                hijo_solo, hijo_relacionados, hijo_precargas = [destino._meta.pk.name], [], []
+                if columna != 'pk':
+                    hijo_solo.append(columna)
+            queryset = destino.objects.only(relacion.field.name, *hijo_solo)
+            if hijo_relacionados:
+                queryset = queryset.select_related(*hijo_relacionados)
+            if hijo_precargas:
+                queryset = queryset.prefetch_related(*hijo_precargas)
+            precargas.append(Prefetch(prefijo + campo.source, queryset=queryset))
+        elif isinstance(campo, serializers.BaseSerializer):
+            if not isinstance(campo, serializers.ModelSerializer) or not relacion.many_to_one or not relacion.concrete:
+                raise NoOptimizable(nombre)
+            anidado_solo, anidado_relacionados, anidado_precargas = _consulta(campo, relacion.related_model, f'{prefijo}{relacion.name}__')
+            solo += [prefijo + relacion.name] + anidado_solo
+            relacionados += [prefijo + relacion.name] + anidado_relacionados
+            precargas += anidado_precargas
+        elif relacion.is_relation and not (relacion.many_to_one and relacion.concrete):
+            raise NoOptimizable(nombre)
+        elif relacion.concrete:
+            solo.append(prefijo + relacion.name)
+        else:
+            raise NoOptimizable(nombre)
+    return solo, relacionados, precargas
+
+
+def optimizar(queryset, serializer):
+    # Ajusta el queryset al serializador (recortado): no se carga ni se precarga nada que no se vaya a pintar.
+    # Si el serializador usa algo que no se sabe traducir se deja el queryset como está
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    try:
+        solo, relacionados, precargas = _consulta(serializer, queryset.model)
+    except NoOptimizable:
+        return queryset
+    queryset = queryset.only(*solo)
+    if relacionados:
+        queryset = queryset.select_related(*relacionados)
+    if precargas:
+        queryset = queryset.prefetch_related(None).prefetch_related(*precargas)
+    return queryset
+
+
+class CamposMixin:
+    # ?fields= y ?expand= en list/retrieve: recortan el serializador y, con él, las columnas y
+    # precargas del queryset
+
+    def seleccion(self):
+        if getattr(self, '_seleccion', None) is None:
+            self._seleccion = Seleccion.desde_peticion(self.request)
+        return self._seleccion
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if self.action in ('list', 'retrieve') and isinstance(serializer, (serializers.ModelSerializer, serializers.ListSerializer)):
+            recortar(serializer, self.seleccion())
+        return serializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action in ('list', 'retrieve') and issubclass(self.get_serializer_class(), serializers.ModelSerializer):
+            serializer = recortar(self.get_serializer_class()(context=self.get_serializer_context()), self.seleccion())
+            queryset = optimizar(queryset, serializer)
+        return queryset
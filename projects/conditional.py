@@ -0,0 +1,73 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .cache import clave_respuesta, dependencias, ultima_modificacion
+
+
+class CondicionalMixin:
+    # ETag / Last-Modified para list y retrieve. Los validadores salen de un agregado sobre
+    # fecha_actualizacion (+ COUNT para detectar borrados) del queryset filtrado, combinado con la
+    # versión de los modelos anidados (un cambio en Foto no toca la fecha del personaje).
+    # Con If-None-Match / If-Modified-Since válidos se responde 304 sin consultar ni serializar nada más.
+
+    def list(self, request, *args, **kwargs):
+        return self._respuesta_condicional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._respuesta_condicional(super().retrieve, request, *args, **kwargs)
+
+    def _respuesta_condicional(self, generar, request, *args, **kwargs):
+        try:
+            etag, ultima = self.validadores(request)
+        except (ValueError, ValidationError):
+            # Filtros o pk inválidos: que el propio handler devuelva el error
+            return generar(request, *args, **kwargs)
+        # Cada formato (JSON, MessagePack...) es una representación distinta: su propio ETag
+        formato = getattr(request.accepted_renderer, 'format', 'json')
+        if formato != 'json':
+            etag = quote_etag(etag.strip('"') + '-' + formato)
+
+        no_modificado = get_conditional_response(request, etag=etag, last_modified=ultima)
+        if no_modificado is not None:
+            return no_modificado
+
+        respuesta = generar(request, *args, **kwargs)
+        if respuesta.status_code == 200:
+            respuesta['ETag'] = etag
+            if ultima is not None:
+                respuesta['Last-Modified'] = http_date(ultima)
+            # El cliente puede guardarla, pero tiene que revalidar (barato gracias al 304)
+            patch_cache_control(respuesta, private=True, no_cache=True)
+            patch_vary_headers(respuesta, ('Accept',))
+        return respuesta
+
+    def validadores(self, request):
+        # Se guardan con la misma clave versionada que la respuesta: un acierto no cuesta consultas
+        clave = f'{clave_respuesta(self, request)}:validadores'
+        validadores = cache.get(clave)
+        if validadores is None:
+            validadores = self._calcular_validadores(clave)
+            cache.set(clave, validadores, getattr(settings, 'CATALOGO_CACHE_TIMEOUT', 300))
+        return validadores
+
+    def _calcular_validadores(self, clave):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        if lookup in self.kwargs:
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup]})
+
+        agregado = queryset.order_by().aggregate(ultima=Max('fecha_actualizacion'), total=Count('pk'))
+        ultima = agregado['ultima'].timestamp() if agregado['ultima'] is not None else None
+        relacionados = ultima_modificacion(dependencias(self))
+        if relacionados is not None and (ultima is None or relacionados > ultima):
+            ultima = relacionados
+
+        firma = f"{clave}:{agregado['ultima']}:{agregado['total']}"
+        etag = quote_etag(hashlib.md5(firma.encode('utf-8')).hexdigest())
+        return etag, int(ultima) if ultima is not None else None
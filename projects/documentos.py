@@ -0,0 +1,93 @@
+import json
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Personajes, Mascotas, Ediciones, Skullectors, Foto, DocumentoCatalogo
+from .search import _trozos
+from .serializers import CompletoSerializer
+
+
+# Caminos desde cada modelo hasta el personaje cuyo documento lo incluye
+RUTAS_PERSONAJE = {
+    Personajes: ('id',),
+    Mascotas: ('duenio_id',),
+    Ediciones: ('muneca_id',),
+    Skullectors: ('muneca_id',),
+    Foto: ('munieca_id', 'mascota__duenio_id', 'edicion__muneca_id', 'skullector__muneca_id'),
+}
+
+
+def personajes_afectados(modelo, ids, using='default'):
+    # Personajes cuyo documento cambia si cambian estas filas (una consulta por trozo de ids)
+    rutas = RUTAS_PERSONAJE.get(modelo)
+    if rutas is None:
+        return set()
+    afectados = set()
+    for trozo in _trozos(ids):
+        for fila in modelo.objects.using(using).filter(pk__in=trozo).values_list(*rutas):
+            afectados.update(valor for valor in fila if valor is not None)
+    return afectados
+
+
+def serializar(personaje):
+    return json.dumps(CompletoSerializer(personaje).data, cls=JSONEncoder, ensure_ascii=False)
+
+
+def reconstruir_documentos(ids, using='default'):
+    # Vuelve a serializar los personajes indicados con sus precargas y guarda los documentos de una vez;
+    # los de personajes que ya no existen se borran
+    ids = set(ids)
+    for trozo in _trozos(sorted(ids)):
+        personajes = list(Personajes.objects.using(using).completo().filter(id__in=trozo))
+        ahora = timezone.now()
+        documentos = [
+            DocumentoCatalogo(personaje_id=personaje.id, datos=serializar(personaje), fecha_actualizacion=ahora)
+            for personaje in personajes
+        ]
+        if documentos:
+            DocumentoCatalogo.objects.using(using).bulk_create(
+                documentos, update_conflicts=True, unique_fields=['personaje'], update_fields=['datos', 'fecha_actualizacion'],
+            )
+        faltan = set(trozo) - {personaje.id for personaje in personajes}
+        if faltan:
+            DocumentoCatalogo.objects.using(using).filter(personaje_id__in=faltan).delete()
+
+
+def _documento(personaje):
+    try:
+        return personaje.documento
+    except ObjectDoesNotExist:
+        return None
+
+
+class DocumentosListSerializer(serializers.ListSerializer):
+    # Los personajes sin documento de la página se cargan de una vez con las precargas de completo(): sin
+    # ellas cada uno recorrería sus relaciones fila a fila
+    def to_representation(self, data):
+        filas = list(data)
+        faltan = [fila.pk for fila in filas if _documento(fila) is None]
+        serializados = {}
+        if faltan:
+            for personaje in Personajes.objects.completo().filter(id__in=faltan):
+                serializados[personaje.pk] = CompletoSerializer(personaje, context=self.context).data
+        return [
+            serializados[fila.pk] if fila.pk in serializados else self.child.to_representation(fila)
+            for fila in filas
+        ]
+
+
+class DocumentoCompletoSerializer(serializers.BaseSerializer):
+    # Lectura de /todos/: devuelve el documento guardado tal cual. Si aún no existe (datos anteriores a la
+    # tabla sin reconstruir) se serializa en el momento, como antes, con las relaciones precargadas
+    class Meta:
+        list_serializer_class = DocumentosListSerializer
+
+    def to_representation(self, instance):
+        documento = _documento(instance)
+        if documento is None:
+            personaje = Personajes.objects.completo().filter(pk=instance.pk).first() or instance
+            return CompletoSerializer(personaje, context=self.context).data
+        return json.loads(documento.datos)
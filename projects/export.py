@@ -0,0 +1,64 @@
+import csv
+import json
+
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .documentos import DocumentoCompletoSerializer
+
+
+COLUMNAS_CSV = (
+    'id', 'nombre', 'monstruo', 'lanzamiento', 'cumpleanios', 'ciudadNatal', 'edad',
+    'frase', 'colorFav', 'sexo', 'fotos', 'mascota', 'ediciones', 'skullectors',
+)
+
+
+def trozos(queryset, tamanio=None):
+    # Recorre el queryset por id (keyset) en trozos: cada trozo es una consulta indexada que trae los
+    # documentos precalculados de sus filas, así que la memoria no depende del tamaño del catálogo
+    tamanio = tamanio or getattr(settings, 'CATALOGO_EXPORT_TROZO', 1000)
+    queryset = queryset.order_by('id')
+    ultimo = None
+    while True:
+        pagina = queryset if ultimo is None else queryset.filter(id__gt=ultimo)
+        filas = list(pagina[:tamanio])
+        if not filas:
+            return
+        yield DocumentoCompletoSerializer(filas, many=True).data
+        if len(filas) < tamanio:
+            return
+        ultimo = filas[-1].id
+
+
+def _json(valor):
+    return json.dumps(valor, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def exportar_ndjson(queryset, tamanio=None):
+    for datos in trozos(queryset, tamanio):
+        yield ''.join(_json(fila) + '\n' for fila in datos)
+
+
+class _Eco:
+    # "Fichero" para csv.writer que devuelve lo escrito en vez de guardarlo
+    def write(self, valor):
+        return valor
+
+
+def exportar_csv(queryset, tamanio=None):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(COLUMNAS_CSV)
+    for datos in trozos(queryset, tamanio):
+        lineas = []
+        for fila in datos:
+            valores = []
+            for columna in COLUMNAS_CSV:
+                valor = fila[columna]
+                if columna == 'fotos':
+                    valor = ' '.join(foto['url'] for foto in valor)
+                elif isinstance(valor, (list, dict)):
+                    # Las relaciones anidadas van como JSON dentro de la celda
+                    valor = _json(valor)
+                valores.append(valor)
+            lineas.append(escritor.writerow(valores))
+        yield ''.join(lineas)
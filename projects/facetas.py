@@ -0,0 +1,115 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F
+from django.db.models.functions import ExtractYear
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .cache import PREFIJO, contar, dependencias, nombre_modelo, versiones
+
+
+# Parámetros que no filtran: no cambian los recuentos y no forman parte de la firma
+PARAMETROS_SIN_FILTRO = {'page', 'cursor', 'paginacion', 'ordering', 'fields', 'expand', 'format'}
+
+
+class FacetasMixin:
+    # GET <recurso>/facetas/ con los mismos filtros que el listado: cuántas filas del listado hay por cada
+    # valor de cada faceta. Una consulta agrupada por faceta (más el total) sobre el queryset filtrado, y el
+    # resultado se cachea por firma de filtros y versión de los modelos que intervienen.
+    # campos_facetas: nombre -> ruta desde el modelo del viewset (p.ej. 'ediciones__generacion')
+    campos_facetas = {}
+
+    @action(detail=False, methods=['get'], url_path='facetas')
+    def facetas(self, request):
+        return self.agregado_cacheado(request, 'facetas', self.contar_facetas)
+
+    def agregado_cacheado(self, request, tipo, calcular, modelos=()):
+        # Respuesta de un endpoint de agregados (facetas, cronologia...) cacheada por firma de filtros y
+        # versión de los modelos; los errores en los filtros son un 400
+        try:
+            clave = self.clave_facetas(request, tipo, modelos)
+            datos = cache.get(clave)
+            if datos is None:
+                contar('fallos')
+                datos = calcular()
+                cache.set(clave, datos, getattr(settings, 'CATALOGO_CACHE_TIMEOUT', 300))
+            else:
+                contar('aciertos')
+            return Response(datos)
+        except (ValueError, ValidationError) as e:
+            return Response({"error": "Error de validación en los filtros", "detalles": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def modelos_facetas(self):
+        # Los del listado (sus filtros pueden cruzar relaciones) y los que recorren las facetas
+        modelo = self.queryset.model
+        modelos = {nombre_modelo(m) for m in dependencias(self)} | {modelo._meta.model_name}
+        for ruta in self.campos_facetas.values():
+            actual = modelo
+            for parte in ruta.split('__')[:-1]:
+                actual = actual._meta.get_field(parte).related_model
+                modelos.add(actual._meta.model_name)
+        return sorted(modelos)
+
+    def clave_facetas(self, request, tipo='facetas', modelos=()):
+        parametros = sorted(
+            (clave, valor) for clave in request.query_params if clave not in PARAMETROS_SIN_FILTRO
+            for valor in request.query_params.getlist(clave)
+        )
+        firma = hashlib.md5(repr(parametros).encode('utf-8')).hexdigest()
+        version = '.'.join(str(v) for v in versiones(sorted(set(self.modelos_facetas()) | {nombre_modelo(m) for m in modelos})))
+        return f'{PREFIJO}:{tipo}:{self.basename}:{version}:{firma}'
+
+    def base_agregados(self):
+        modelo = self.queryset.model
+        filtrado = self.filter_queryset(self.get_queryset())
+        # Los filtros (búsqueda, joins, distinct...) quedan en una subconsulta de ids: cada agrupación
+        # parte de una consulta limpia, sin anotaciones ni orden que se cuelen en el GROUP BY
+        return modelo.objects.filter(pk__in=filtrado.order_by().values('pk'))
+
+    def contar_facetas(self):
+        base = self.base_agregados()
+        resultado = {'total': base.count(), 'facetas': {}}
+        for nombre, ruta in self.campos_facetas.items():
+            filas = base.values(ruta).annotate(total=Count('pk', distinct=True)).order_by()
+            # Sin valor (p.ej. un personaje sin ediciones) no es una faceta que se pueda elegir
+            valores = [{'valor': fila[ruta], 'total': fila['total']} for fila in filas if fila[ruta] is not None]
+            valores.sort(key=lambda fila: (-fila['total'], str(fila['valor'])))
+            resultado['facetas'][nombre] = valores
+        return resultado
+
+
+class CronologiaMixin:
+    # GET <recurso>/cronologia/?por=mes|anio con los filtros del listado: lanzamientos por mes (o año) en orden
+    # cronológico, agrupando sobre la columna de fecha indexada. Usa la firma y la caché de FacetasMixin
+    campo_cronologia = 'fecha_lanzamiento'
+
+    @action(detail=False, methods=['get'], url_path='cronologia')
+    def cronologia(self, request):
+        por = request.query_params.get('por', 'mes')
+        if por not in ('mes', 'anio'):
+            return Response({"error": "El parámetro 'por' debe ser 'mes' o 'anio'"}, status=status.HTTP_400_BAD_REQUEST)
+        return self.agregado_cacheado(request, 'cronologia', lambda: self.contar_cronologia(por))
+
+    def contar_cronologia(self, por):
+        base = self.base_agregados()
+        campo = self.campo_cronologia
+        if por == 'anio':
+            filas = base.filter(**{f'{campo}__isnull': False}).annotate(periodo=ExtractYear(campo)).values('periodo')
+        else:
+            filas = base.filter(**{f'{campo}__isnull': False}).values(periodo=F(campo))
+        filas = filas.annotate(total=Count('pk')).order_by('periodo')
+
+        periodos = []
+        for fila in filas:
+            periodo = fila['periodo']
+            periodos.append({'periodo': str(periodo) if por == 'anio' else periodo.strftime('%Y-%m'), 'total': fila['total']})
+        return {
+            'total': base.count(),
+            # Lanzamientos que no se pudieron convertir a fecha: no entran en ningún periodo
+            'sin_fecha': base.filter(**{f'{campo}__isnull': True}).count(),
+            'periodos': periodos,
+        }
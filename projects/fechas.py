@@ -0,0 +1,68 @@
+import datetime
+import re
+
+from django.core.exceptions import ValidationError
+
+
+# Año fijo (bisiesto, para que exista el 29 de febrero) de las fechas de cumpleaños: solo importan mes y día
+ANIO_CUMPLEANIOS = 2000
+
+_ANIO_MES_RE = re.compile(r'^\s*(\d{4})(?:[-/.](\d{1,2}))?\s*$')
+_MES_ANIO_RE = re.compile(r'^\s*(\d{1,2})[-/.](\d{4})\s*$')
+_MES_DIA_RE = re.compile(r'^\s*(\d{1,2})-(\d{1,2})\s*$')
+_DIA_MES_RE = re.compile(r'^\s*(\d{1,2})/(\d{1,2})\s*$')
+
+
+def _fecha(anio, mes, dia=1):
+    try:
+        return datetime.date(anio, mes, dia)
+    except ValueError:
+        return None
+
+
+def parsear_lanzamiento(texto):
+    # 'AAAA-MM' (lo habitual), 'AAAA/MM', 'MM/AAAA' o solo 'AAAA' -> día 1 de ese mes (enero si no hay mes).
+    # Lo que no se entiende queda en None: la columna de texto sigue siendo la original
+    if not texto:
+        return None
+    coincidencia = _ANIO_MES_RE.match(texto)
+    if coincidencia:
+        return _fecha(int(coincidencia.group(1)), int(coincidencia.group(2) or 1))
+    coincidencia = _MES_ANIO_RE.match(texto)
+    if coincidencia:
+        return _fecha(int(coincidencia.group(2)), int(coincidencia.group(1)))
+    return None
+
+
+def parsear_cumpleanios(texto):
+    # 'MM-DD' (lo habitual) o 'DD/MM' -> esa fecha en ANIO_CUMPLEANIOS
+    if not texto:
+        return None
+    coincidencia = _MES_DIA_RE.match(texto)
+    if coincidencia:
+        return _fecha(ANIO_CUMPLEANIOS, int(coincidencia.group(1)), int(coincidencia.group(2)))
+    coincidencia = _DIA_MES_RE.match(texto)
+    if coincidencia:
+        return _fecha(ANIO_CUMPLEANIOS, int(coincidencia.group(2)), int(coincidencia.group(1)))
+    return None
+
+
+def filtrar_lanzamiento(queryset, params, campo='fecha_lanzamiento'):
+    # ?lanzamiento_desde= y ?lanzamiento_hasta= ('AAAA' o 'AAAA-MM', ambos incluidos) sobre la columna indexada
+    desde = params.get('lanzamiento_desde', None)
+    if desde is not None:
+        fecha = parsear_lanzamiento(desde)
+        if fecha is None:
+            raise ValidationError("El parámetro 'lanzamiento_desde' debe tener el formato AAAA o AAAA-MM")
+        queryset = queryset.filter(**{f'{campo}__gte': fecha})
+
+    hasta = params.get('lanzamiento_hasta', None)
+    if hasta is not None:
+        fecha = parsear_lanzamiento(hasta)
+        if fecha is None:
+            raise ValidationError("El parámetro 'lanzamiento_hasta' debe tener el formato AAAA o AAAA-MM")
+        if hasta.strip().isdigit():
+            # Solo el año: hasta diciembre incluido
+            fecha = fecha.replace(month=12)
+        queryset = queryset.filter(**{f'{campo}__lte': fecha})
+    return queryset
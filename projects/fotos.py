@@ -0,0 +1,137 @@
+import io
+import threading
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.module_loading import import_string
+from PIL import Image, UnidentifiedImageError
+
+from .imagenes import FORMATOS, codificar, normalizar
+from .models import hash_url
+
+
+# Proxy de las fotos del catálogo: cada Foto.url se descarga una vez, se guarda en el almacenamiento local
+# (fotos/<url_hash>/original) y se sirven sus variantes (fotos/<url_hash>/<ancho>.webp|jpg) desde
+# /api/v1/imagenes/ con caché de un año. Lo que hay guardado para una URL no cambia nunca
+CARPETA = 'fotos'
+EXTENSIONES = dict(FORMATOS)
+
+
+class ErrorDescarga(Exception):
+    # El servidor de la foto no la ha dado (error, tiempo agotado, demasiado grande) o no es una imagen
+    pass
+
+
+def descargar_http(url, timeout, limite):
+    # Descargador por defecto (IMAGENES_FOTOS_DESCARGADOR): recibe la URL, los segundos de espera y el máximo
+    # de bytes, y devuelve el contenido o lanza ErrorDescarga
+    if not url.startswith(('http://', 'https://')):
+        raise ErrorDescarga("Solo se descargan URLs http(s)")
+    peticion = urllib.request.Request(url, headers={'User-Agent': 'backendMattel-imagenes', 'Accept': 'image/*'})
+    try:
+        with urllib.request.urlopen(peticion, timeout=timeout) as respuesta:
+            contenido = respuesta.read(limite + 1)
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        raise ErrorDescarga(str(e)) from e
+    if len(contenido) > limite:
+        raise ErrorDescarga(f"La imagen ocupa más de {limite} bytes")
+    return contenido
+
+
+def descargar(url):
+    descargador = import_string(getattr(settings, 'IMAGENES_FOTOS_DESCARGADOR', 'projects.fotos.descargar_http'))
+    return descargador(url, getattr(settings, 'IMAGENES_FOTOS_TIMEOUT', 10), getattr(settings, 'IMAGENES_FOTOS_MAX_BYTES', 10 * 1024 * 1024))
+
+
+def anchos():
+    return sorted(getattr(settings, 'IMAGENES_FOTOS_ANCHOS', (160, 320, 640, 1024)))
+
+
+def carpeta(url):
+    return f'{CARPETA}/{hash_url(url) & 0xFFFFFFFFFFFFFFFF:016x}'
+
+
+def ruta_original(url):
+    return f'{carpeta(url)}/original'
+
+
+def ruta_variante(url, ancho, formato):
+    return f'{carpeta(url)}/{ancho}.{EXTENSIONES[formato]}'
+
+
+def en_cache(url):
+    # El original se guarda después de las variantes: si está, están todas
+    return default_storage.exists(ruta_original(url))
+
+
+# Un lock por foto: las peticiones que llegan a la vez por una foto sin descargar esperan a la primera en
+# vez de descargarla cada una (dentro de este proceso)
+_bloqueos = {}
+_bloqueo = threading.Lock()
+
+
+@contextmanager
+def _bloqueada(clave):
+    with _bloqueo:
+        lock, usos = _bloqueos.get(clave, (None, 0))
+        lock = lock or threading.Lock()
+        _bloqueos[clave] = (lock, usos + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _bloqueo:
+            lock, usos = _bloqueos[clave]
+            if usos == 1:
+                del _bloqueos[clave]
+            else:
+                _bloqueos[clave] = (lock, usos - 1)
+
+
+def _guardar(ruta, contenido):
+    # Con el mismo nombre siempre (save() le añadiría un sufijo si ya existe)
+    if default_storage.exists(ruta):
+        default_storage.delete(ruta)
+    default_storage.save(ruta, ContentFile(contenido))
+
+
+def generar_variantes(url, contenido):
+    # Una variante por ancho y formato, sin recortar y sin ampliar: con un original más estrecho se quedan
+    # a su tamaño
+    try:
+        with Image.open(io.BytesIO(contenido)) as imagen:
+            imagen = normalizar(imagen)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ErrorDescarga(f"No es una imagen válida: {e}") from e
+    for ancho in anchos():
+        escala = min(1, ancho / imagen.width)
+        reducida = imagen
+        if escala < 1:
+            reducida = imagen.resize((ancho, max(1, round(imagen.height * escala))), Image.LANCZOS)
+        for formato, _ in FORMATOS:
+            _guardar(ruta_variante(url, ancho, formato), codificar(reducida, formato))
+
+
+def cachear(url, regenerar=False):
+    # Descarga la foto si no está guardada y genera sus variantes; con regenerar las vuelve a generar desde el
+    # original guardado (p.ej. al cambiar IMAGENES_FOTOS_ANCHOS). Devuelve True si ha hecho algo
+    if not regenerar and en_cache(url):
+        return False
+    original = ruta_original(url)
+    with _bloqueada(original):
+        guardado = en_cache(url)
+        if guardado and not regenerar:
+            return False
+        if guardado:
+            with default_storage.open(original, 'rb') as archivo:
+                contenido = archivo.read()
+        else:
+            contenido = descargar(url)
+        generar_variantes(url, contenido)
+        if not guardado:
+            _guardar(original, contenido)
+    return True
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+
+
+class Saturado(Exception):
+    # El pool ya tiene HASHING_COLA trabajos esperando: la petición se rechaza (503) en vez de encolarla
+    pass
+
+
+class PoolHashing:
+    # Los PBKDF2 de login y registro en un pool de HASHING_HILOS hilos, fuera del worker de la petición y
+    # con un tope de CPU: una ráfaga de logins no se come todos los workers ni todos los núcleos y el resto
+    # de endpoints sigue respondiendo. El hashing de hashlib suelta el GIL, así que los hilos corren en
+    # paralelo de verdad. Con HASHING_HILOS = 0 se calcula en el propio hilo de la petición, como antes
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.plazas = None
+
+    def _preparar(self):
+        with self.lock:
+            if self.executor is None:
+                hilos = getattr(settings, 'HASHING_HILOS', None)
+                if hilos is None:
+                    hilos = min(4, os.cpu_count() or 1)
+                if not hilos:
+                    return None, None
+                # Plazas: los que se están calculando más los que esperan turno
+                self.plazas = threading.BoundedSemaphore(hilos + getattr(settings, 'HASHING_COLA', 4 * hilos))
+                self.executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='hashing')
+            return self.executor, self.plazas
+
+    def enviar(self, funcion, *args):
+        executor, plazas = self._preparar()
+        if executor is None:
+            return _futuro_inmediato(funcion, *args)
+        if not plazas.acquire(blocking=False):
+            raise Saturado()
+        try:
+            futuro = executor.submit(funcion, *args)
+        except BaseException:
+            plazas.release()
+            raise
+        futuro.add_done_callback(lambda _: plazas.release())
+        return futuro
+
+    def ejecutar(self, funcion, *args):
+        return self.enviar(funcion, *args).result()
+
+    async def aejecutar(self, funcion, *args):
+        return await asyncio.wrap_future(self.enviar(funcion, *args))
+
+    def cerrar(self):
+        # Para los tests y el benchmark: el siguiente trabajo vuelve a leer HASHING_HILOS y HASHING_COLA
+        with self.lock:
+            executor, self.executor, self.plazas = self.executor, None, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def _futuro_inmediato(funcion, *args):
+    futuro = Future()
+    try:
+        futuro.set_result(funcion(*args))
+    except BaseException as e:
+        futuro.set_exception(e)
+    return futuro
+
+
+pool_hashing = PoolHashing()
+
+
+def comprobar_contrasenia(contrasenia, cifrada):
+    # check_password sin tocar la base de datos (se llama desde el pool, sin la conexión de la petición):
+    # devuelve (correcta, hay que volver a cifrarla) y el que llama guarda el hash nuevo si hace falta
+    actualizar = []
+    correcta = check_password(contrasenia, cifrada, setter=actualizar.append)
+    return correcta, bool(actualizar)
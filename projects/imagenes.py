@@ -0,0 +1,158 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+CARPETA = 'profile_images'
+CARPETA_VARIANTES = f'{CARPETA}/variantes'
+# (formato de Pillow, extensión) de cada variante; WebP primero, que es el que el cliente debería preferir
+FORMATOS = (('webp', 'webp'), ('jpeg', 'jpg'))
+
+# Nombres con el hash del contenido: el fichero de una URL no cambia nunca y se puede cachear para siempre
+_NOMBRE_HASH_RE = re.compile(r'^(?:variantes/)?[0-9a-f]{16}(?:-\d+)?\.[a-z0-9]+$')
+
+
+def _resumen(archivo):
+    resumen = hashlib.sha256()
+    for trozo in archivo.chunks():
+        resumen.update(trozo)
+    return resumen.hexdigest()[:16]
+
+
+def ruta_foto_perfil(instance, filename):
+    # upload_to de Usuario.profile_picture: profile_images/<hash del contenido>.<extensión original>
+    extension = os.path.splitext(filename)[1].lower()
+    return f'{CARPETA}/{_resumen(instance.profile_picture)}{extension}'
+
+
+def es_inmutable(ruta):
+    # ruta relativa a profile_images/
+    return bool(_NOMBRE_HASH_RE.match(ruta))
+
+
+def normalizar(imagen):
+    # Girada según su EXIF y en RGB(A), para redimensionar con LANCZOS también las de paleta
+    imagen = ImageOps.exif_transpose(imagen)
+    return imagen.convert('RGBA' if imagen.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+
+def codificar(imagen, formato):
+    # Bytes de la imagen (ya normalizada) en WebP o JPEG (sin transparencia: fondo blanco) con las calidades
+    # de settings
+    salida = io.BytesIO()
+    if formato == 'webp':
+        imagen.save(salida, 'WEBP', quality=getattr(settings, 'IMAGENES_CALIDAD_WEBP', 80), method=4)
+    else:
+        if imagen.mode == 'RGBA':
+            fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+            fondo.paste(imagen, mask=imagen.getchannel('A'))
+            imagen = fondo
+        imagen.save(salida, 'JPEG', quality=getattr(settings, 'IMAGENES_CALIDAD_JPEG', 85), optimize=True, progressive=True)
+    return salida.getvalue()
+
+
+def generar_variantes(nombre):
+    # Lee la imagen original del almacenamiento y guarda un recorte cuadrado por ancho y formato.
+    # Devuelve {'origen': nombre, 'webp': {'64': ruta, ...}, 'jpeg': {...}}; un ancho mayor que el original
+    # no se genera (salvo el más pequeño, para que siempre haya alguna)
+    with default_storage.open(nombre, 'rb') as archivo:
+        contenido = archivo.read()
+    resumen = hashlib.sha256(contenido).hexdigest()[:16]
+
+    with Image.open(io.BytesIO(contenido)) as imagen:
+        imagen = normalizar(imagen)
+        lado = min(imagen.size)
+        anchos = sorted(getattr(settings, 'IMAGENES_PERFIL_ANCHOS', (64, 128, 256, 512)))
+        anchos = [ancho for ancho in anchos if ancho <= lado] or [min(anchos[0], lado)]
+
+        variantes = {'origen': nombre}
+        for formato, extension in FORMATOS:
+            variantes[formato] = {}
+            for ancho in anchos:
+                ruta = f'{CARPETA_VARIANTES}/{resumen}-{ancho}.{extension}'
+                if not default_storage.exists(ruta):
+                    recorte = ImageOps.fit(imagen, (ancho, ancho), Image.LANCZOS)
+                    default_storage.save(ruta, ContentFile(codificar(recorte, formato)))
+                variantes[formato][str(ancho)] = ruta
+    return variantes
+
+
+def procesar_foto_perfil(user_id, nombre):
+    # Genera las variantes y las guarda en el usuario si su foto sigue siendo la misma (puede haber subido
+    # otra mientras tanto). update() para no volver a disparar post_save
+    from .autenticacion import olvidar_usuario
+    Usuario = get_user_model()
+    variantes = generar_variantes(nombre)
+    if Usuario.objects.filter(pk=user_id, profile_picture=nombre).update(profile_picture_variantes=variantes):
+        olvidar_usuario(user_id)
+    return variantes
+
+
+class ColaImagenes:
+    # Las variantes se generan fuera de la petición, en IMAGENES_HILOS hilos de este proceso (con su propia
+    # conexión). Con IMAGENES_HILOS = 0 se generan en el momento, en el hilo que las pide (tests, comandos).
+    # Si el proceso muere antes de terminar, el comando procesar_imagenes genera las que falten
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def encolar(self, user_id, nombre):
+        hilos = getattr(settings, 'IMAGENES_HILOS', 1)
+        if not hilos:
+            procesar_foto_perfil(user_id, nombre)
+            return
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='imagenes')
+        self.executor.submit(_procesar_en_hilo, user_id, nombre)
+
+
+def _procesar_en_hilo(user_id, nombre):
+    try:
+        procesar_foto_perfil(user_id, nombre)
+    except Exception:
+        logger.exception("No se han podido generar las variantes de %s", nombre)
+    finally:
+        connection.close()
+
+
+cola_imagenes = ColaImagenes()
+
+
+def programar_variantes(usuario):
+    # Desde post_save: si la foto ha cambiado se encolan sus variantes al confirmar la transacción; si se ha
+    # quitado, se vacían
+    nombre = usuario.profile_picture.name if usuario.profile_picture else ''
+    variantes = usuario.profile_picture_variantes or {}
+    if variantes.get('origen', '') == nombre:
+        return
+    if not nombre:
+        get_user_model().objects.filter(pk=usuario.pk).update(profile_picture_variantes={})
+        return
+    transaction.on_commit(lambda: cola_imagenes.encolar(usuario.pk, nombre))
+
+
+def urls_variantes(variantes, request=None):
+    # {'webp': {'64': url, ...}, 'jpeg': {...}} para el serializador (absolutas si hay petición)
+    resultado = {}
+    for formato, _ in FORMATOS:
+        rutas = (variantes or {}).get(formato) or {}
+        resultado[formato] = {}
+        for ancho, ruta in sorted(rutas.items(), key=lambda par: int(par[0])):
+            url = default_storage.url(ruta)
+            resultado[formato][ancho] = request.build_absolute_uri(url) if request is not None else url
+    return resultado
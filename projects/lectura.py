@@ -0,0 +1,212 @@
+import asyncio
+import functools
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+
+from .campos import Seleccion, recortar, referencia
+from .search import _trozos
+
+
+class NoSoportado(Exception):
+    pass
+
+
+def _conversor(campo):
+    # El mismo to_representation que usaría el serializador; CharField e IntegerField se sustituyen
+    # por str/int, que es exactamente lo que hacen, sin la llamada extra al método
+    if type(campo) is serializers.CharField:
+        return str
+    if type(campo) is serializers.IntegerField:
+        return int
+    return campo.to_representation
+
+
+class PlanLectura:
+    # Versión "compilada" de un ModelSerializer de solo lectura: qué columnas pedir con .values() y
+    # cómo convertir cada una. Las relaciones anidadas se resuelven con una consulta por relación y
+    # lote de filas (agrupando por la FK), no con un serializador ni una consulta por fila.
+    # Si el serializador tiene algo que no sabe reproducir igual lanza NoSoportado
+
+    def __init__(self, serializer):
+        self.modelo = serializer.Meta.model
+        opciones = self.modelo._meta
+        self.pk = opciones.pk.attname
+        self.columnas = {self.pk}
+        self.campos = []
+        for nombre, campo in serializer.fields.items():
+            if campo.write_only:
+                continue
+            if campo.source == '*' or '.' in campo.source:
+                raise NoSoportado(nombre)
+            try:
+                relacion = opciones.get_field(campo.source)
+            except FieldDoesNotExist:
+                raise NoSoportado(nombre)
+
+            if isinstance(campo, serializers.ListSerializer):
+                if not isinstance(campo.child, serializers.ModelSerializer) or not relacion.one_to_many:
+                    raise NoSoportado(nombre)
+                self.campos.append((nombre, 'lista', (PlanLectura(campo.child), relacion.field.attname)))
+            elif isinstance(campo, serializers.ManyRelatedField):
+                # Relación sin expandir (?expand=): lista de ids (o de REFERENCIA_API, ver campos.py)
+                columna = referencia(campo)
+                if columna is None or not relacion.one_to_many:
+                    raise NoSoportado(nombre)
+                self.campos.append((nombre, 'ids', ((relacion.related_model, columna), relacion.field.attname)))
+            elif isinstance(campo, serializers.ModelSerializer):
+                if not relacion.many_to_one or not relacion.concrete:
+                    raise NoSoportado(nombre)
+                self.columnas.add(relacion.attname)
+                self.campos.append((nombre, 'objeto', (PlanLectura(campo), relacion.attname)))
+            elif isinstance(campo, PrimaryKeyRelatedField) and campo.pk_field is None:
+                if not relacion.many_to_one or not relacion.concrete:
+                    raise NoSoportado(nombre)
+                self.columnas.add(relacion.attname)
+                self.campos.append((nombre, 'valor', (relacion.attname, None)))
+            elif isinstance(campo, (serializers.BaseSerializer, serializers.RelatedField, serializers.ManyRelatedField, serializers.SerializerMethodField)):
+                raise NoSoportado(nombre)
+            else:
+                if relacion.is_relation or not relacion.concrete:
+                    raise NoSoportado(nombre)
+                self.columnas.add(relacion.attname)
+                self.campos.append((nombre, 'valor', (relacion.attname, _conversor(campo))))
+
+    def construir(self, filas, using='default'):
+        # filas: diccionarios de .values() con al menos self.columnas
+        listas = {}
+        objetos = {}
+        for nombre, tipo, (plan, fk) in self.campos:
+            if tipo == 'valor':
+                continue
+            if tipo == 'ids':
+                modelo, columna = plan
+                ids = {fila[self.pk] for fila in filas}
+                agrupadas = listas[nombre] = {pk: [] for pk in ids}
+                for trozo in _trozos(ids):
+                    for padre, valor in modelo.objects.using(using).filter(**{f'{fk}__in': trozo}).values_list(fk, columna):
+                        agrupadas[padre].append(valor)
+            elif tipo == 'lista':
+                ids = {fila[self.pk] for fila in filas}
+                agrupadas = listas[nombre] = {pk: [] for pk in ids}
+                for trozo in _trozos(ids):
+                    hijas = list(plan.modelo.objects.using(using).filter(**{f'{fk}__in': trozo}).values(*(plan.columnas | {fk})))
+                    for hija, datos in zip(hijas, plan.construir(hijas, using)):
+                        agrupadas[hija[fk]].append(datos)
+            else:
+                ids = {fila[fk] for fila in filas if fila[fk] is not None}
+                encontrados = objetos[nombre] = {}
+                for trozo in _trozos(ids):
+                    padres = list(plan.modelo.objects.using(using).filter(pk__in=trozo).values(*plan.columnas))
+                    for padre, datos in zip(padres, plan.construir(padres, using)):
+                        encontrados[padre[plan.pk]] = datos
+        return self._armar(filas, listas, objetos)
+
+    async def aconstruir(self, filas, using='default', leer=None):
+        # construir() con el ORM async para las vistas de asincrono.py: las consultas de todas las relaciones
+        # (y de sus relaciones anidadas) se lanzan a la vez con gather en vez de una detrás de otra.
+        # leer(queryset) devuelve la lista de filas; por defecto, un async for
+        leer = leer or aleer
+        listas = {}
+        objetos = {}
+        tareas = []
+
+        async def ids_de(agrupadas, plan, fk, trozo):
+            modelo, columna = plan
+            for padre, valor in await leer(modelo.objects.using(using).filter(**{f'{fk}__in': trozo}).values_list(fk, columna)):
+                agrupadas[padre].append(valor)
+
+        async def hijas_de(agrupadas, plan, fk, trozo):
+            hijas = await leer(plan.modelo.objects.using(using).filter(**{f'{fk}__in': trozo}).values(*(plan.columnas | {fk})))
+            for hija, datos in zip(hijas, await plan.aconstruir(hijas, using, leer)):
+                agrupadas[hija[fk]].append(datos)
+
+        async def padres_de(encontrados, plan, trozo):
+            padres = await leer(plan.modelo.objects.using(using).filter(pk__in=trozo).values(*plan.columnas))
+            for padre, datos in zip(padres, await plan.aconstruir(padres, using, leer)):
+                encontrados[padre[plan.pk]] = datos
+
+        for nombre, tipo, (plan, fk) in self.campos:
+            if tipo == 'valor':
+                continue
+            if tipo in ('ids', 'lista'):
+                ids = {fila[self.pk] for fila in filas}
+                agrupadas = listas[nombre] = {pk: [] for pk in ids}
+                cargar = ids_de if tipo == 'ids' else hijas_de
+                tareas.extend(cargar(agrupadas, plan, fk, trozo) for trozo in _trozos(ids))
+            else:
+                ids = {fila[fk] for fila in filas if fila[fk] is not None}
+                encontrados = objetos[nombre] = {}
+                tareas.extend(padres_de(encontrados, plan, trozo) for trozo in _trozos(ids))
+        # Cada padre cae en un solo trozo, así que sus hijas quedan en el mismo orden que con construir()
+        await asyncio.gather(*tareas)
+        return self._armar(filas, listas, objetos)
+
+    def _armar(self, filas, listas, objetos):
+        resultado = []
+        for fila in filas:
+            datos = {}
+            for nombre, tipo, (origen, conversor) in self.campos:
+                if tipo == 'valor':
+                    valor = fila[origen]
+                    datos[nombre] = valor if valor is None or conversor is None else conversor(valor)
+                elif tipo in ('lista', 'ids'):
+                    datos[nombre] = listas[nombre][fila[self.pk]]
+                else:
+                    # origen es el plan del modelo relacionado y conversor la columna de la FK
+                    fk = fila[conversor]
+                    datos[nombre] = None if fk is None else objetos[nombre].get(fk)
+            resultado.append(datos)
+        return resultado
+
+
+async def aleer(queryset):
+    return [fila async for fila in queryset]
+
+
+# Planes compilados que se guardan por proceso: la selección sale de la petición, así que la caché tiene tope
+PLANES_MAX = 256
+
+
+@functools.lru_cache(maxsize=PLANES_MAX)
+def _compilar(serializer_class, seleccion):
+    if not issubclass(serializer_class, serializers.ModelSerializer):
+        return None
+    try:
+        return PlanLectura(recortar(serializer_class(), seleccion))
+    except NoSoportado:
+        return None
+
+
+def plan_lectura(serializer_class, seleccion=None):
+    # Un plan por clase de serializador y selección de ?fields=/?expand=, compilado la primera vez que se usa.
+    # La selección se ajusta antes a los campos que existen: los nombres inventados no crean planes nuevos
+    seleccion = seleccion or Seleccion()
+    if not seleccion.vacia() and issubclass(serializer_class, serializers.Serializer):
+        seleccion = seleccion.normalizada(serializer_class())
+    return _compilar(serializer_class, seleccion)
+
+
+class LecturaRapidaMixin:
+    # list() sin instanciar el serializador por fila: pagina un queryset .values() y arma la respuesta
+    # con el plan compilado del serializador. La salida es la misma que la del serializador; si este
+    # usa campos que el plan no sabe reproducir se usa el list() normal
+
+    def list(self, request, *args, **kwargs):
+        seleccion = self.seleccion() if hasattr(self, 'seleccion') else None
+        plan = plan_lectura(self.get_serializer_class(), seleccion)
+        if plan is None or not getattr(settings, 'CATALOGO_LECTURA_RAPIDA', True):
+            return super().list(request, *args, **kwargs)
+
+        # Las columnas y relaciones las decide el plan: fuera only/select_related/prefetch del queryset
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).select_related(None).defer(None)
+        # La paginación por cursor necesita los campos de orden en cada fila
+        columnas = plan.columnas | set(getattr(self, 'cursor_ordering_fields', ()))
+        filas = queryset.values(*columnas)
+        page = self.paginate_queryset(filas)
+        if page is not None:
+            return self.get_paginated_response(plan.construir(page, queryset.db))
+        return Response(plan.construir(list(filas), queryset.db))
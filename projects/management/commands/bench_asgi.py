@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+
+from projects.models import Usuario
+from projects.tokens import RefreshToken
+
+from .bench_login import percentil
+
+
+RECURSOS = ('todos', 'personajes', 'mascotas', 'ediciones', 'skullectors')
+PARALELO = {'auto': None, 'si': True, 'no': False}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara req/s y latencia (p50/p99) de las lecturas del catálogo con mucha concurrencia: los viewsets "
+        "síncronos por WSGI (un hilo por petición, como un worker gthread de gunicorn) frente a las vistas "
+        "async de /api/v1/asincrono/ por ASGI (todas las peticiones en un bucle, como un worker de uvicorn). "
+        "Todo en este proceso, sin red, sobre la base de datos actual."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('recursos', nargs='*', help=f"Por defecto, todos: {', '.join(RECURSOS)}")
+        parser.add_argument('--peticiones', type=int, default=1000, help="Peticiones por medida (1000 por defecto)")
+        parser.add_argument('--concurrencia', type=int, default=64, help="Peticiones a la vez (64 por defecto)")
+        parser.add_argument('--con-cache', action='store_true', help="Con la caché de respuestas del catálogo (sin ella por defecto)")
+        parser.add_argument(
+            '--paralelo', choices=PARALELO, default='auto',
+            help="CATALOGO_ASYNC_PARALELO en ASGI: auto (según la base de datos, por defecto), si o no",
+        )
+
+    def handle(self, *args, **options):
+        desconocidos = set(options['recursos']) - set(RECURSOS)
+        if desconocidos:
+            raise CommandError(f"Recursos desconocidos: {', '.join(sorted(desconocidos))}")
+        usuario = Usuario.objects.filter(is_active=True).first()
+        if usuario is None:
+            raise CommandError("Hace falta al menos un usuario activo")
+        cabecera = f'Bearer {RefreshToken.for_user(usuario).access_token}'
+        ajustes = {
+            'CATALOGO_CACHE_ACTIVA': options['con_cache'],
+            'CATALOGO_ASYNC_PARALELO': PARALELO[options['paralelo']],
+        }
+
+        self.stdout.write(f"{options['peticiones']} peticiones, concurrencia {options['concurrencia']}")
+        with override_settings(**ajustes):
+            for recurso in options['recursos'] or RECURSOS:
+                self.stdout.write(recurso)
+                for nombre, medir, url in (
+                    ('wsgi', self.medir_wsgi, f'/api/v1/{recurso}/'),
+                    ('asgi', self.medir_asgi, f'/api/v1/asincrono/{recurso}/'),
+                ):
+                    tiempos, segundos = medir(url, cabecera, options['peticiones'], options['concurrencia'])
+                    self.stdout.write(
+                        f"  {nombre}  {len(tiempos) / segundos:>8.1f} req/s  p50 {percentil(tiempos, 50):>8.1f} ms  "
+                        f"p99 {percentil(tiempos, 99):>8.1f} ms"
+                    )
+
+    def medir_wsgi(self, url, cabecera, peticiones, concurrencia):
+        local = threading.local()
+
+        def pedir(_):
+            if not hasattr(local, 'cliente'):
+                local.cliente = Client(HTTP_AUTHORIZATION=cabecera)
+            antes = time.perf_counter()
+            respuesta = local.cliente.get(url)
+            if respuesta.status_code != 200:
+                raise CommandError(f"{url} ha respondido {respuesta.status_code}")
+            return (time.perf_counter() - antes) * 1000
+
+        with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+            inicio = time.perf_counter()
+            tiempos = list(executor.map(pedir, range(peticiones)))
+            segundos = time.perf_counter() - inicio
+        return tiempos, segundos
+
+    def medir_asgi(self, url, cabecera, peticiones, concurrencia):
+        async def medir():
+            cliente = AsyncClient()
+            pendientes = iter(range(peticiones))
+            tiempos = []
+
+            async def trabajador():
+                for _ in pendientes:
+                    antes = time.perf_counter()
+                    respuesta = await cliente.get(url, headers={'Authorization': cabecera})
+                    if respuesta.status_code != 200:
+                        raise CommandError(f"{url} ha respondido {respuesta.status_code}")
+                    tiempos.append((time.perf_counter() - antes) * 1000)
+
+            inicio = time.perf_counter()
+            await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+            return tiempos, time.perf_counter() - inicio
+
+        return asyncio.run(medir())
@@ -0,0 +1,311 @@
+import datetime
+import hashlib
+import io
+import json
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils.http import urlencode
+from PIL import Image
+from rest_framework.settings import api_settings
+
+from projects import urls
+from projects.models import Personajes, Mascotas, Ediciones, Skullectors, Foto, Usuario
+from projects.tokens import RefreshToken
+
+from .bench_login import percentil
+
+
+EMAIL = 'bench-carga@example.com'
+PASSWORD = 'bench-carga-123'
+# Los usuarios que crea el escenario de registro, que se borran al terminar
+DOMINIO_REGISTRO = 'bench-carga.example.com'
+# basename del router y modelo de cada recurso del catálogo
+RECURSOS = (
+    ('completo', Personajes),
+    ('personajes', Personajes),
+    ('mascotas', Mascotas),
+    ('ediciones', Ediciones),
+    ('skullectors', Skullectors),
+)
+# Ids al azar de cada modelo que recorren las peticiones de detalle y de bulk
+MUESTRA = 1000
+# Fotos distintas que pide el escenario de imágenes: la primera petición de cada una la descarga y genera sus
+# variantes, las demás se sirven de lo guardado
+FOTOS = 50
+# Filas de cada PATCH de bulk/
+FILAS_BULK = 10
+# Páginas de los listados que se recorren (las que haya si son menos)
+PAGINAS = 10
+
+
+def rutas():
+    # Nombres de todas las rutas de projects/urls.py (las de sufijo de formato del router repiten nombre)
+    return {patron.name for patron in urls.urlpatterns if patron.name}
+
+
+def descargar_sintetica(url, timeout, limite):
+    # Descargador para IMAGENES_FOTOS_DESCARGADOR sin red: un PNG de 800x600 de un color que sale de la URL
+    color = tuple(hashlib.md5(url.encode()).digest()[:3])
+    salida = io.BytesIO()
+    Image.new('RGB', (800, 600), color).save(salida, 'PNG')
+    return salida.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de todas las rutas de projects/urls.py sobre la base de datos actual (llénese antes "
+        "con generar_catalogo): N peticiones por ruta con C a la vez, un hilo por petición como un worker "
+        "gthread de gunicorn, todo en este proceso y sin red. Da req/s, latencia p50/p95/p99 y consultas por "
+        "petición de cada ruta y con --salida lo guarda en JSON (con el commit, el motor y el tamaño del "
+        "catálogo) para compararlo con --comparar entre commits. Escribe: los PATCH de bulk/ reescriben filas "
+        "del catálogo y se crea el usuario " + EMAIL + " si no está."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('rutas', nargs='*', help="Nombres de las rutas a medir (por defecto, todas)")
+        parser.add_argument('--peticiones', type=int, default=500, help="Peticiones por ruta (500 por defecto)")
+        parser.add_argument('--concurrencia', type=int, default=16, help="Peticiones a la vez (16 por defecto)")
+        parser.add_argument('--con-cache', action='store_true', help="Con la caché de respuestas del catálogo (sin ella por defecto)")
+        parser.add_argument('--semilla', type=int, default=0, help="Semilla para elegir las filas (0 por defecto)")
+        parser.add_argument('--salida', help="Fichero JSON donde guardar los resultados")
+        parser.add_argument('--comparar', help="JSON de una ejecución anterior con el que comparar")
+
+    def handle(self, *args, **options):
+        sin_escenario = rutas() - self.nombres()
+        if sin_escenario:
+            self.stderr.write(f"Rutas sin escenario, no se miden: {', '.join(sorted(sin_escenario))}")
+        desconocidas = set(options['rutas']) - self.nombres()
+        if desconocidas:
+            raise CommandError(f"Rutas desconocidas: {', '.join(sorted(desconocidas))}")
+        if options['peticiones'] < 1 or options['concurrencia'] < 1:
+            raise CommandError("--peticiones y --concurrencia deben ser positivos")
+        anterior = None
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as f:
+                anterior = json.load(f)
+            distintas = [
+                clave for clave in ('peticiones', 'concurrencia', 'con_cache')
+                if anterior.get('opciones', {}).get(clave) != options[clave]
+            ]
+            if distintas:
+                self.stderr.write(f"{options['comparar']} se midió con otro {', '.join(distintas)}: la comparación es orientativa")
+
+        self.peticiones = options['peticiones']
+        self.preparar(options['semilla'])
+        ajustes = {
+            'CATALOGO_CACHE_ACTIVA': options['con_cache'],
+            'IMAGENES_FOTOS_DESCARGADOR': 'projects.management.commands.bench_carga.descargar_sintetica',
+        }
+        filas = {modelo._meta.model_name: modelo.objects.count() for modelo in (Personajes, Mascotas, Ediciones, Skullectors, Foto)}
+        self.stdout.write(
+            f"{options['peticiones']} peticiones por ruta, concurrencia {options['concurrencia']} ({connection.vendor}, "
+            + ', '.join(f"{total} {nombre}" for nombre, total in filas.items()) + ")"
+        )
+
+        resultados = {}
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media, **ajustes):
+            ejecutor = ThreadPoolExecutor(max_workers=options['concurrencia']) if options['concurrencia'] > 1 else None
+            try:
+                for nombre, metodo, peticion in self.escenarios():
+                    if options['rutas'] and nombre not in options['rutas']:
+                        continue
+                    resultados[nombre] = resultado = self.medir(ejecutor, nombre, metodo, peticion)
+                    self.informar(nombre, resultado, (anterior or {}).get('rutas', {}).get(nombre))
+            finally:
+                if ejecutor is not None:
+                    self.cerrar(ejecutor, options['concurrencia'])
+                Usuario.objects.filter(email__endswith=f'@{DOMINIO_REGISTRO}').delete()
+
+        if options['salida']:
+            datos = {
+                'fecha': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                'commit': self.commit(),
+                'motor': connection.vendor,
+                'filas': filas,
+                'opciones': {clave: options[clave] for clave in ('peticiones', 'concurrencia', 'con_cache', 'semilla')},
+                'rutas': resultados,
+            }
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                json.dump(datos, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Resultados en {options['salida']}")
+
+    def nombres(self):
+        return {nombre for nombre, _, _ in self.escenarios(muestra=False)}
+
+    def preparar(self, semilla):
+        usuario = Usuario.objects.filter(email=EMAIL).first()
+        if usuario is None:
+            usuario = Usuario.objects.create_user(username='bench-carga', email=EMAIL, password=PASSWORD)
+        elif not usuario.check_password(PASSWORD):
+            raise CommandError(f"{EMAIL} existe con otra contraseña")
+        # Administrador: los PATCH de bulk/ y las estadísticas de la caché lo piden
+        if not usuario.is_staff:
+            usuario.is_staff = True
+            usuario.save(update_fields=['is_staff'])
+        self.usuario = usuario
+        self.cabecera = f'Bearer {RefreshToken.for_user(usuario).access_token}'
+
+        # Las mismas filas en cada ejecución con la misma semilla y el mismo catálogo
+        azar = random.Random(semilla)
+        self.ids, self.paginas = {}, {}
+        for modelo in (Personajes, Mascotas, Ediciones, Skullectors, Foto):
+            pks = list(modelo.objects.order_by('pk').values_list('pk', flat=True))
+            if not pks:
+                raise CommandError(f"No hay {modelo._meta.verbose_name_plural}: llene antes el catálogo con generar_catalogo")
+            self.ids[modelo] = azar.sample(pks, min(MUESTRA, len(pks)))
+            self.paginas[modelo] = min(PAGINAS, -(-len(pks) // api_settings.PAGE_SIZE))
+        self.fotos = list(Foto.objects.filter(pk__in=self.ids[Foto][:FOTOS]).order_by('pk').values_list('url', flat=True))
+        self.sufijo = f'{int(time.time()) % 10 ** 6:06d}'
+
+    def escenarios(self, muestra=True):
+        # (nombre de la ruta, método, función que da la URL y el cuerpo de la petición número i). Con muestra=False
+        # solo hacen falta los nombres: las funciones no se llaman
+        ids, paginas = (self.ids, self.paginas) if muestra else ({}, {})
+
+        def elegir(modelo, i, n=1):
+            lista = ids[modelo]
+            return [lista[(i * n + k) % len(lista)] for k in range(n)]
+
+        for basename, modelo in RECURSOS:
+            yield f'{basename}-list', 'get', lambda i, b=basename, m=modelo: (reverse(f'{b}-list') + f'?page={i % paginas[m] + 1}', None)
+            yield f'{basename}-detail', 'get', lambda i, b=basename, m=modelo: (reverse(f'{b}-detail', args=elegir(m, i)), None)
+            yield f'asincrono-{basename}-list', 'get', lambda i, b=basename, m=modelo: (reverse(f'asincrono-{b}-list') + f'?page={i % paginas[m] + 1}', None)
+            yield f'asincrono-{basename}-detail', 'get', lambda i, b=basename, m=modelo: (reverse(f'asincrono-{b}-detail', args=elegir(m, i)), None)
+            yield f'{basename}-facetas', 'get', lambda i, b=basename: (reverse(f'{b}-facetas'), None)
+            if basename != 'mascotas':
+                yield f'{basename}-cronologia', 'get', lambda i, b=basename: (reverse(f'{b}-cronologia') + f"?por={('mes', 'anio')[i % 2]}", None)
+            if basename != 'completo':
+                yield f'{basename}-bulk', 'patch', lambda i, b=basename, m=modelo: (
+                    reverse(f'{b}-bulk'), [{'id': pk, **self.cambio(b, i)} for pk in elegir(m, i, FILAS_BULK)],
+                )
+        # Un trozo del catálogo (las de una edad, ~1/1600 de los personajes generados), no el catálogo entero
+        yield 'completo-exportar', 'get', lambda i: (reverse('completo-exportar') + f"?formato={('ndjson', 'csv')[i % 2]}&edad={15 + i % 1600}", None)
+        yield 'skullectors-tendencias', 'get', lambda i: (reverse('skullectors-tendencias') + f"?periodo={('dia', 'mes')[i % 2]}", None)
+        yield 'skullectors-precios', 'get', lambda i: (reverse('skullectors-precios', args=elegir(Skullectors, i)), None)
+        yield 'usuarios-list', 'get', lambda i: (reverse('usuarios-list'), None)
+        yield 'usuarios-detail', 'get', lambda i: (reverse('usuarios-detail', args=[self.usuario.pk]), None)
+        yield 'api-root', 'get', lambda i: (reverse('api-root'), None)
+        yield 'cache_estadisticas', 'get', lambda i: (reverse('cache_estadisticas'), None)
+        yield 'imagen_foto', 'get', lambda i: (
+            reverse('imagen_foto') + '?' + urlencode({'url': self.fotos[i % len(self.fotos)], 'ancho': (160, 320, 640)[i % 3]}), None,
+        )
+        yield 'login', 'post', lambda i: (reverse('login'), {'email': EMAIL, 'password': PASSWORD})
+        yield 'register', 'post', lambda i: (reverse('register'), {
+            'username': f'bc{self.sufijo}{i}', 'email': f'bc{self.sufijo}{i}@{DOMINIO_REGISTRO}', 'password': PASSWORD,
+        })
+        # Cada refresh token sirve una vez (rotación y lista negra): uno nuevo para cada petición
+        yield 'token_refresh', 'post', lambda i: (reverse('token_refresh'), {'refresh': self.tokens[i]})
+        yield 'logout', 'post', lambda i: (reverse('logout'), {'refresh': self.tokens[i]})
+
+    def cambio(self, basename, i):
+        # Lo que reescribe cada PATCH de bulk/ (los nombres de generar_catalogo son únicos: el tipo de las mascotas
+        # no hace chocar su clave natural)
+        if basename == 'personajes':
+            return {'frase': f"Frase de la prueba de carga {i}"}
+        if basename == 'mascotas':
+            return {'tipo': ('Murciélago', 'Gato', 'Perro')[i % 3]}
+        if basename == 'ediciones':
+            return {'generacion': i % 3 + 1}
+        return {'precioMercado': f'{40 + i % 60}.00'}
+
+    def medir(self, ejecutor, nombre, metodo, peticion):
+        # Las URLs y los cuerpos se preparan antes de medir, igual que los refresh tokens de un solo uso
+        if nombre in ('token_refresh', 'logout'):
+            self.tokens = [str(RefreshToken.for_user(self.usuario)) for _ in range(self.peticiones)]
+        trabajos = [peticion(i) for i in range(self.peticiones)]
+        local = threading.local()
+
+        def pedir(trabajo):
+            url, datos = trabajo
+            if not hasattr(local, 'cliente'):
+                # Un error de la vista cuenta como un 500 más, no para la prueba
+                local.cliente = Client(raise_request_exception=False, HTTP_AUTHORIZATION=self.cabecera)
+            consultas = 0
+
+            def contar(execute, sql, params, many, context):
+                nonlocal consultas
+                consultas += 1
+                return execute(sql, params, many, context)
+
+            antes = time.perf_counter()
+            # connection es la de este hilo: solo cuenta las consultas de esta petición
+            with connection.execute_wrapper(contar):
+                if datos is None:
+                    respuesta = getattr(local.cliente, metodo)(url)
+                else:
+                    respuesta = getattr(local.cliente, metodo)(url, json.dumps(datos), content_type='application/json')
+                if respuesta.streaming:
+                    # Exportar e imágenes: las consultas y el trabajo se hacen al consumir la respuesta
+                    for _ in respuesta.streaming_content:
+                        pass
+            return (time.perf_counter() - antes) * 1000, respuesta.status_code, consultas
+
+        inicio = time.perf_counter()
+        # Con concurrencia 1, en este mismo hilo y con su conexión
+        medidas = list((ejecutor.map if ejecutor is not None else map)(pedir, trabajos))
+        segundos = time.perf_counter() - inicio
+
+        tiempos = [ms for ms, _, _ in medidas]
+        consultas = [n for _, _, n in medidas]
+        return {
+            'url': trabajos[0][0],
+            'metodo': metodo.upper(),
+            'peticiones': len(medidas),
+            'req_s': round(len(medidas) / segundos, 1),
+            'p50_ms': round(percentil(tiempos, 50), 2),
+            'p95_ms': round(percentil(tiempos, 95), 2),
+            'p99_ms': round(percentil(tiempos, 99), 2),
+            'consultas': round(sum(consultas) / len(consultas), 2),
+            'consultas_max': max(consultas),
+            'codigos': {str(codigo): total for codigo, total in sorted(Counter(codigo for _, codigo, _ in medidas).items())},
+        }
+
+    def cerrar(self, ejecutor, hilos):
+        # Cada hilo del pool cierra su conexión (la barrera hace que cada uno reciba exactamente una tarea)
+        barrera = threading.Barrier(hilos)
+
+        def cerrar(_):
+            barrera.wait()
+            connection.close()
+
+        list(ejecutor.map(cerrar, range(hilos)))
+        ejecutor.shutdown()
+
+    def informar(self, nombre, resultado, anterior):
+        linea = (
+            f"  {nombre:<30} {resultado['req_s']:>8.1f} req/s  p50 {resultado['p50_ms']:>8.1f} ms  "
+            f"p95 {resultado['p95_ms']:>8.1f} ms  p99 {resultado['p99_ms']:>8.1f} ms  {resultado['consultas']:>6.1f} consultas"
+        )
+        if anterior:
+            linea += (
+                f"  | req/s {self.diferencia(resultado['req_s'], anterior['req_s'])}  "
+                f"p95 {self.diferencia(resultado['p95_ms'], anterior['p95_ms'])}  "
+                f"consultas {resultado['consultas'] - anterior['consultas']:+.1f}"
+            )
+        errores = {codigo: total for codigo, total in resultado['codigos'].items() if not codigo.startswith(('2', '3'))}
+        if errores:
+            linea += '  errores: ' + ', '.join(f"{total}x{codigo}" for codigo, total in errores.items())
+        self.stdout.write(linea)
+
+    def diferencia(self, actual, anterior):
+        return f"{(actual - anterior) / anterior * 100:+.0f}%" if anterior else 'n/d'
+
+    def commit(self):
+        # El commit medido, para poder comparar ejecuciones; None fuera de un repositorio git
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
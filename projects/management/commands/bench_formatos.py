@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from projects.documentos import DocumentoCompletoSerializer
+from projects.models import Personajes, Skullectors
+from projects.renderers import MessagePackRenderer, OrjsonRenderer, msgpack, orjson
+from projects.serializers import SkullectorCompletaSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el rendimiento de los renderers (JSON de DRF, orjson y MessagePack) con páginas reales "
+        "de /todos/ y /skullectors/ sacadas de la base de datos actual: filas/s, MB/s y tamaño de la respuesta."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=1000, help="Filas por página (1000 por defecto)")
+        parser.add_argument('--repeticiones', type=int, default=5, help="Pasadas por medida; se queda la mejor")
+
+    def handle(self, *args, **options):
+        filas = options['filas']
+        paginas = {
+            'todos': DocumentoCompletoSerializer(
+                Personajes.objects.select_related('documento').order_by('id')[:filas], many=True
+            ).data,
+            'skullectors': SkullectorCompletaSerializer(
+                Skullectors.objects.select_related('muneca').prefetch_related('fotos', 'muneca__fotos').order_by('id')[:filas], many=True
+            ).data,
+        }
+        renderers = [('json (DRF)', JSONRenderer())]
+        if orjson is not None:
+            renderers.append(('orjson', OrjsonRenderer()))
+        if msgpack is not None:
+            renderers.append(('msgpack', MessagePackRenderer()))
+
+        for nombre, datos in paginas.items():
+            if not datos:
+                self.stdout.write(f"{nombre}: sin datos")
+                continue
+            self.stdout.write(f"{nombre} ({len(datos)} filas)")
+            base = None
+            for formato, renderer in renderers:
+                segundos, contenido = self.medir(renderer, datos, options['repeticiones'])
+                base = base or segundos
+                self.stdout.write(
+                    f"  {formato:<11} {len(datos) / segundos:>10.0f} filas/s  {len(contenido) / segundos / 1e6:>8.1f} MB/s  "
+                    f"{len(contenido):>10} bytes  (x{base / segundos:.1f})"
+                )
+
+    def medir(self, renderer, datos, repeticiones):
+        mejor, contenido = None, None
+        for _ in range(max(1, repeticiones)):
+            inicio = time.perf_counter()
+            contenido = renderer.render(datos, renderer.media_type, {})
+            segundos = time.perf_counter() - inicio
+            mejor = segundos if mejor is None else min(mejor, segundos)
+        return mejor, contenido
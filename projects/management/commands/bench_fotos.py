@@ -0,0 +1,170 @@
+import hashlib
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from projects.models import hash_url
+
+
+TABLA_PADRES = 'bench_fotos_padres'
+# (nombre, tabla, DDL): la Foto de antes (la URL como clave y un índice entero por FK) y la de ahora (clave
+# entera, url_hash único e índices parciales). Solo se mide munieca: las otras tres FK son iguales
+ESQUEMAS = (
+    ('url como clave', 'bench_fotos_url', (
+        "CREATE TABLE bench_fotos_url (url varchar(200) NOT NULL PRIMARY KEY, munieca_id integer NULL, "
+        "edicion_id integer NULL, skullector_id integer NULL, mascota_id integer NULL, fecha_subida timestamp NOT NULL)",
+        *(f"CREATE INDEX bench_fotos_url_{fk} ON bench_fotos_url ({fk})" for fk in ('munieca_id', 'edicion_id', 'skullector_id', 'mascota_id')),
+    )),
+    ('id + url_hash', 'bench_fotos_id', (
+        "CREATE TABLE bench_fotos_id (id integer NOT NULL PRIMARY KEY, url varchar(200) NOT NULL, url_hash bigint NOT NULL UNIQUE, "
+        "munieca_id integer NULL, edicion_id integer NULL, skullector_id integer NULL, mascota_id integer NULL, "
+        "fecha_subida timestamp NOT NULL)",
+        *(
+            f"CREATE INDEX bench_fotos_id_{fk} ON bench_fotos_id ({fk}) WHERE {fk} IS NOT NULL"
+            for fk in ('munieca_id', 'edicion_id', 'skullector_id', 'mascota_id')
+        ),
+    )),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la tabla de Foto con la URL como clave primaria (como hasta 0015) y con clave entera, url_hash "
+        "único e índices parciales en las FK: inserción, precarga de fotos (la consulta de prefetch_related), "
+        "join desde los personajes, búsqueda por URL y tamaño en disco. Crea tablas bench_fotos_* con datos "
+        "sintéticos en la base de datos actual y las borra al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fotos', type=int, default=100000, help="Filas de cada tabla (100000 por defecto)")
+        parser.add_argument('--lote', type=int, default=100, help="Personajes por consulta de precarga (100 por defecto)")
+        parser.add_argument('--consultas', type=int, default=200, help="Consultas por medida (200 por defecto)")
+
+    def handle(self, *args, **options):
+        fotos = max(4, options['fotos'])
+        # Una de cada cuatro fotos es de un personaje, y cada personaje tiene dos
+        padres = max(1, fotos // 8)
+        filas = self.generar(fotos, padres)
+        azar = random.Random(0)
+        lotes = [azar.sample(range(1, padres + 1), min(options['lote'], padres)) for _ in range(options['consultas'])]
+        urls = [filas[azar.randrange(fotos)][1] for _ in range(options['consultas'])]
+
+        self.stdout.write(f"{fotos} fotos, {padres} personajes, {options['lote']} personajes por precarga ({connection.vendor})")
+        resultados = {}
+        try:
+            self.crear(TABLA_PADRES, [f"CREATE TABLE {TABLA_PADRES} (id integer NOT NULL PRIMARY KEY)"])
+            self.insertar(f"INSERT INTO {TABLA_PADRES} (id) VALUES (%s)", [(pk,) for pk in range(1, padres + 1)])
+            for nombre, tabla, ddl in ESQUEMAS:
+                self.crear(tabla, ddl)
+                resultados[nombre] = self.medir(tabla, filas, lotes, urls)
+        finally:
+            with connection.cursor() as cursor:
+                for tabla in [TABLA_PADRES] + [tabla for _, tabla, _ in ESQUEMAS]:
+                    cursor.execute(f"DROP TABLE IF EXISTS {tabla}")
+
+        nombres = [nombre for nombre, _, _ in ESQUEMAS]
+        self.stdout.write(f"  {'':<14}" + ''.join(f"{nombre:>18}" for nombre in nombres))
+        for medida, unidad in (('insertar', 'ms'), ('precarga', 'ms'), ('join', 'ms'), ('por url', 'ms'), ('tabla', 'KB'), ('índices', 'KB')):
+            valores = [resultados[nombre][medida] for nombre in nombres]
+            linea = f"  {medida:<14}" + ''.join(f"{'n/d' if valor is None else f'{valor:.2f} {unidad}':>18}" for valor in valores)
+            if None not in valores and valores[1]:
+                linea += f"  (x{valores[0] / valores[1]:.2f})"
+            self.stdout.write(linea)
+
+    def generar(self, fotos, padres):
+        # URLs del tamaño de las del catálogo (imágenes de la wiki, ~110 caracteres)
+        ahora = timezone.now()
+        filas = []
+        for n in range(fotos):
+            resumen = hashlib.md5(str(n).encode()).hexdigest()
+            url = (
+                f"https://static.wikia.nocookie.net/monsterhigh/images/{resumen[0]}/{resumen[:2]}/"
+                f"Foto_{n:07d}_{resumen[:12]}.png/revision/latest?cb=2020{n:08d}"
+            )
+            fks = [None] * 4
+            fks[n % 4] = (n // 4) % padres + 1
+            filas.append((n + 1, url, hash_url(url), *fks, ahora))
+        return filas
+
+    def crear(self, tabla, ddl):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {tabla}")
+            for sentencia in ddl:
+                cursor.execute(sentencia)
+
+    def insertar(self, sql, filas):
+        with transaction.atomic(), connection.cursor() as cursor:
+            for inicio in range(0, len(filas), 1000):
+                cursor.executemany(sql, filas[inicio:inicio + 1000])
+
+    def medir(self, tabla, filas, lotes, urls):
+        con_id = tabla == 'bench_fotos_id'
+        columnas = 'id, url, url_hash, munieca_id, edicion_id, skullector_id, mascota_id, fecha_subida' if con_id else \
+            'url, munieca_id, edicion_id, skullector_id, mascota_id, fecha_subida'
+        valores = filas if con_id else [fila[1:2] + fila[3:] for fila in filas]
+        resultado = {}
+
+        inicio = time.perf_counter()
+        self.insertar(f"INSERT INTO {tabla} ({columnas}) VALUES ({', '.join(['%s'] * len(valores[0]))})", valores)
+        resultado['insertar'] = (time.perf_counter() - inicio) * 1000
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {tabla}")
+            cursor.execute(f"ANALYZE {TABLA_PADRES}")
+
+        clave = 'id' if con_id else 'url'
+        consultas = {
+            # Lo que pide prefetch_related('fotos') por cada página de personajes
+            'precarga': lambda lote: (f"SELECT {columnas} FROM {tabla} WHERE munieca_id IN ({', '.join(['%s'] * len(lote))})", lote),
+            # Join por la FK, como un annotate(Count('fotos')) o un filter(fotos__...)
+            'join': lambda lote: (
+                f"SELECT p.id, COUNT(f.{clave}) FROM {TABLA_PADRES} p LEFT JOIN {tabla} f ON f.munieca_id = p.id "
+                f"WHERE p.id IN ({', '.join(['%s'] * len(lote))}) GROUP BY p.id",
+                lote,
+            ),
+        }
+        with connection.cursor() as cursor:
+            for medida, consulta in consultas.items():
+                resultado[medida] = self.cronometrar(cursor, [consulta(lote) for lote in lotes])
+            resultado['por url'] = self.cronometrar(cursor, [
+                (f"SELECT {columnas} FROM {tabla} WHERE url_hash = %s AND url = %s", [hash_url(url), url]) if con_id
+                else (f"SELECT {columnas} FROM {tabla} WHERE url = %s", [url])
+                for url in urls
+            ])
+        resultado['tabla'], resultado['índices'] = self.tamanio(tabla)
+        return resultado
+
+    def cronometrar(self, cursor, consultas):
+        # Una pasada para calentar la caché y otra medida; ms por consulta
+        for sql, parametros in consultas:
+            cursor.execute(sql, parametros)
+            cursor.fetchall()
+        inicio = time.perf_counter()
+        for sql, parametros in consultas:
+            cursor.execute(sql, parametros)
+            cursor.fetchall()
+        return (time.perf_counter() - inicio) * 1000 / len(consultas)
+
+    def tamanio(self, tabla):
+        # KB de la tabla y de sus índices; None si el motor no lo dice (SQLite sin dbstat)
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute("SELECT pg_table_size(%s), pg_indexes_size(%s)", [tabla, tabla])
+                    datos, indices = cursor.fetchone()
+                elif connection.vendor == 'sqlite':
+                    cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = %s", [tabla])
+                    datos = cursor.fetchone()[0]
+                    cursor.execute(
+                        "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                        "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+                        [tabla],
+                    )
+                    indices = cursor.fetchone()[0]
+                else:
+                    return None, None
+        except DatabaseError:
+            return None, None
+        return datos / 1024, (indices or 0) / 1024
@@ -0,0 +1,94 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.utils.encoders import JSONEncoder
+
+from projects.api import CompletoViewSet, PersonajesViewSet, MascotasViewSet, EdicionesViewSet, SkullectorViewSet
+from projects.campos import optimizar
+from projects.documentos import DocumentoCompletoSerializer
+from projects.lectura import plan_lectura
+from projects.models import Personajes
+
+
+VISTAS = {
+    'todos': CompletoViewSet,
+    'personajes': PersonajesViewSet,
+    'mascotas': MascotasViewSet,
+    'ediciones': EdicionesViewSet,
+    'skullectors': SkullectorViewSet,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara filas/s del listado con el serializador de cada viewset (con las mismas precargas que usa "
+        "el viewset) frente a la lectura rápida desde .values() (projects/lectura.py) y, en todos, frente a "
+        "los documentos precalculados. Comprueba que todas las salidas son idénticas. "
+        "Usa los datos de la base de datos actual."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('vistas', nargs='*', help=f"Por defecto, todas: {', '.join(sorted(VISTAS))}")
+        parser.add_argument('--filas', type=int, default=1000, help="Filas por pasada (1000 por defecto)")
+        parser.add_argument('--repeticiones', type=int, default=5, help="Pasadas por medida; se queda la mejor")
+
+    def handle(self, *args, **options):
+        desconocidas = set(options['vistas']) - set(VISTAS)
+        if desconocidas:
+            raise CommandError(f"Vistas desconocidas: {', '.join(sorted(desconocidas))}")
+        for nombre in options['vistas'] or sorted(VISTAS):
+            vista = VISTAS[nombre]
+            plan = plan_lectura(vista.serializer_class)
+            if plan is None:
+                self.stdout.write(f"{nombre}: el serializador no admite lectura rápida")
+                continue
+            filas = options['filas']
+            queryset = self.precargado(vista).order_by('pk')[:filas]
+
+            def serializador():
+                return vista.serializer_class(list(queryset), many=True).data
+
+            def rapida():
+                return plan.construir(list(queryset.values(*plan.columnas)), queryset.db)
+
+            def documentos():
+                return DocumentoCompletoSerializer(list(Personajes.objects.select_related('documento').order_by('pk')[:filas]), many=True).data
+
+            alternativas = [('lectura rápida', rapida)]
+            if vista is CompletoViewSet:
+                alternativas.append(('documentos', documentos))
+
+            antes, datos_antes = self.medir(serializador, options['repeticiones'])
+            medidas = []
+            for etiqueta, funcion in alternativas:
+                despues, datos_despues = self.medir(funcion, options['repeticiones'])
+                if self.json(datos_antes) != self.json(datos_despues):
+                    raise CommandError(f"{nombre}: {etiqueta} no produce la misma salida que {vista.serializer_class.__name__}")
+                medidas.append((etiqueta, despues))
+            if not datos_antes:
+                self.stdout.write(f"{nombre}: sin datos")
+                continue
+            filas = len(datos_antes)
+            self.stdout.write(f"{nombre:<12} {filas} filas  serializador {filas / antes:>10.0f} filas/s" + "".join(
+                f"  {etiqueta} {filas / despues:>10.0f} filas/s  (x{antes / despues:.1f})" for etiqueta, despues in medidas
+            ))
+
+    def precargado(self, vista):
+        # El queryset con el que el viewset pinta el serializador: /todos/ con completo() y el resto
+        # ajustado por optimizar() (campos.py). Sin precargas la comparación saldría a favor de la lectura rápida
+        if vista is CompletoViewSet:
+            return Personajes.objects.completo()
+        return optimizar(vista.queryset.model.objects.all(), vista.serializer_class())
+
+    def medir(self, funcion, repeticiones):
+        mejor, datos = None, None
+        for _ in range(max(1, repeticiones)):
+            inicio = time.perf_counter()
+            datos = funcion()
+            segundos = time.perf_counter() - inicio
+            mejor = segundos if mejor is None else min(mejor, segundos)
+        return mejor, datos
+
+    def json(self, datos):
+        return json.dumps(datos, cls=JSONEncoder, ensure_ascii=False)
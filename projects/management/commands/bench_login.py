@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+
+from projects.hashing import pool_hashing
+from projects.models import Usuario
+from projects.tokens import RefreshToken
+
+
+EMAIL = 'bench-login@example.com'
+PASSWORD = 'bench-login-123'
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Latencia de las lecturas del catálogo (p50/p95/p99) sin carga y durante una ráfaga de logins "
+        "concurrentes, primero con cada login cifrando en su propio hilo (HASHING_HILOS = 0, como antes) y "
+        "después con el pool de projects/hashing.py. Todo en este proceso, con un hilo por petición como un "
+        "worker gthread de gunicorn, sobre la base de datos actual (crea el usuario " + EMAIL + " si no está)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/api/v1/personajes/', help="Lectura que se mide (/api/v1/personajes/ por defecto)")
+        parser.add_argument('--lecturas', type=int, default=200, help="Lecturas medidas por escenario")
+        parser.add_argument('--logins', type=int, default=16, help="Hilos haciendo login sin parar durante la ráfaga")
+        parser.add_argument('--hilos', type=int, default=None, help="HASHING_HILOS del pool (por defecto el de settings)")
+        parser.add_argument('--cola', type=int, default=None, help="HASHING_COLA del pool (por defecto el de settings)")
+        parser.add_argument('--sin-cache', action='store_true', help="Sin la caché de respuestas del catálogo")
+
+    def handle(self, *args, **options):
+        usuario = Usuario.objects.filter(email=EMAIL).first()
+        if usuario is None:
+            usuario = Usuario.objects.create_user(username='bench-login', email=EMAIL, password=PASSWORD)
+        elif not usuario.check_password(PASSWORD):
+            raise CommandError(f"{EMAIL} existe con otra contraseña")
+        token = str(RefreshToken.for_user(usuario).access_token)
+
+        hilos = options['hilos'] if options['hilos'] is not None else getattr(settings, 'HASHING_HILOS', None)
+        cola = options['cola'] if options['cola'] is not None else getattr(settings, 'HASHING_COLA', 16)
+        ajustes = {'CATALOGO_CACHE_TIMEOUT': 0} if options['sin_cache'] else {}
+        escenarios = [
+            ('sin ráfaga', 0, {}),
+            ('ráfaga sin pool', options['logins'], {'HASHING_HILOS': 0}),
+            ('ráfaga con pool', options['logins'], {'HASHING_HILOS': hilos, 'HASHING_COLA': cola}),
+        ]
+        self.stdout.write(f"{options['url']}, {options['lecturas']} lecturas por escenario, {options['logins']} hilos de login")
+        for nombre, logins, pool in escenarios:
+            with override_settings(**ajustes, **pool):
+                pool_hashing.cerrar()
+                try:
+                    tiempos, respuestas, segundos = self.medir(options['url'], token, options['lecturas'], logins)
+                finally:
+                    pool_hashing.cerrar()
+            linea = (
+                f"  {nombre:<16} lectura p50 {percentil(tiempos, 50):>7.1f} ms  p95 {percentil(tiempos, 95):>7.1f} ms  "
+                f"p99 {percentil(tiempos, 99):>7.1f} ms"
+            )
+            if logins:
+                linea += f"  | logins {respuestas[200] / segundos:>6.1f}/s  503: {respuestas[503]}"
+                otras = sum(total for codigo, total in respuestas.items() if codigo not in (200, 503))
+                if otras:
+                    linea += f"  otros: {otras}"
+            self.stdout.write(linea)
+
+    def medir(self, url, token, lecturas, logins):
+        parar = threading.Event()
+        lock = threading.Lock()
+        respuestas = Counter()
+        cuerpo = json.dumps({'email': EMAIL, 'password': PASSWORD})
+
+        def rafaga():
+            cliente = Client()
+            try:
+                while not parar.is_set():
+                    codigo = cliente.post('/api/v1/login/', cuerpo, content_type='application/json').status_code
+                    with lock:
+                        respuestas[codigo] += 1
+                    if codigo == 503:
+                        # Lo que haría un cliente con Retry-After, en corto
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=rafaga) for _ in range(logins)]
+        for hilo in hilos:
+            hilo.start()
+        if hilos:
+            time.sleep(0.5)
+
+        cliente = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        tiempos = []
+        try:
+            with lock:
+                respuestas.clear()
+            inicio = time.perf_counter()
+            for _ in range(max(1, lecturas)):
+                antes = time.perf_counter()
+                respuesta = cliente.get(url)
+                tiempos.append((time.perf_counter() - antes) * 1000)
+                if respuesta.status_code != 200:
+                    raise CommandError(f"{url} ha respondido {respuesta.status_code}")
+            segundos = time.perf_counter() - inicio
+        finally:
+            parar.set()
+            for hilo in hilos:
+                hilo.join()
+        return tiempos, respuestas, segundos
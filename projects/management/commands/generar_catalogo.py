@@ -0,0 +1,165 @@
+import datetime
+import hashlib
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from projects.bulk import despues_de_escribir, preparar
+from projects.cache import invalidar
+from projects.models import Personajes, Mascotas, Ediciones, Skullectors, Foto
+from projects.precios import registrar_precios
+
+
+NOMBRES = (
+    'Draculaura', 'Clawdeen', 'Frankie', 'Cleo', 'Lagoona', 'Ghoulia', 'Abbey', 'Spectra', 'Operetta', 'Toralei',
+    'Venus', 'Robecca', 'Rochelle', 'Howleen', 'Catty', 'Twyla', 'Jinafire', 'Skelita', 'Gigi', 'Elissabat',
+)
+MONSTRUOS = (
+    'Vampiro', 'Hombre lobo', 'Frankenstein', 'Momia', 'Monstruo marino', 'Zombi', 'Yeti', 'Fantasma', 'Gárgola',
+    'Gorgona', 'Dragón', 'Genio', 'Esqueleto', 'Planta carnívora', 'Hada',
+)
+CIUDADES = ('Transilvania', 'Londres', 'El Cairo', 'Nueva Orleans', 'Gran Arrecife', 'Himalaya', 'Boo York', 'Scaris', 'Salem', 'Ciudad de México')
+COLORES = ('Rosa', 'Negro', 'Morado', 'Verde', 'Azul', 'Rojo', 'Dorado', 'Plateado', 'Turquesa', 'Naranja')
+TIPOS_MASCOTA = ('Murciélago', 'Gato', 'Perro', 'Serpiente', 'Araña', 'Piraña', 'Búho', 'Caracol', 'Dragón', 'Mamut')
+SERIES = (
+    'Basic', 'Dawn of the Dance', 'Dead Tired', 'Sweet 1600', 'Ghouls Rule', 'Skultimate Roller Maze', 'Scaris',
+    'Freak du Chic', 'Boo York', 'Ghouls Getaway', 'Great Scarrier Reef', 'Haunted', 'Frights, Camera, Action',
+)
+
+
+def repartir(numero, proporcion):
+    # Cuántas filas le tocan a la número n (desde 0) para que el total sea proporcion * n sin azar
+    return int((numero + 1) * proporcion) - int(numero * proporcion)
+
+
+def url_foto(tipo, clave, numero):
+    # Del tamaño de las del catálogo (imágenes de la wiki, ~110 caracteres) y única para cada fila
+    resumen = hashlib.md5(f'{tipo}-{clave}-{numero}'.encode()).hexdigest()
+    return (
+        f"https://static.wikia.nocookie.net/monsterhigh/images/{resumen[0]}/{resumen[:2]}/"
+        f"{tipo}_{clave}_{numero}_{resumen[:12]}.png/revision/latest"
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Llena el catálogo con datos sintéticos para las pruebas de carga (bench_carga): N personajes con sus "
+        "mascotas, ediciones, skullectors, fotos e historial de precios en la proporción indicada. Escribe por "
+        "lotes como la importación (derivados, índice de búsqueda, documentos de /todos/ y resúmenes de "
+        "precios incluidos) y se puede volver a ejecutar para añadir más: la numeración sigue donde se quedó."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--personajes', type=int, default=10000, help="Personajes a crear (10000 por defecto)")
+        parser.add_argument('--mascotas', type=float, default=0.6, help="Mascotas por personaje (0.6 por defecto)")
+        parser.add_argument('--ediciones', type=float, default=3, help="Ediciones por personaje (3 por defecto)")
+        parser.add_argument('--skullectors', type=float, default=0.5, help="Skullectors por personaje (0.5 por defecto)")
+        parser.add_argument('--fotos', type=float, default=1.5, help="Fotos por personaje, mascota, edición y skullector (1.5 por defecto)")
+        parser.add_argument('--precios', type=int, default=6, help="Precios en el historial de cada skullector (6 por defecto)")
+        parser.add_argument('--lote', type=int, default=1000, help="Personajes por transacción (1000 por defecto)")
+        parser.add_argument('--semilla', type=int, default=0, help="Semilla del generador (0 por defecto)")
+
+    def handle(self, *args, **options):
+        if options['personajes'] < 1 or options['lote'] < 1:
+            raise CommandError("--personajes y --lote deben ser positivos")
+        if min(options['mascotas'], options['ediciones'], options['skullectors'], options['fotos'], options['precios']) < 0:
+            raise CommandError("Las proporciones no pueden ser negativas")
+        self.options = options
+        self.azar = random.Random(options['semilla'])
+        self.ahora = timezone.now()
+        self.totales = dict.fromkeys(('personajes', 'mascotas', 'ediciones', 'skullectors', 'fotos', 'precios'), 0)
+        # Los números siguen a los ya generados: nombres, descripciones y URLs no chocan con sus claves únicas
+        primero = (Personajes.objects.aggregate(maximo=Max('id'))['maximo'] or 0) + 1
+
+        inicio = time.monotonic()
+        for desde in range(0, options['personajes'], options['lote']):
+            numeros = range(primero + desde, primero + min(desde + options['lote'], options['personajes']))
+            with transaction.atomic():
+                self.generar_lote(numeros)
+            hechos = desde + len(numeros)
+            segundos = time.monotonic() - inicio
+            self.stdout.write(f"{hechos}/{options['personajes']} personajes ({hechos / segundos if segundos else 0:.0f}/s)")
+        invalidar(Mascotas, Ediciones, Skullectors, Foto)
+        self.stdout.write(self.style.SUCCESS(', '.join(f"{total} {nombre}" for nombre, total in self.totales.items())))
+
+    def generar_lote(self, numeros):
+        azar = self.azar
+        personajes = [self.personaje(numero) for numero in numeros]
+        self.crear(Personajes, personajes)
+
+        mascotas, ediciones, skullectors = [], [], []
+        for personaje, numero in zip(personajes, numeros):
+            # numero - 1 empieza en 0: el reparto es el mismo se genere en una ejecución o en varias
+            for k in range(repartir(numero - 1, self.options['mascotas'])):
+                mascotas.append(Mascotas(
+                    nombre=f"{azar.choice(NOMBRES)[:4]}{azar.choice(('ito', 'y', 'ón', 'ette'))} {numero}-{k}",
+                    tipo=azar.choice(TIPOS_MASCOTA), duenio=personaje, fecha_subida=personaje.fecha_subida,
+                ))
+            for k in range(repartir(numero - 1, self.options['ediciones'])):
+                ediciones.append(Ediciones(
+                    muneca=personaje, serie=azar.choice(SERIES), lanzamiento=self.lanzamiento(),
+                    generacion=azar.choice((1, 1, 2, 3)), fecha_subida=personaje.fecha_subida,
+                ))
+            for k in range(repartir(numero - 1, self.options['skullectors'])):
+                original = Decimal(azar.randrange(2500, 6000)) / 100
+                skullectors.append(Skullectors(
+                    muneca=personaje, serie=azar.choice(SERIES), limitada=azar.random() < 0.3,
+                    inspiracion=f"Inspirada en {azar.choice(MONSTRUOS).lower()}", lanzamiento=self.lanzamiento(),
+                    descripcion=f"Edición de coleccionista {numero}-{k}", certificado=azar.random() < 0.5,
+                    precioOriginal=original, precioMercado=(original * Decimal(azar.uniform(0.8, 4))).quantize(Decimal('0.01')),
+                    fecha_subida=personaje.fecha_subida,
+                ))
+        self.crear(Mascotas, mascotas)
+        self.crear(Ediciones, ediciones)
+        self.crear(Skullectors, skullectors)
+
+        fotos = []
+        for tipo, campo, filas in (
+            ('Personaje', 'munieca', personajes), ('Mascota', 'mascota', mascotas),
+            ('Edicion', 'edicion', ediciones), ('Skullector', 'skullector', skullectors),
+        ):
+            for fila in filas:
+                for k in range(repartir(fila.pk - 1, self.options['fotos'])):
+                    fotos.append(Foto(url=url_foto(tipo, fila.pk, k), fecha_subida=fila.fecha_subida, **{campo: fila}))
+        self.crear(Foto, fotos)
+        self.historial(skullectors)
+
+        # Los documentos de /todos/ se construyen una vez, con todo lo del personaje ya guardado
+        despues_de_escribir(Personajes, [personaje.pk for personaje in personajes])
+
+    def crear(self, modelo, objetos):
+        preparar(objetos)
+        modelo.objects.bulk_create(objetos, batch_size=1000)
+        self.totales['fotos' if modelo is Foto else modelo._meta.model_name] += len(objetos)
+
+    def historial(self, skullectors):
+        # Precios de los últimos meses que acaban en el precioMercado actual, como si se hubiera ido editando
+        observaciones = []
+        for skullector in skullectors:
+            precios = self.options['precios']
+            for k in range(precios):
+                fecha = self.ahora - datetime.timedelta(days=(precios - 1 - k) * 30, minutes=self.azar.randrange(1440))
+                precio = skullector.precioMercado if k == precios - 1 else \
+                    (skullector.precioMercado * Decimal(self.azar.uniform(0.6, 1.2))).quantize(Decimal('0.01'))
+                observaciones.append((skullector.pk, precio, fecha))
+        registrar_precios(observaciones)
+        self.totales['precios'] += len(observaciones)
+
+    def personaje(self, numero):
+        azar = self.azar
+        return Personajes(
+            nombre=f"{azar.choice(NOMBRES)} {numero}", monstruo=azar.choice(MONSTRUOS), lanzamiento=self.lanzamiento(),
+            cumpleanios=f"{azar.randint(1, 12):02d}-{azar.randint(1, 28):02d}", ciudadNatal=azar.choice(CIUDADES),
+            edad=azar.randint(15, 1600), frase=f"Frase sintética número {numero}", colorFav=azar.choice(COLORES),
+            sexo=azar.choice(('Femenino', 'Femenino', 'Femenino', 'Masculino')),
+            # Repartidos por los últimos años para que cronología y facetas tengan con qué trabajar
+            fecha_subida=self.ahora - datetime.timedelta(days=azar.randrange(3650), seconds=azar.randrange(86400)),
+        )
+
+    def lanzamiento(self):
+        return f"{self.azar.randint(2010, 2024)}-{self.azar.randint(1, 12):02d}"
@@ -0,0 +1,301 @@
+import csv
+import json
+import os
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from projects.bulk import CLAVES_NATURALES, despues_de_escribir, preparar
+from projects.documentos import personajes_afectados
+from projects.models import Personajes, Mascotas, Ediciones, Skullectors, Foto
+
+
+MODELOS = {
+    'personajes': Personajes,
+    'mascotas': Mascotas,
+    'ediciones': Ediciones,
+    'skullectors': Skullectors,
+    'fotos': Foto,
+}
+
+# Para los registros sin id se busca la fila existente por su clave natural (upsert idempotente).
+# Ediciones no tiene una en la API; al importar se usa personaje + serie + lanzamiento + generación.
+# Foto se busca por su URL a través del índice de url_hash
+CLAVES_IMPORTACION = {
+    **CLAVES_NATURALES,
+    Ediciones: ('muneca_id', 'serie', 'lanzamiento', 'generacion'),
+    Foto: ('url_hash', 'url'),
+}
+
+
+class ErrorRegistro(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa Personajes, Mascotas, Ediciones, Skullectors o Foto desde un fichero JSONL o CSV. "
+        "Inserta por lotes dentro de transacciones con semántica de upsert (volver a ejecutarlo con el "
+        "mismo fichero no duplica nada) y puede reanudarse desde el último lote confirmado. "
+        "En los registros que ya existen solo se cambian los campos que trae cada fila; en los nuevos, los "
+        "que falten se guardan con su valor por defecto."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('modelo', choices=sorted(MODELOS))
+        parser.add_argument('archivo')
+        parser.add_argument('--formato', choices=['jsonl', 'csv'], help="Por defecto se deduce de la extensión del fichero")
+        parser.add_argument('--lote', type=int, default=5000, help="Registros por transacción (5000 por defecto)")
+        parser.add_argument('--checkpoint', help="Fichero de progreso (por defecto <archivo>.checkpoint)")
+        parser.add_argument('--reanudar', action='store_true', help="Continúa desde el checkpoint si existe")
+
+    def handle(self, *args, **options):
+        self.modelo = MODELOS[options['modelo']]
+        archivo = options['archivo']
+        if not os.path.exists(archivo):
+            raise CommandError(f"No existe el fichero {archivo}")
+        formato = options['formato'] or ('csv' if archivo.lower().endswith('.csv') else 'jsonl')
+        lote = max(1, options['lote'])
+        ruta_checkpoint = options['checkpoint'] or f'{archivo}.checkpoint'
+
+        self.campos = {}
+        for campo in self.modelo._meta.concrete_fields:
+            self.campos[campo.name] = campo
+            self.campos[campo.attname] = campo
+        self.clave = CLAVES_IMPORTACION.get(self.modelo, ())
+        self.errores = 0
+
+        desde = 0
+        if options['reanudar'] and os.path.exists(ruta_checkpoint):
+            with open(ruta_checkpoint, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('modelo') != options['modelo'] or checkpoint.get('archivo') != os.path.abspath(archivo):
+                raise CommandError(f"El checkpoint {ruta_checkpoint} es de otra importación")
+            desde = checkpoint['posicion']
+            self.stdout.write(f"Reanudando después del registro {desde}")
+
+        inicio = time.monotonic()
+        importados = 0
+        pendientes = []
+        for posicion, registro in self.leer(archivo, formato):
+            if posicion <= desde:
+                continue
+            pendientes.append((posicion, registro))
+            if len(pendientes) >= lote:
+                importados += self.importar_lote(pendientes)
+                self.guardar_checkpoint(ruta_checkpoint, options['modelo'], archivo, pendientes[-1][0])
+                self.informar(importados, inicio)
+                pendientes = []
+        if pendientes:
+            importados += self.importar_lote(pendientes)
+            self.informar(importados, inicio)
+
+        if os.path.exists(ruta_checkpoint):
+            os.remove(ruta_checkpoint)
+        segundos = time.monotonic() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"{importados} registros importados en {segundos:.1f}s "
+            f"({importados / segundos if segundos else 0:.0f} filas/s), {self.errores} con errores"
+        ))
+
+    def leer(self, archivo, formato):
+        with open(archivo, encoding='utf-8', newline='') as f:
+            if formato == 'csv':
+                for posicion, fila in enumerate(csv.DictReader(f), start=1):
+                    yield posicion, fila
+            else:
+                for posicion, linea in enumerate(f, start=1):
+                    linea = linea.strip()
+                    if not linea:
+                        continue
+                    try:
+                        yield posicion, json.loads(linea)
+                    except json.JSONDecodeError as e:
+                        self.error(posicion, f"JSON inválido: {e}")
+
+    def importar_lote(self, pendientes):
+        filas = []
+        for posicion, registro in pendientes:
+            try:
+                filas.append((posicion, self.convertir(registro)))
+            except ErrorRegistro as e:
+                self.error(posicion, e)
+        filas = self.resolver_relaciones(filas)
+        filas = self.resolver_existentes(filas)
+
+        # Columnas que trae alguna fila (más las derivadas): las únicas que puede cambiar el upsert
+        actualizar = {
+            self.campos[campo].attname for _, valores in filas for campo in valores
+            if not self.campos[campo].primary_key
+        }
+        actualizar.update(getattr(self.modelo, 'CAMPOS_DERIVADOS', ()))
+        if 'fecha_actualizacion' in self.campos:
+            actualizar.add('fecha_actualizacion')
+        filas = self.completar_existentes(filas)
+
+        objetos = []
+        for posicion, valores in filas:
+            objeto = self.modelo(**valores)
+            try:
+                objeto.clean_fields(exclude=[campo.name for campo in self.modelo._meta.concrete_fields if campo.is_relation or campo.primary_key])
+            except ValidationError as e:
+                self.error(posicion, e.message_dict)
+                continue
+            objetos.append((posicion, objeto))
+        if not objetos:
+            return 0
+        preparar([objeto for _, objeto in objetos])
+
+        try:
+            with transaction.atomic():
+                self.escribir([objeto for _, objeto in objetos], actualizar)
+            return len(objetos)
+        except IntegrityError:
+            # Algún registro incumple una restricción: se repite el lote fila a fila para aislarlo
+            importados = 0
+            for posicion, objeto in objetos:
+                try:
+                    with transaction.atomic():
+                        self.escribir([objeto], actualizar)
+                    importados += 1
+                except IntegrityError as e:
+                    self.error(posicion, e)
+            return importados
+
+    def escribir(self, objetos, actualizar):
+        pk = self.modelo._meta.pk
+        # Un upsert puede cambiar de dueño una fila existente: su personaje anterior también se reconstruye
+        afectados = personajes_afectados(self.modelo, [objeto.pk for objeto in objetos if objeto.pk is not None])
+        self.modelo.objects.bulk_create(
+            objetos,
+            batch_size=1000,
+            update_conflicts=bool(actualizar),
+            unique_fields=[pk.name] if actualizar else None,
+            update_fields=sorted(actualizar) if actualizar else None,
+        )
+        despues_de_escribir(self.modelo, [objeto.pk for objeto in objetos], afectados=afectados)
+
+    def convertir(self, registro):
+        if not isinstance(registro, dict):
+            raise ErrorRegistro("Se esperaba un objeto con los campos del registro")
+        valores = {}
+        for nombre, valor in registro.items():
+            campo = self.campos.get(nombre)
+            if campo is None:
+                raise ErrorRegistro(f"Campo desconocido: {nombre}")
+            if valor == '' and (campo.null or campo.is_relation):
+                valor = None
+            if campo.is_relation:
+                # Se resuelve después, en bloque para todo el lote
+                valores[campo.attname] = valor
+                continue
+            try:
+                valores[campo.attname] = campo.to_python(valor)
+            except ValidationError as e:
+                raise ErrorRegistro(f"{nombre}: {' '.join(e.messages)}")
+        return valores
+
+    def resolver_relaciones(self, filas):
+        # Las FK (duenio, muneca...) pueden venir como id o, si apuntan a Personajes, como nombre.
+        # Una consulta por relación y lote, no una por fila
+        relaciones = [campo for campo in self.modelo._meta.concrete_fields if campo.is_relation]
+        traducciones = {}
+        for campo in relaciones:
+            destino = campo.related_model
+            ids, nombres = set(), set()
+            for _, valores in filas:
+                valor = valores.get(campo.attname)
+                if valor is None:
+                    continue
+                if isinstance(valor, int) or str(valor).isdigit():
+                    ids.add(int(valor))
+                else:
+                    nombres.add(str(valor))
+            traduccion = {pk: pk for pk in destino.objects.filter(pk__in=ids).values_list('pk', flat=True)}
+            if nombres and destino is Personajes:
+                por_nombre = {}
+                for nombre, pk in Personajes.objects.filter(nombre__in=nombres).values_list('nombre', 'id'):
+                    por_nombre.setdefault(nombre, []).append(pk)
+                # Un nombre repetido en el catálogo no identifica a nadie: se trata como inexistente
+                traduccion.update({nombre: pks[0] for nombre, pks in por_nombre.items() if len(pks) == 1})
+            traducciones[campo.attname] = traduccion
+
+        resueltas = []
+        for posicion, valores in filas:
+            correcto = True
+            for campo in relaciones:
+                valor = valores.get(campo.attname)
+                if valor is None:
+                    continue
+                clave = int(valor) if isinstance(valor, int) or str(valor).isdigit() else str(valor)
+                if clave not in traducciones[campo.attname]:
+                    self.error(posicion, f"{campo.name}: no existe {valor!r} (o el nombre es ambiguo)")
+                    correcto = False
+                    break
+                valores[campo.attname] = traducciones[campo.attname][clave]
+            if correcto:
+                resueltas.append((posicion, valores))
+        return resueltas
+
+    def resolver_existentes(self, filas):
+        # Registros sin id: si ya existe uno con la misma clave natural se actualiza en lugar de duplicarlo.
+        # Dentro del lote, el último registro con la misma clave gana
+        pk = self.modelo._meta.pk.attname
+        if self.clave:
+            sin_pk = [valores for _, valores in filas if valores.get(pk) is None]
+            derivados = set(self.clave) & set(getattr(self.modelo, 'CAMPOS_DERIVADOS', ()))
+            if derivados:
+                # Clave con campos calculados (url_hash de Foto): se calculan como en save()
+                for valores in sin_pk:
+                    objeto = self.modelo(**valores)
+                    objeto.actualizar_campos_derivados()
+                    valores.update({campo: getattr(objeto, campo) for campo in derivados})
+            primeros = {valores.get(self.clave[0]) for valores in sin_pk}
+            if sin_pk:
+                existentes = {
+                    tuple(fila[:-1]): fila[-1]
+                    for fila in self.modelo.objects.filter(**{f'{self.clave[0]}__in': primeros}).values_list(*self.clave, pk)
+                }
+                for valores in sin_pk:
+                    encontrado = existentes.get(tuple(valores.get(campo) for campo in self.clave))
+                    if encontrado is not None:
+                        valores[pk] = encontrado
+
+        unicas = {}
+        for posicion, valores in filas:
+            if valores.get(pk) is not None:
+                identidad = ('pk', valores[pk])
+            elif self.clave:
+                identidad = tuple(valores.get(campo) for campo in self.clave)
+            else:
+                identidad = ('posicion', posicion)
+            unicas[identidad] = (posicion, valores)
+        return sorted(unicas.values(), key=lambda fila: fila[0])
+
+    def completar_existentes(self, filas):
+        # Las filas de registros que ya existen se completan con sus valores actuales (una consulta por lote):
+        # lo que no trae la fila se vuelve a escribir tal cual en lugar de con el valor por defecto del modelo,
+        # aunque otra fila del lote sí traiga esa columna, y los campos derivados se calculan con todo
+        pk = self.modelo._meta.pk.attname
+        ids = {valores[pk] for _, valores in filas if valores.get(pk) is not None}
+        if not ids:
+            return filas
+        columnas = [campo.attname for campo in self.modelo._meta.concrete_fields]
+        actuales = {fila[pk]: fila for fila in self.modelo.objects.filter(pk__in=ids).values(*columnas)}
+        return [(posicion, {**actuales.get(valores.get(pk), {}), **valores}) for posicion, valores in filas]
+
+    def guardar_checkpoint(self, ruta, modelo, archivo, posicion):
+        temporal = f'{ruta}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({'modelo': modelo, 'archivo': os.path.abspath(archivo), 'posicion': posicion}, f)
+        os.replace(temporal, ruta)
+
+    def informar(self, importados, inicio):
+        segundos = time.monotonic() - inicio
+        self.stdout.write(f"{importados} registros ({importados / segundos if segundos else 0:.0f} filas/s)")
+
+    def error(self, posicion, mensaje):
+        self.errores += 1
+        self.stderr.write(f"Registro {posicion}: {mensaje}")
@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from projects import fotos
+from projects.models import Foto
+
+
+LOTE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Descarga las fotos del catálogo que aún no están guardadas (las nuevas) y genera sus variantes, para "
+        "que /api/v1/imagenes/ no tenga que ir a buscarlas en la primera petición. Con --regenerar vuelve a "
+        "generar las variantes de todas a partir del original guardado (p.ej. al cambiar IMAGENES_FOTOS_ANCHOS)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help="Descargas a la vez (8 por defecto)")
+        parser.add_argument('--regenerar', action='store_true', help="Rehace las variantes de las que ya están guardadas")
+
+    def handle(self, *args, **options):
+        self.regenerar = options['regenerar']
+        procesadas = fallidas = guardadas = 0
+        urls = Foto.objects.order_by('id').values_list('url', flat=True).iterator(chunk_size=LOTE)
+        with ThreadPoolExecutor(max_workers=max(1, options['hilos'])) as executor:
+            # Por lotes, para no encolar de golpe todo el catálogo
+            while lote := list(islice(urls, LOTE)):
+                for url, resultado in zip(lote, executor.map(self.procesar, lote)):
+                    if isinstance(resultado, fotos.ErrorDescarga):
+                        fallidas += 1
+                        self.stderr.write(f"{url}: {resultado}")
+                    elif resultado:
+                        procesadas += 1
+                    else:
+                        guardadas += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"{procesadas} fotos procesadas, {guardadas} ya estaban, {fallidas} con errores"
+        ))
+
+    def procesar(self, url):
+        try:
+            return fotos.cachear(url, regenerar=self.regenerar)
+        except fotos.ErrorDescarga as e:
+            return e
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from projects.imagenes import procesar_foto_perfil
+from projects.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera las variantes WebP/JPEG de las fotos de perfil que no las tienen (subidas antes de existir, o "
+        "cuyo proceso se cortó). Con --todas las rehace todas, p.ej. después de cambiar IMAGENES_PERFIL_ANCHOS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help="Rehace también las que ya tienen variantes")
+
+    def handle(self, *args, **options):
+        procesadas = fallidas = 0
+        usuarios = Usuario.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True)
+        for pk, nombre, variantes in usuarios.values_list('pk', 'profile_picture', 'profile_picture_variantes').iterator():
+            if not options['todas'] and (variantes or {}).get('origen') == nombre:
+                continue
+            try:
+                procesar_foto_perfil(pk, nombre)
+                procesadas += 1
+            except Exception as e:
+                fallidas += 1
+                self.stderr.write(f"{nombre}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"{procesadas} fotos procesadas, {fallidas} con errores"))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from projects.tokens import purgar_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra por lotes los tokens JWT caducados (outstanding y, en cascada, su entrada en la lista negra). "
+        "Pensado para lanzarlo desde cron; token/refresh/ ya purga un lote cada JWT_PURGA_INTERVALO segundos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help="Tokens por DELETE (1000 por defecto)")
+        parser.add_argument('--maximo-lotes', type=int, default=None, help="Para después de este número de lotes")
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        borrados = purgar_tokens(max(1, options['lote']), options['maximo_lotes'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{borrados} tokens caducados borrados en {time.monotonic() - inicio:.1f}s"
+        ))
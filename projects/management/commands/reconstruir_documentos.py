@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from projects.documentos import reconstruir_documentos, serializar
+from projects.models import Personajes, DocumentoCatalogo
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye todos los documentos precalculados de /todos/ (DocumentoCatalogo). "
+        "Con --faltan solo crea los de los personajes que no tienen: es un paso del despliegue, después de "
+        "migrate. Con --verificar no escribe nada: compara cada documento con la serialización actual y "
+        "falla si alguno falta, está desfasado o pertenece a un personaje que ya no existe."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verificar', action='store_true', help="Solo comprueba, sin reconstruir")
+        parser.add_argument('--faltan', action='store_true', help="Solo los personajes sin documento")
+        parser.add_argument('--trozo', type=int, default=500, help="Personajes por consulta (500 por defecto)")
+
+    def handle(self, *args, **options):
+        tamanio = max(1, options['trozo'])
+        if options['verificar']:
+            return self.verificar(tamanio)
+
+        inicio = time.monotonic()
+        total = 0
+        for ids in self.trozos_de_ids(tamanio, solo_faltan=options['faltan']):
+            # Cada trozo en su transacción: un catálogo grande no queda en una sola
+            with transaction.atomic():
+                reconstruir_documentos(ids)
+            total += len(ids)
+        huerfanos, _ = DocumentoCatalogo.objects.exclude(personaje__in=Personajes.objects.all()).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} documentos reconstruidos en {time.monotonic() - inicio:.1f}s ({huerfanos} huérfanos borrados)"
+        ))
+
+    def trozos_de_ids(self, tamanio, solo_faltan=False):
+        personajes = Personajes.objects.filter(documento__isnull=True) if solo_faltan else Personajes.objects.all()
+        ultimo = 0
+        while True:
+            ids = list(personajes.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:tamanio])
+            if not ids:
+                return
+            yield ids
+            ultimo = ids[-1]
+
+    def verificar(self, tamanio):
+        faltan, desfasados, revisados = [], [], 0
+        for ids in self.trozos_de_ids(tamanio):
+            guardados = dict(DocumentoCatalogo.objects.filter(personaje_id__in=ids).values_list('personaje_id', 'datos'))
+            for personaje in Personajes.objects.completo().filter(id__in=ids):
+                revisados += 1
+                if personaje.id not in guardados:
+                    faltan.append(personaje.id)
+                elif guardados[personaje.id] != serializar(personaje):
+                    desfasados.append(personaje.id)
+        huerfanos = list(
+            DocumentoCatalogo.objects.exclude(personaje__in=Personajes.objects.all()).values_list('personaje_id', flat=True)
+        )
+
+        self.stdout.write(f"{revisados} personajes revisados")
+        for nombre, ids in (('sin documento', faltan), ('desfasados', desfasados), ('huérfanos', huerfanos)):
+            if ids:
+                self.stderr.write(f"{len(ids)} {nombre}: {', '.join(str(pk) for pk in ids[:20])}{'...' if len(ids) > 20 else ''}")
+        if faltan or desfasados or huerfanos:
+            raise CommandError("Hay documentos que no coinciden; ejecuta reconstruir_documentos sin --verificar")
+        self.stdout.write(self.style.SUCCESS("Todos los documentos están al día"))
@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import re
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+
+# brotli es opcional: sin él solo se comprime con gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+_CODIFICACION_RE = re.compile(r'^\s*([a-z*]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+# Tipos que merece la pena comprimir (las imágenes ya van comprimidas)
+TIPOS_COMPRIMIBLES = ('text/', 'application/json', 'application/msgpack', 'application/x-ndjson', 'application/javascript', 'application/xml')
+
+
+def codificaciones_aceptadas(cabecera):
+    # {codificación: q} de Accept-Encoding; las q=0 se descartan
+    aceptadas = {}
+    for parte in cabecera.lower().split(','):
+        coincidencia = _CODIFICACION_RE.match(parte)
+        if not coincidencia:
+            continue
+        try:
+            calidad = float(coincidencia.group(2)) if coincidencia.group(2) else 1.0
+        except ValueError:
+            continue
+        aceptadas[coincidencia.group(1)] = calidad
+    return {codificacion: calidad for codificacion, calidad in aceptadas.items() if calidad > 0}
+
+
+def elegir_codificacion(cabecera):
+    aceptadas = codificaciones_aceptadas(cabecera)
+    disponibles = ['br', 'gzip'] if brotli is not None else ['gzip']
+    candidatas = [
+        (aceptadas.get(codificacion, aceptadas.get('*', 0)), -orden, codificacion)
+        for orden, codificacion in enumerate(disponibles)
+    ]
+    # Mayor q; a igualdad, brotli antes que gzip
+    calidad, _, codificacion = max(candidatas)
+    return codificacion if calidad > 0 else None
+
+
+def comprimir(contenido, codificacion):
+    if codificacion == 'br':
+        return brotli.compress(contenido, quality=getattr(settings, 'COMPRESION_NIVEL_BROTLI', 5))
+    return gzip.compress(contenido, compresslevel=getattr(settings, 'COMPRESION_NIVEL_GZIP', 6), mtime=0)
+
+
+def comprimir_secuencia(trozos, codificacion):
+    # Para StreamingHttpResponse: cada trozo sale comprimido en cuanto llega (flush), sin esperar al final
+    if codificacion == 'br':
+        compresor = brotli.Compressor(quality=getattr(settings, 'COMPRESION_NIVEL_BROTLI', 5))
+        for trozo in trozos:
+            datos = compresor.process(trozo) + compresor.flush()
+            if datos:
+                yield datos
+        yield compresor.finish()
+    else:
+        compresor = zlib.compressobj(getattr(settings, 'COMPRESION_NIVEL_GZIP', 6), zlib.DEFLATED, 31)
+        for trozo in trozos:
+            datos = compresor.compress(trozo) + compresor.flush(zlib.Z_SYNC_FLUSH)
+            if datos:
+                yield datos
+        yield compresor.flush()
+
+
+def clave_comprimido(respuesta, codificacion):
+    # Entrada con el cuerpo comprimido de una respuesta de la caché del catálogo (CacheRespuestaMixin deja su
+    # clave en respuesta.clave_cache). El renderer y el tipo aceptado (formato, indent...) forman parte de la
+    # clave: se conocen antes de renderizar, así que un acierto se puede buscar sin pintar los datos
+    clave = getattr(respuesta, 'clave_cache', None)
+    renderer = getattr(respuesta, 'accepted_renderer', None)
+    # La API navegable (HTML) lleva datos del usuario: no se reutiliza entre peticiones
+    if clave is None or renderer is None or renderer.media_type.startswith('text/html'):
+        return None
+    firma = hashlib.md5(f'{renderer.media_type}|{respuesta.accepted_media_type}'.encode('utf-8')).hexdigest()[:12]
+    return f'{clave}:comprimido:{codificacion}:{firma}'
+
+
+def comprimido_cacheado(respuesta, request):
+    # (codificación, cuerpo comprimido) ya guardados para esta respuesta y la petición, o None
+    if 'projects.middleware.CompresionMiddleware' not in settings.MIDDLEWARE:
+        return None
+    codificacion = elegir_codificacion(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    clave = clave_comprimido(respuesta, codificacion) if codificacion is not None else None
+    comprimido = cache.get(clave) if clave is not None else None
+    return (codificacion, comprimido) if comprimido is not None else None
+
+
+class CompresionMiddleware:
+    # Comprime con brotli o gzip según Accept-Encoding, a partir de COMPRESION_MINIMO bytes (las respuestas en
+    # streaming siempre). Si la respuesta viene de la caché del catálogo el resultado comprimido se guarda junto
+    # a ella (clave_comprimido) y en los aciertos RespuestaCacheada (cache.py) lo usa sin renderizar ni
+    # recomprimir: llega aquí ya comprimida, con codificacion_cache, y solo faltan las cabeceras
+
+    # También async, para que bajo ASGI las vistas async (asincrono.py) no pasen por un hilo por culpa de
+    # este middleware: la compresión se hace después en un hilo, como hace MiddlewareMixin
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.procesar(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        respuesta = await self.get_response(request)
+        return await sync_to_async(self.procesar, thread_sensitive=True)(request, respuesta)
+
+    def procesar(self, request, respuesta):
+        codificacion = getattr(respuesta, 'codificacion_cache', None)
+        if codificacion is not None:
+            patch_vary_headers(respuesta, ('Accept-Encoding',))
+            return self._marcar(respuesta, codificacion)
+        if respuesta.has_header('Content-Encoding') or not self._comprimible(respuesta):
+            return respuesta
+
+        patch_vary_headers(respuesta, ('Accept-Encoding',))
+        codificacion = elegir_codificacion(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if codificacion is None:
+            return respuesta
+
+        if respuesta.streaming:
+            if respuesta.is_async:
+                return respuesta
+            respuesta.streaming_content = comprimir_secuencia(respuesta.streaming_content, codificacion)
+            del respuesta['Content-Length']
+        else:
+            if len(respuesta.content) < getattr(settings, 'COMPRESION_MINIMO', 1024):
+                return respuesta
+            comprimido = self._comprimido(respuesta, codificacion)
+            if len(comprimido) >= len(respuesta.content):
+                return respuesta
+            respuesta.content = comprimido
+        return self._marcar(respuesta, codificacion)
+
+    def _marcar(self, respuesta, codificacion):
+        if not respuesta.streaming:
+            respuesta['Content-Length'] = str(len(respuesta.content))
+        # El cuerpo ya no es el mismo byte a byte: el ETag pasa a ser débil (como hace GZipMiddleware)
+        etag = respuesta.get('ETag')
+        if etag and etag.startswith('"'):
+            respuesta['ETag'] = 'W/' + etag
+        respuesta['Content-Encoding'] = codificacion
+        return respuesta
+
+    def _comprimible(self, respuesta):
+        tipo = respuesta.get('Content-Type', '').lower()
+        return respuesta.status_code == 200 and tipo.startswith(TIPOS_COMPRIMIBLES)
+
+    def _comprimido(self, respuesta, codificacion):
+        clave = clave_comprimido(respuesta, codificacion)
+        if clave is None:
+            return comprimir(respuesta.content, codificacion)
+        comprimido = cache.get(clave)
+        if comprimido is None:
+            comprimido = comprimir(respuesta.content, codificacion)
+            # Solo si compensa: un acierto que encuentre la entrada la sirve tal cual
+            if len(comprimido) < len(respuesta.content):
+                cache.set(clave, comprimido, getattr(settings, 'CATALOGO_CACHE_TIMEOUT', 300))
+        return comprimido
@@ -14,6 +14,12 @@ class Migration(migrations.Migration):
         ('projects', '0001_initial'),
     ]
 
+    # Usuario (AUTH_USER_MODEL) se crea aquí y no en 0001, así que las apps que lo referencian deben esperar
+    run_before = [
+        ('admin', '0001_initial'),
+        ('token_blacklist', '0001_initial'),
+    ]
+
     operations = [
         migrations.CreateModel(
             name='Usuario',
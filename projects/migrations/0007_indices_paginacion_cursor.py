@@ -0,0 +1,45 @@
+# Generated by Django 5.0.12 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_remove_personajes_mascota_alter_ediciones_muneca_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ediciones',
+            index=models.Index(fields=['fecha_subida', 'id'], name='ediciones_subida_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ediciones',
+            index=models.Index(fields=['serie', 'id'], name='ediciones_serie_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mascotas',
+            index=models.Index(fields=['fecha_subida', 'id'], name='mascotas_subida_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mascotas',
+            index=models.Index(fields=['nombre', 'id'], name='mascotas_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personajes',
+            index=models.Index(fields=['fecha_subida', 'id'], name='personajes_subida_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personajes',
+            index=models.Index(fields=['nombre', 'id'], name='personajes_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='skullectors',
+            index=models.Index(fields=['fecha_subida', 'id'], name='skullectors_subida_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='skullectors',
+            index=models.Index(fields=['serie', 'id'], name='skullectors_serie_idx'),
+        ),
+    ]
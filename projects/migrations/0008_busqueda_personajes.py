@@ -0,0 +1,68 @@
+# Generated by Django 5.0.12 on 2026-10-18 18:49
+
+from django.db import migrations, models
+
+from projects.operaciones import rellenar_por_lotes
+from projects.search import normalizar_texto
+
+
+CAMPOS_BUSQUEDA = ('nombre', 'monstruo', 'ciudadNatal', 'frase', 'colorFav')
+
+
+def texto_busqueda(*textos):
+    return normalizar_texto(' '.join(texto or '' for texto in textos))
+
+
+def rellenar_busqueda(apps, schema_editor):
+    rellenar_por_lotes(apps.get_model('projects', 'Personajes'), schema_editor.connection.alias, 'busqueda', texto_busqueda, CAMPOS_BUSQUEDA)
+
+
+def crear_indices_busqueda(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS personajes_busqueda_fts ON projects_personajes "
+            "USING gin (to_tsvector('spanish'::regconfig, busqueda))"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS personajes_busqueda_trgm ON projects_personajes "
+            "USING gin (busqueda gin_trgm_ops)"
+        )
+    elif vendor == 'sqlite':
+        # Tabla FTS5 propia (no external content) para que sobreviva a las reconstrucciones de tabla de SQLite
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS projects_personajes_fts "
+            "USING fts5(busqueda, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO projects_personajes_fts (rowid, busqueda) SELECT id, busqueda FROM projects_personajes"
+        )
+
+
+def borrar_indices_busqueda(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS personajes_busqueda_fts")
+        schema_editor.execute("DROP INDEX IF EXISTS personajes_busqueda_trgm")
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS projects_personajes_fts")
+
+
+class Migration(migrations.Migration):
+    # Sin transacción para que cada lote del relleno confirme en la suya
+    atomic = False
+
+    dependencies = [
+        ('projects', '0007_indices_paginacion_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='personajes',
+            name='busqueda',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(rellenar_busqueda, migrations.RunPython.noop, atomic=False),
+        migrations.RunPython(crear_indices_busqueda, borrar_indices_busqueda),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.12 on 2026-10-18 18:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0008_busqueda_personajes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoCatalogo',
+            fields=[
+                ('personaje', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='documento', serialize=False, to='projects.personajes')),
+                ('datos', models.TextField()),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
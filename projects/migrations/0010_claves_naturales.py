@@ -0,0 +1,96 @@
+# Generated by Django 5.0.12 on 2026-10-18 19:17
+
+import logging
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+logger = logging.getLogger(__name__)
+
+
+# (modelo, clave natural, columna con el personaje, FK que apuntan a él): las mismas claves que
+# CLAVES_NATURALES en bulk.py
+CLAVES = (
+    ('Personajes', ('nombre', 'monstruo', 'lanzamiento', 'edad', 'sexo'), 'id', (
+        ('Mascotas', 'duenio'), ('Ediciones', 'muneca'), ('Skullectors', 'muneca'), ('Foto', 'munieca'),
+    )),
+    ('Mascotas', ('nombre', 'tipo', 'duenio_id'), 'duenio_id', (('Foto', 'mascota'),)),
+    ('Skullectors', ('serie', 'descripcion', 'lanzamiento'), 'muneca_id', (('Foto', 'skullector'),)),
+)
+
+
+def fusionar_duplicados(apps, schema_editor):
+    # Antes de crear las restricciones se buscan los grupos de duplicados. Aquí NULL sí cuenta como igual a
+    # NULL (como las restricciones parciales de los personajes sin edad y las mascotas sin dueño). Si hay
+    # alguno la migración se detiene y los lista: solo con CATALOGO_FUSIONAR_DUPLICADOS se queda el registro
+    # más antiguo de cada grupo, que hereda las filas que colgaban de los demás, y se borra el resto
+    db = schema_editor.connection.alias
+    fusionar = getattr(settings, 'CATALOGO_FUSIONAR_DUPLICADOS', False)
+    DocumentoCatalogo = apps.get_model('projects', 'DocumentoCatalogo')
+    informe = []
+    for nombre, clave, personaje, hijos in CLAVES:
+        modelo = apps.get_model('projects', nombre)
+        conservados = {}
+        sustituidos = {}
+        personajes = {}
+        for fila in modelo.objects.using(db).order_by('id').values('id', personaje, *clave).iterator():
+            personajes[fila['id']] = fila[personaje]
+            conservado = conservados.setdefault(tuple(fila[campo] for campo in clave), fila['id'])
+            if conservado != fila['id']:
+                sustituidos.setdefault(conservado, []).append(fila['id'])
+        informe += [f"{nombre} {conservado}: duplicado en {duplicados}" for conservado, duplicados in sustituidos.items()]
+        if not sustituidos or not fusionar:
+            continue
+
+        for conservado, duplicados in sustituidos.items():
+            for hijo, campo in hijos:
+                apps.get_model('projects', hijo).objects.using(db).filter(**{f'{campo}__in': duplicados}).update(**{campo: conservado})
+        borrados = [pk for duplicados in sustituidos.values() for pk in duplicados]
+        modelo.objects.using(db).filter(pk__in=borrados).delete()
+
+        # Los documentos de los personajes tocados ya no están al día: sin documento se pintan con el
+        # serializador hasta el próximo reconstruir_documentos
+        tocados = {personajes[pk] for pk in [*sustituidos, *borrados]} - {None}
+        DocumentoCatalogo.objects.using(db).filter(personaje_id__in=tocados).delete()
+        if nombre == 'Personajes' and schema_editor.connection.vendor == 'sqlite':
+            with schema_editor.connection.cursor() as cursor:
+                for pk in borrados:
+                    cursor.execute("DELETE FROM projects_personajes_fts WHERE rowid = %s", [pk])
+
+    if informe and not fusionar:
+        raise RuntimeError(
+            "Hay registros con la misma clave natural y no se puede crear su restricción única:\n  "
+            + "\n  ".join(informe)
+            + "\nCorrígelos o bórralos a mano, o pon CATALOGO_FUSIONAR_DUPLICADOS = True para conservar el "
+            "más antiguo de cada grupo y borrar el resto"
+        )
+    if informe:
+        logger.warning("Registros duplicados fusionados en el más antiguo:\n  %s", "\n  ".join(informe))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0009_documentos_catalogo'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='mascotas',
+            constraint=models.UniqueConstraint(fields=('nombre', 'tipo', 'duenio'), name='mascotas_clave_natural'),
+        ),
+        migrations.AddConstraint(
+            model_name='personajes',
+            constraint=models.UniqueConstraint(fields=('nombre', 'monstruo', 'lanzamiento', 'edad', 'sexo'), name='personajes_clave_natural'),
+        ),
+        migrations.AddConstraint(
+            model_name='personajes',
+            constraint=models.UniqueConstraint(condition=models.Q(('edad__isnull', True)), fields=('nombre', 'monstruo', 'lanzamiento', 'sexo'), name='personajes_clave_natural_sin_edad'),
+        ),
+        migrations.AddConstraint(
+            model_name='skullectors',
+            constraint=models.UniqueConstraint(fields=('serie', 'descripcion', 'lanzamiento'), name='skullectors_clave_natural'),
+        ),
+    ]
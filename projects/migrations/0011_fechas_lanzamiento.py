@@ -0,0 +1,70 @@
+# Generated by Django 5.0.12 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+from projects.fechas import parsear_cumpleanios, parsear_lanzamiento
+from projects.operaciones import rellenar_por_lotes
+
+
+# modelo -> (columna de texto, columna de fecha, conversor)
+FECHAS = {
+    'Personajes': (('lanzamiento', 'fecha_lanzamiento', parsear_lanzamiento), ('cumpleanios', 'fecha_cumpleanios', parsear_cumpleanios)),
+    'Ediciones': (('lanzamiento', 'fecha_lanzamiento', parsear_lanzamiento),),
+    'Skullectors': (('lanzamiento', 'fecha_lanzamiento', parsear_lanzamiento),),
+}
+
+
+def rellenar_fechas(apps, schema_editor):
+    db = schema_editor.connection.alias
+    for nombre, columnas in FECHAS.items():
+        for texto, fecha, conversor in columnas:
+            rellenar_por_lotes(apps.get_model('projects', nombre), db, fecha, conversor, texto)
+
+
+class Migration(migrations.Migration):
+    # Sin transacción para que cada lote del relleno confirme en la suya
+    atomic = False
+
+    dependencies = [
+        ('projects', '0010_claves_naturales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ediciones',
+            name='fecha_lanzamiento',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='personajes',
+            name='fecha_cumpleanios',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='personajes',
+            name='fecha_lanzamiento',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='skullectors',
+            name='fecha_lanzamiento',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(rellenar_fechas, migrations.RunPython.noop, atomic=False),
+        migrations.AddIndex(
+            model_name='ediciones',
+            index=models.Index(fields=['fecha_lanzamiento', 'id'], name='ediciones_lanzamiento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personajes',
+            index=models.Index(fields=['fecha_lanzamiento', 'id'], name='personajes_lanzamiento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personajes',
+            index=models.Index(fields=['fecha_cumpleanios'], name='personajes_cumpleanios_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='skullectors',
+            index=models.Index(fields=['fecha_lanzamiento', 'id'], name='skullectors_lanzamiento_idx'),
+        ),
+    ]
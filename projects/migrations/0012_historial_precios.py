@@ -0,0 +1,87 @@
+# Generated by Django 5.0.12 on 2026-10-18 19:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def registrar_precios_actuales(apps, schema_editor):
+    # El precio de mercado que ya tiene cada skullector es la primera observación de su historial
+    db = schema_editor.connection.alias
+    Skullectors = apps.get_model('projects', 'Skullectors')
+    HistorialPrecio = apps.get_model('projects', 'HistorialPrecio')
+    ResumenPrecio = apps.get_model('projects', 'ResumenPrecio')
+    historial, resumenes = [], []
+    for pk, precio, actualizada, subida in Skullectors.objects.using(db).filter(precioMercado__gt=0).values_list(
+        'pk', 'precioMercado', 'fecha_actualizacion', 'fecha_subida'
+    ):
+        fecha = actualizada or subida
+        dia = timezone.localdate(fecha) if timezone.is_aware(fecha) else fecha.date()
+        historial.append(HistorialPrecio(skullector_id=pk, precio=precio, fecha=fecha))
+        for periodo, inicio in (('dia', dia), ('mes', dia.replace(day=1))):
+            resumenes.append(ResumenPrecio(
+                skullector_id=pk, periodo=periodo, inicio=inicio, minimo=precio, maximo=precio, suma=precio,
+                observaciones=1, ultimo=precio, fecha_ultimo=fecha,
+            ))
+    HistorialPrecio.objects.using(db).bulk_create(historial, batch_size=1000)
+    ResumenPrecio.objects.using(db).bulk_create(resumenes, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0011_fechas_lanzamiento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialPrecio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumenPrecio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.CharField(choices=[('dia', 'Día'), ('mes', 'Mes')], max_length=3)),
+                ('inicio', models.DateField()),
+                ('minimo', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('maximo', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('suma', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('observaciones', models.PositiveIntegerField()),
+                ('ultimo', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('fecha_ultimo', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='skullectors',
+            index=models.Index(fields=['precioMercado'], name='skullectors_precio_idx'),
+        ),
+        migrations.AddField(
+            model_name='historialprecio',
+            name='skullector',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial_precios', to='projects.skullectors'),
+        ),
+        migrations.AddField(
+            model_name='resumenprecio',
+            name='skullector',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_precio', to='projects.skullectors'),
+        ),
+        migrations.AddIndex(
+            model_name='historialprecio',
+            index=models.Index(fields=['skullector', 'fecha'], name='historial_skullector_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resumenprecio',
+            index=models.Index(fields=['periodo', 'inicio'], name='resumen_periodo_inicio_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumenprecio',
+            constraint=models.UniqueConstraint(fields=('skullector', 'periodo', 'inicio'), name='resumen_precio_unico'),
+        ),
+        migrations.RunPython(registrar_precios_actuales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+
+# Índice sobre la caducidad de los tokens de simplejwt: la purga por lotes de projects.tokens.purgar_tokens
+# busca los caducados sin recorrer toda la tabla. La tabla es de otra app y AddIndex solo llega a los modelos
+# de esta, así que se crea con el schema editor (el SQL de cada motor) sobre el modelo histórico
+INDICE = models.Index(fields=['expires_at'], name='outstandingtoken_expires_idx')
+
+
+def _existe(schema_editor, modelo):
+    # Puede estar ya si se creó a mano o con la versión anterior de esta migración
+    with schema_editor.connection.cursor() as cursor:
+        return INDICE.name in schema_editor.connection.introspection.get_constraints(cursor, modelo._meta.db_table)
+
+
+def crear_indice(apps, schema_editor):
+    modelo = apps.get_model('token_blacklist', 'OutstandingToken')
+    if not _existe(schema_editor, modelo):
+        schema_editor.add_index(modelo, INDICE)
+
+
+def borrar_indice(apps, schema_editor):
+    modelo = apps.get_model('token_blacklist', 'OutstandingToken')
+    if _existe(schema_editor, modelo):
+        schema_editor.remove_index(modelo, INDICE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0012_historial_precios'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.12 on 2026-10-18 19:49
+
+import projects.imagenes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0013_indice_caducidad_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='profile_picture_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='usuario',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, upload_to=projects.imagenes.ruta_foto_perfil, verbose_name='profile picture'),
+        ),
+    ]
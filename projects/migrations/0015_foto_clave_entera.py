@@ -0,0 +1,139 @@
+from django.db import migrations, models
+
+from projects.models import hash_url
+from projects.operaciones import LOTE, SinBloqueosEnPostgres, no_nulo_postgresql, rellenar_por_lotes, unico_postgresql
+
+
+# Primera mitad del cambio de clave de Foto: la clave pasa a ser un entero y la URL una columna más. Se puede
+# aplicar con la versión anterior sirviendo peticiones: la URL sigue teniendo un índice único, así que el
+# código viejo (que inserta sin id ni url_hash y hace upserts por la URL) funciona igual. Con el código nuevo
+# ya desplegado, 0016 termina el cambio:
+#   python manage.py migrate projects 0015  ->  desplegar  ->  python manage.py migrate
+
+INDICES_FK = (
+    ('munieca', 'personajes', 'foto_munieca_idx'),
+    ('edicion', 'ediciones', 'foto_edicion_idx'),
+    ('skullector', 'skullectors', 'foto_skullector_idx'),
+    ('mascota', 'mascotas', 'foto_mascota_idx'),
+)
+
+
+def rellenar_url_hash(apps, schema_editor):
+    rellenar_por_lotes(apps.get_model('projects', 'Foto'), schema_editor.connection.alias, 'url_hash', hash_url, 'url')
+
+
+def indice_url_hash_postgresql(schema_editor):
+    # Las filas del código viejo llegan con url_hash a NULL, que no choca en el índice único
+    unico_postgresql(schema_editor, 'projects_foto', 'url_hash')
+
+
+def clave_entera_postgresql(schema_editor):
+    # id sin valor por defecto al crearla (no reescribe la tabla); las filas nuevas, también las que inserte
+    # el código viejo, lo toman de la secuencia y las existentes se numeran por lotes
+    schema_editor.execute("ALTER TABLE projects_foto ADD COLUMN id integer")
+    schema_editor.execute("CREATE SEQUENCE projects_foto_id_seq AS integer OWNED BY projects_foto.id")
+    schema_editor.execute("ALTER TABLE projects_foto ALTER COLUMN id SET DEFAULT nextval('projects_foto_id_seq')")
+    with schema_editor.connection.cursor() as cursor:
+        ultima = ''
+        while True:
+            cursor.execute("SELECT url FROM projects_foto WHERE url > %s ORDER BY url LIMIT %s", [ultima, LOTE])
+            urls = [fila[0] for fila in cursor.fetchall()]
+            if not urls:
+                break
+            cursor.execute(
+                "UPDATE projects_foto SET id = nextval('projects_foto_id_seq') WHERE url = ANY(%s) AND id IS NULL", [urls]
+            )
+            ultima = urls[-1]
+    schema_editor.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS projects_foto_id_pk ON projects_foto (id)")
+    no_nulo_postgresql(schema_editor, 'projects_foto', 'id')
+
+    # La URL no se queda ni un momento sin índice único: el suyo se crea antes y el cambio de clave es un
+    # solo ALTER, que solo bloquea lo que tarda en cambiar el catálogo
+    nombre = schema_editor._create_index_name('projects_foto', ['url'], suffix='_uniq')
+    schema_editor.execute(f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {nombre} ON projects_foto (url)")
+    schema_editor.execute(
+        "ALTER TABLE projects_foto DROP CONSTRAINT projects_foto_pkey, "
+        "ADD CONSTRAINT projects_foto_pkey PRIMARY KEY USING INDEX projects_foto_id_pk, "
+        f"ADD CONSTRAINT {nombre} UNIQUE USING INDEX {nombre}"
+    )
+
+
+def indices_parciales_postgresql(schema_editor):
+    # Los nuevos se crean antes de quitar los de siempre (que tienen una entrada por cada NULL)
+    for campo, _, nombre in INDICES_FK:
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nombre} ON projects_foto ({campo}_id) WHERE {campo}_id IS NOT NULL"
+        )
+    with schema_editor.connection.cursor() as cursor:
+        restricciones = schema_editor.connection.introspection.get_constraints(cursor, 'projects_foto')
+    nuevos = {nombre for _, _, nombre in INDICES_FK}
+    columnas = {f'{campo}_id' for campo, _, _ in INDICES_FK}
+    for nombre, info in restricciones.items():
+        if info['index'] and not info['unique'] and nombre not in nuevos and info['columns'] and set(info['columns']) <= columnas:
+            schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {nombre}")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('projects', '0014_variantes_foto_perfil'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foto',
+            name='url_hash',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(rellenar_url_hash, migrations.RunPython.noop, atomic=False),
+        SinBloqueosEnPostgres(
+            [
+                migrations.AlterField(
+                    model_name='foto',
+                    name='url_hash',
+                    field=models.BigIntegerField(editable=False, null=True, unique=True),
+                ),
+            ],
+            indice_url_hash_postgresql,
+        ),
+        SinBloqueosEnPostgres(
+            [
+                migrations.AddField(
+                    model_name='foto',
+                    name='id',
+                    field=models.AutoField(primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='foto',
+                    name='url',
+                    field=models.URLField(unique=True),
+                ),
+            ],
+            clave_entera_postgresql,
+            reversible=False,
+        ),
+        SinBloqueosEnPostgres(
+            [
+                *(
+                    migrations.AlterField(
+                        model_name='foto',
+                        name=campo,
+                        field=models.ForeignKey(
+                            blank=True, db_index=False, null=True, on_delete=models.deletion.CASCADE,
+                            related_name='fotos', to=f'projects.{modelo}',
+                        ),
+                    )
+                    for campo, modelo, _ in INDICES_FK
+                ),
+                *(
+                    migrations.AddIndex(
+                        model_name='foto',
+                        index=models.Index(condition=models.Q((f'{campo}__isnull', False)), fields=[campo], name=nombre),
+                    )
+                    for campo, _, nombre in INDICES_FK
+                ),
+            ],
+            indices_parciales_postgresql,
+        ),
+    ]
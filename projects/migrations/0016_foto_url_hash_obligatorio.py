@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+from projects.models import hash_url
+from projects.operaciones import SinBloqueosEnPostgres, no_nulo_postgresql, rellenar_por_lotes
+
+
+# Segunda mitad del cambio de clave de Foto (ver 0015): solo con el código nuevo ya desplegado, que siempre
+# rellena url_hash. Completa url_hash en las filas que insertó el código viejo entre las dos migraciones, lo
+# hace obligatorio y quita el índice único de la URL, que ya cubre el de url_hash
+
+
+def rellenar_url_hash(apps, schema_editor):
+    Foto = apps.get_model('projects', 'Foto')
+    db = schema_editor.connection.alias
+    if Foto.objects.using(db).filter(url_hash__isnull=True).exists():
+        rellenar_por_lotes(Foto, db, 'url_hash', hash_url, 'url')
+
+
+def url_hash_obligatorio_postgresql(schema_editor):
+    no_nulo_postgresql(schema_editor, 'projects_foto', 'url_hash')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('projects', '0015_foto_clave_entera'),
+    ]
+
+    operations = [
+        migrations.RunPython(rellenar_url_hash, migrations.RunPython.noop, atomic=False),
+        SinBloqueosEnPostgres(
+            [
+                migrations.AlterField(
+                    model_name='foto',
+                    name='url_hash',
+                    field=models.BigIntegerField(editable=False, unique=True),
+                ),
+            ],
+            url_hash_obligatorio_postgresql,
+        ),
+        migrations.AlterField(
+            model_name='foto',
+            name='url',
+            field=models.URLField(),
+        ),
+    ]
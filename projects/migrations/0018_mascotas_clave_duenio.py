@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # La clave natural de las mascotas incluye al dueño. Las bases que aplicaron 0010 cuando era solo
+    # nombre + tipo tienen la restricción antigua: se sustituye (en las nuevas ya coincide y no cambia nada).
+    # Relajar la restricción no puede dejar filas que la incumplan
+
+    dependencies = [
+        ('projects', '0017_rellenar_documentos'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='mascotas',
+            name='mascotas_clave_natural',
+        ),
+        migrations.AddConstraint(
+            model_name='mascotas',
+            constraint=models.UniqueConstraint(fields=('nombre', 'tipo', 'duenio'), name='mascotas_clave_natural'),
+        ),
+        migrations.AddConstraint(
+            model_name='mascotas',
+            constraint=models.UniqueConstraint(condition=models.Q(('duenio__isnull', True)), fields=('nombre', 'tipo'), name='mascotas_clave_natural_sin_duenio'),
+        ),
+    ]
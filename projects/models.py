@@ -1,10 +1,14 @@
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager, Group, Permission
 from django.db import models
+import hashlib
 import re
 from django.utils import timezone
 from django.core import validators
 from django.core.mail import send_mail
 from django.utils.translation import gettext_lazy as _
+from .fechas import parsear_cumpleanios, parsear_lanzamiento
+from .imagenes import ruta_foto_perfil
+from .search import normalizar_texto
 
 # Create your models here.
 
@@ -14,6 +18,8 @@ class UserManager(BaseUserManager):
         if not username:
             raise ValueError(_('The given username must be set'))
         email = self.normalize_email(email)
+        # Hash ya calculado (en el pool de hashing.py, ver RegisterSerializer): no se vuelve a cifrar aquí
+        password_cifrada = extra_fields.pop('password_cifrada', None)
         user = self.model(
             username=username,
             email=email,
@@ -24,7 +30,10 @@ class UserManager(BaseUserManager):
             date_joined=now,
             **extra_fields
         )
-        user.set_password(password)
+        if password_cifrada is not None:
+            user.password = password_cifrada
+        else:
+            user.set_password(password)
         user.save(using=self._db)
         return user
 
@@ -86,10 +95,12 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
     # Campos adicionales
     profile_picture = models.ImageField(
         _('profile picture'),
-        upload_to='profile_images/',
+        upload_to=ruta_foto_perfil,
         null=True,
         blank=True
     )
+    # Recortes reducidos en WebP y JPEG de la foto (ver imagenes.py), generados fuera de la petición
+    profile_picture_variantes = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(_('description'), blank=True)
     gender = models.CharField(
         _('gender'),
@@ -142,7 +153,33 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
         return self
 
 
-class Personajes(models.Model):
+class CamposDerivadosMixin:
+    # Modelos con columnas calculadas (CAMPOS_DERIVADOS) que rellena actualizar_campos_derivados().
+    # save() las calcula siempre y, si se guarda con update_fields, las añade para que no se queden atrás
+    CAMPOS_DERIVADOS = ()
+
+    def actualizar_campos_derivados(self):
+        pass
+
+    def save(self, *args, **kwargs):
+        self.actualizar_campos_derivados()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | set(self.CAMPOS_DERIVADOS)
+        super().save(*args, **kwargs)
+
+
+class PersonajesQuerySet(models.QuerySet):
+    def completo(self):
+        # Precarga todo el árbol que pinta CompletoSerializer (y sus fotos) en un número fijo de consultas
+        return self.prefetch_related(
+            models.Prefetch('fotos', queryset=Foto.objects.all()),
+            models.Prefetch('mascota', queryset=Mascotas.objects.prefetch_related('fotos')),
+            models.Prefetch('ediciones', queryset=Ediciones.objects.prefetch_related('fotos')),
+            models.Prefetch('skullectors', queryset=Skullectors.objects.prefetch_related('fotos')),
+        )
+
+
+class Personajes(CamposDerivadosMixin, models.Model):
     id = models.AutoField(primary_key=True)
     nombre = models.CharField(max_length=100, blank=True)
     monstruo = models.CharField(max_length=100, blank=True)
@@ -158,15 +195,47 @@ class Personajes(models.Model):
     sexo = models.TextField(default='Femenino')
     fecha_subida = models.DateTimeField(default=timezone.now)
     fecha_actualizacion = models.DateTimeField(null=True, blank=True, auto_now=True)
+    # Documento de búsqueda normalizado (sin tildes, en minúsculas); lo indexan tsvector/trigramas o FTS5
+    busqueda = models.TextField(blank=True, default='', editable=False)
+    # lanzamiento y cumpleanios como fechas de verdad (día 1 del mes; el cumpleaños en el año 2000) para
+    # filtrar por rangos y ordenar con índice. Los textos originales se siguen guardando tal cual
+    fecha_lanzamiento = models.DateField(null=True, blank=True, editable=False)
+    fecha_cumpleanios = models.DateField(null=True, blank=True, editable=False)
+
+    objects = PersonajesQuerySet.as_manager()
+
+    CAMPOS_BUSQUEDA = ('nombre', 'monstruo', 'ciudadNatal', 'frase', 'colorFav')
+    # Columnas que calcula actualizar_campos_derivados() y hay que incluir en los bulk_update
+    CAMPOS_DERIVADOS = ('busqueda', 'fecha_lanzamiento', 'fecha_cumpleanios')
 
     class Meta:
         constraints = [
-            models.CheckConstraint(check=models.Q(sexo__in=["Masculino", "Femenino"]), name='chk_sexo')
+            models.CheckConstraint(check=models.Q(sexo__in=["Masculino", "Femenino"]), name='chk_sexo'),
+            # Clave natural (CLAVES_NATURALES en bulk.py). Como NULL no choca con NULL en un índice único,
+            # los personajes sin edad llevan su propia restricción parcial sobre el resto de campos
+            models.UniqueConstraint(fields=['nombre', 'monstruo', 'lanzamiento', 'edad', 'sexo'], name='personajes_clave_natural'),
+            models.UniqueConstraint(
+                fields=['nombre', 'monstruo', 'lanzamiento', 'sexo'], condition=models.Q(edad__isnull=True),
+                name='personajes_clave_natural_sin_edad'
+            ),
+        ]
+        # Órdenes admitidos por la paginación por cursor (campo + id)
+        indexes = [
+            models.Index(fields=['fecha_subida', 'id'], name='personajes_subida_idx'),
+            models.Index(fields=['nombre', 'id'], name='personajes_nombre_idx'),
+            models.Index(fields=['fecha_lanzamiento', 'id'], name='personajes_lanzamiento_idx'),
+            models.Index(fields=['fecha_cumpleanios'], name='personajes_cumpleanios_idx'),
         ]
     
     def __str__(self):
         return self.nombre
-    
+
+    def actualizar_campos_derivados(self):
+        # Se llama en save() y a mano antes de bulk_create/bulk_update, que no pasan por save()
+        self.busqueda = normalizar_texto(' '.join(getattr(self, campo) or '' for campo in self.CAMPOS_BUSQUEDA))
+        self.fecha_lanzamiento = parsear_lanzamiento(self.lanzamiento)
+        self.fecha_cumpleanios = parsear_cumpleanios(self.cumpleanios)
+
 
 class Mascotas(models.Model):
     id = models.AutoField(primary_key=True)
@@ -177,11 +246,26 @@ class Mascotas(models.Model):
     fecha_subida = models.DateTimeField(default=timezone.now)
     fecha_actualizacion = models.DateTimeField(null=True, blank=True, auto_now=True)
 
+    class Meta:
+        constraints = [
+            # Dos muñecas pueden tener mascotas con el mismo nombre y tipo. Las que no tienen dueño (NULL)
+            # se comparan entre sí con la restricción parcial, como los personajes sin edad
+            models.UniqueConstraint(fields=['nombre', 'tipo', 'duenio'], name='mascotas_clave_natural'),
+            models.UniqueConstraint(
+                fields=['nombre', 'tipo'], condition=models.Q(duenio__isnull=True),
+                name='mascotas_clave_natural_sin_duenio'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['fecha_subida', 'id'], name='mascotas_subida_idx'),
+            models.Index(fields=['nombre', 'id'], name='mascotas_nombre_idx'),
+        ]
+
     def __str__(self):
         return self.nombre
 
 
-class Ediciones(models.Model):
+class Ediciones(CamposDerivadosMixin, models.Model):
     id = models.AutoField(primary_key=True)
     muneca = models.ForeignKey(Personajes, null=True, blank=True,  on_delete=models.CASCADE, related_name='ediciones')
     serie = models.CharField(max_length=100)
@@ -190,16 +274,29 @@ class Ediciones(models.Model):
     # foto = models.ManyToManyField('Foto', blank=True, related_name='ediciones')
     fecha_subida = models.DateTimeField(default=timezone.now)
     fecha_actualizacion = models.DateTimeField(null=True, blank=True, auto_now=True)
+    # lanzamiento como fecha (día 1 del mes), igual que en Personajes
+    fecha_lanzamiento = models.DateField(null=True, blank=True, editable=False)
+
+    CAMPOS_DERIVADOS = ('fecha_lanzamiento',)
     
     class Meta:
         constraints = [
             models.CheckConstraint(check=models.Q(generacion__in=[1, 2, 3]), name='chk_generacion')
         ]
+        indexes = [
+            models.Index(fields=['fecha_subida', 'id'], name='ediciones_subida_idx'),
+            models.Index(fields=['serie', 'id'], name='ediciones_serie_idx'),
+            models.Index(fields=['fecha_lanzamiento', 'id'], name='ediciones_lanzamiento_idx'),
+        ]
     
     def __str__(self):
         return f"{self.serie} ({self.lanzamiento}"
 
-class Skullectors(models.Model):
+    def actualizar_campos_derivados(self):
+        self.fecha_lanzamiento = parsear_lanzamiento(self.lanzamiento)
+
+
+class Skullectors(CamposDerivadosMixin, models.Model):
     id = models.AutoField(primary_key=True)
     muneca = models.ForeignKey(Personajes, on_delete=models.CASCADE, null=True, blank=True, related_name='skullectors')
     serie = models.CharField(max_length=100)
@@ -213,17 +310,121 @@ class Skullectors(models.Model):
     precioMercado = models.DecimalField(max_digits=10, decimal_places=2, null=True)
     fecha_subida = models.DateTimeField(default=timezone.now)
     fecha_actualizacion = models.DateTimeField(null=True, blank=True, auto_now=True)
+    fecha_lanzamiento = models.DateField(null=True, blank=True, editable=False)
+
+    CAMPOS_DERIVADOS = ('fecha_lanzamiento',)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['serie', 'descripcion', 'lanzamiento'], name='skullectors_clave_natural')
+        ]
+        indexes = [
+            models.Index(fields=['fecha_subida', 'id'], name='skullectors_subida_idx'),
+            models.Index(fields=['serie', 'id'], name='skullectors_serie_idx'),
+            models.Index(fields=['fecha_lanzamiento', 'id'], name='skullectors_lanzamiento_idx'),
+            models.Index(fields=['precioMercado'], name='skullectors_precio_idx'),
+        ]
+
     def __str__(self):
         return f"{self.serie} ({self.lanzamiento}"
-    
 
-class Foto(models.Model):
-    url = models.URLField(primary_key=True)
-    munieca = models.ForeignKey(Personajes, null=True, blank=True, on_delete=models.CASCADE, related_name='fotos')
-    edicion = models.ForeignKey(Ediciones, null=True, blank=True, on_delete=models.CASCADE, related_name='fotos')
-    skullector = models.ForeignKey(Skullectors, null=True, blank=True, on_delete=models.CASCADE, related_name='fotos')
-    mascota = models.ForeignKey(Mascotas, null=True, blank=True, on_delete=models.CASCADE, related_name='fotos')
+    def actualizar_campos_derivados(self):
+        self.fecha_lanzamiento = parsear_lanzamiento(self.lanzamiento)
+
+
+def hash_url(url):
+    # 64 bits del sha256 de la URL, con signo para que quepan en un bigint
+    return int.from_bytes(hashlib.sha256(url.encode('utf-8')).digest()[:8], 'big', signed=True)
+
+
+class Foto(CamposDerivadosMixin, models.Model):
+    # Clave entera en vez de la URL (hasta 200 caracteres): la unicidad de la URL la garantiza el índice
+    # único de url_hash, de 8 bytes. Dos URLs distintas con el mismo hash (muy improbable con 64 bits)
+    # se tratarían como repetidas
+    id = models.AutoField(primary_key=True)
+    url = models.URLField()
+    url_hash = models.BigIntegerField(unique=True, editable=False)
+    # Cada foto es de una sola cosa: los índices de las FK son parciales, sin las filas en las que son NULL
+    munieca = models.ForeignKey(Personajes, null=True, blank=True, on_delete=models.CASCADE, related_name='fotos', db_index=False)
+    edicion = models.ForeignKey(Ediciones, null=True, blank=True, on_delete=models.CASCADE, related_name='fotos', db_index=False)
+    skullector = models.ForeignKey(Skullectors, null=True, blank=True, on_delete=models.CASCADE, related_name='fotos', db_index=False)
+    mascota = models.ForeignKey(Mascotas, null=True, blank=True, on_delete=models.CASCADE, related_name='fotos', db_index=False)
     fecha_subida = models.DateTimeField(blank=False, default=timezone.now)
+
+    CAMPOS_DERIVADOS = ('url_hash',)
+    # Lo que sale en la API en lugar del id cuando la relación no se expande (ver campos.py)
+    REFERENCIA_API = 'url'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['munieca'], condition=models.Q(munieca__isnull=False), name='foto_munieca_idx'),
+            models.Index(fields=['edicion'], condition=models.Q(edicion__isnull=False), name='foto_edicion_idx'),
+            models.Index(fields=['skullector'], condition=models.Q(skullector__isnull=False), name='foto_skullector_idx'),
+            models.Index(fields=['mascota'], condition=models.Q(mascota__isnull=False), name='foto_mascota_idx'),
+        ]
+
     def __str__(self):
         return self.url
 
+    def actualizar_campos_derivados(self):
+        self.url_hash = hash_url(self.url)
+
+
+class DocumentoCatalogo(models.Model):
+    # Salida de CompletoSerializer precalculada por personaje (ver documentos.py). Se guarda como texto
+    # y no como JSONField porque jsonb reordena las claves y la respuesta tiene que ser la misma
+    personaje = models.OneToOneField(Personajes, primary_key=True, on_delete=models.CASCADE, related_name='documento')
+    datos = models.TextField()
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Documento de {self.personaje_id}"
+
+
+class HistorialPrecio(models.Model):
+    # Cada precio de mercado observado de una skullector (Skullectors.precioMercado es solo el último).
+    # Lo rellena precios.registrar_precios()
+    skullector = models.ForeignKey(Skullectors, on_delete=models.CASCADE, related_name='historial_precios')
+    precio = models.DecimalField(max_digits=10, decimal_places=2)
+    fecha = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['skullector', 'fecha'], name='historial_skullector_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.skullector_id}: {self.precio} ({self.fecha})"
+
+
+class ResumenPrecio(models.Model):
+    # Agregado por día o por mes del historial, actualizado a la vez que se registra cada precio: las
+    # tendencias se leen de aquí sin recorrer el historial
+    PERIODOS = [('dia', _('Día')), ('mes', _('Mes'))]
+
+    skullector = models.ForeignKey(Skullectors, on_delete=models.CASCADE, related_name='resumenes_precio')
+    periodo = models.CharField(max_length=3, choices=PERIODOS)
+    # Primer día del periodo
+    inicio = models.DateField()
+    minimo = models.DecimalField(max_digits=10, decimal_places=2)
+    maximo = models.DecimalField(max_digits=10, decimal_places=2)
+    # La media es suma / observaciones; se guardan por separado para poder sumar periodos y skullectors
+    suma = models.DecimalField(max_digits=14, decimal_places=2)
+    observaciones = models.PositiveIntegerField()
+    ultimo = models.DecimalField(max_digits=10, decimal_places=2)
+    fecha_ultimo = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['skullector', 'periodo', 'inicio'], name='resumen_precio_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['periodo', 'inicio'], name='resumen_periodo_inicio_idx'),
+        ]
+
+    @property
+    def media(self):
+        return self.suma / self.observaciones if self.observaciones else None
+
+    def __str__(self):
+        return f"{self.skullector_id} {self.periodo} {self.inicio}"
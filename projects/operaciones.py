@@ -0,0 +1,76 @@
+from django.db import migrations, transaction
+from django.db.migrations.exceptions import IrreversibleError
+
+
+# Piezas para migraciones que se aplican con la aplicación sirviendo peticiones (ver 0015_foto_clave_entera).
+# En PostgreSQL nada recorre una tabla con ella bloqueada: columnas sin valor por defecto, rellenos por lotes,
+# índices CONCURRENTLY y NOT NULL a partir de un CHECK ya validado. Las migraciones que las usan van sin
+# transacción (atomic = False): CREATE INDEX CONCURRENTLY no puede ir dentro de una
+
+LOTE = 1000
+
+
+class SinBloqueosEnPostgres(migrations.SeparateDatabaseAndState):
+    # Las operaciones de siempre para el estado y para la base de datos en SQLite (y el resto de motores);
+    # en PostgreSQL la base de datos se cambia con postgresql(schema_editor), que hace lo mismo sin bloquear.
+    # Marcha atrás solo con las operaciones de siempre y si reversible (SQLite no sabe devolver la clave
+    # primaria a una columna que ha dejado de serlo)
+
+    def __init__(self, operaciones, postgresql, reversible=True):
+        super().__init__(database_operations=operaciones, state_operations=operaciones)
+        self.postgresql = postgresql
+        self.reversible = reversible
+
+    def deconstruct(self):
+        kwargs = {'operaciones': self.state_operations, 'postgresql': self.postgresql}
+        if not self.reversible:
+            kwargs['reversible'] = False
+        return self.__class__.__qualname__, [], kwargs
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            self.postgresql(schema_editor)
+        else:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql' or not self.reversible:
+            raise IrreversibleError(f"{self.describe()} no se puede deshacer")
+        super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def rellenar_por_lotes(modelo, using, campo, calcular, origen):
+    # modelo.campo = calcular(modelo.origen) en todas las filas, por lotes en orden de clave y cada lote en
+    # su transacción. Con varias columnas de origen (una tupla) calcular las recibe en ese orden
+    origenes = origen if isinstance(origen, tuple) else (origen,)
+    ultima = None
+    while True:
+        with transaction.atomic(using=using):
+            filas = modelo.objects.using(using).order_by('pk').only('pk', *origenes)
+            if ultima is not None:
+                filas = filas.filter(pk__gt=ultima)
+            filas = list(filas[:LOTE])
+            if not filas:
+                return
+            for fila in filas:
+                setattr(fila, campo, calcular(*(getattr(fila, nombre) for nombre in origenes)))
+            modelo.objects.using(using).bulk_update(filas, [campo])
+        ultima = filas[-1].pk
+
+
+def no_nulo_postgresql(schema_editor, tabla, columna):
+    # SET NOT NULL sin recorrer la tabla bloqueada: PostgreSQL (12+) se fía de un CHECK ya validado, y
+    # VALIDATE no impide leer ni escribir mientras comprueba
+    restriccion = f'{tabla}_{columna}_not_null'
+    schema_editor.execute(f"ALTER TABLE {tabla} ADD CONSTRAINT {restriccion} CHECK ({columna} IS NOT NULL) NOT VALID")
+    schema_editor.execute(f"ALTER TABLE {tabla} VALIDATE CONSTRAINT {restriccion}")
+    schema_editor.execute(f"ALTER TABLE {tabla} ALTER COLUMN {columna} SET NOT NULL")
+    schema_editor.execute(f"ALTER TABLE {tabla} DROP CONSTRAINT {restriccion}")
+
+
+def unico_postgresql(schema_editor, tabla, columna):
+    # Índice único CONCURRENTLY convertido después en restricción, con el nombre que le pondría Django
+    nombre = schema_editor._create_index_name(tabla, [columna], suffix='_uniq')
+    schema_editor.execute(f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {nombre} ON {tabla} ({columna})")
+    schema_editor.execute(f"ALTER TABLE {tabla} ADD CONSTRAINT {nombre} UNIQUE USING INDEX {nombre}")
+    return nombre
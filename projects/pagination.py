@@ -0,0 +1,204 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Page
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _valor_cursor(valor):
+    # Sin perder precisión: DjangoJSONEncoder recorta los microsegundos y rompería el orden
+    if isinstance(valor, (datetime.datetime, datetime.date)):
+        return valor.isoformat()
+    if isinstance(valor, decimal.Decimal):
+        return str(valor)
+    return valor
+
+
+class KeysetPagination(BasePagination):
+    # Paginación por clave (keyset): en vez de COUNT(*) + OFFSET filtra por la última fila vista,
+    # así que cualquier página cuesta lo mismo siempre que el orden esté respaldado por un índice
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    # Campos por los que se puede ordenar; cada uno debe tener un índice compuesto (campo, id)
+    ordering_fields = ('fecha_subida', 'id')
+    default_ordering = ('-fecha_subida', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.recortar(list(self.consulta(queryset, request, view)))
+
+    def consulta(self, queryset, request, view=None):
+        # La consulta de la página (una fila de más para saber si hay siguiente), sin ejecutar: la vista
+        # async de asincrono.py la lee con el ORM async y la pasa a recortar()
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.ordering = self.get_ordering(request, view)
+
+        self.posicion, self.reverso = self.decode_cursor(request)
+        ordering = self.ordering
+        if self.reverso:
+            ordering = tuple(campo[1:] if campo.startswith('-') else '-' + campo for campo in ordering)
+
+        queryset = queryset.order_by(*ordering)
+        if self.posicion is not None:
+            queryset = queryset.filter(self._filtro_posterior(ordering, self.posicion))
+        return queryset[:self.page_size + 1]
+
+    def recortar(self, filas):
+        hay_mas = len(filas) > self.page_size
+        filas = filas[:self.page_size]
+        if self.reverso:
+            filas.reverse()
+
+        self.has_next = hay_mas if not self.reverso else True
+        self.has_previous = hay_mas if self.reverso else self.posicion is not None
+        self.filas = filas
+        return filas
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_ordering(self, request, view):
+        permitidos = getattr(view, 'cursor_ordering_fields', self.ordering_fields)
+        ordering = request.query_params.get(self.ordering_param)
+        if not ordering:
+            return self.default_ordering
+
+        campos = [campo.strip() for campo in ordering.split(',') if campo.strip()]
+        principal = campos[0]
+        nombre = principal.lstrip('-')
+        desempate = campos[1:]
+        if nombre not in permitidos or desempate not in ([], ['id'], ['-id']):
+            raise ValidationError(
+                f"Con paginación por cursor solo se puede ordenar por: {', '.join(permitidos)}"
+            )
+        if nombre == 'id':
+            return (principal,)
+        # El id desempata en el mismo sentido que el campo principal para aprovechar el índice compuesto
+        return (principal, '-id' if principal.startswith('-') else 'id')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.filas[-1], reverso=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.filas:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.filas[0], reverso=True)
+
+    def encode_cursor(self, fila, reverso):
+        valores = [_valor_cursor(self._valor(fila, campo.lstrip('-'))) for campo in self.ordering]
+        datos = json.dumps({'v': valores, 'r': reverso}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(datos.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            datos = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            valores = datos['v']
+            if len(valores) != len(self.ordering):
+                raise ValueError
+            posicion = [
+                self.model._meta.get_field(campo.lstrip('-')).to_python(valor)
+                for campo, valor in zip(self.ordering, valores)
+            ]
+            return posicion, bool(datos.get('r'))
+        except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError, ValidationError):
+            raise ValidationError("El cursor de paginación no es válido")
+
+    def _valor(self, fila, campo):
+        if isinstance(fila, dict):
+            return fila[campo]
+        return getattr(fila, campo)
+
+    def _filtro_posterior(self, ordering, posicion):
+        # (a > x) OR (a = x AND b > y) ... respetando el sentido de cada campo
+        filtro = Q()
+        iguales = Q()
+        for campo, valor in zip(ordering, posicion):
+            nombre = campo.lstrip('-')
+            operador = 'lt' if campo.startswith('-') else 'gt'
+            filtro |= iguales & Q(**{f'{nombre}__{operador}': valor})
+            iguales &= Q(**{nombre: valor})
+        return filtro
+
+
+class CatalogoPagination(BasePagination):
+    # Paginación por número de página (la de siempre) salvo que el cliente pida ?paginacion=cursor
+    modo_param = 'paginacion'
+    paginador = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.por_cursor(request):
+            self.paginador = KeysetPagination()
+        else:
+            self.paginador = PageNumberPagination()
+        return self.paginador.paginate_queryset(queryset, request, view)
+
+    def por_cursor(self, request):
+        return request.query_params.get(self.modo_param) == 'cursor' or KeysetPagination.cursor_query_param in request.query_params
+
+    async def apaginar(self, queryset, request, view, leer):
+        # paginate_queryset() para las vistas async (asincrono.py): mismas páginas y enlaces, pero el COUNT y
+        # la página se consultan con el ORM async (leer(queryset) devuelve la lista de filas)
+        if self.por_cursor(request):
+            self.paginador = KeysetPagination()
+            return self.paginador.recortar(await leer(self.paginador.consulta(queryset, request, view)))
+
+        self.paginador = paginador = PageNumberPagination()
+        page_size = paginador.get_page_size(request)
+        if not page_size:
+            return None
+        django_paginator = paginador.django_paginator_class(queryset, page_size)
+        django_paginator.count = await queryset.acount()
+        page_number = paginador.get_page_number(request, django_paginator)
+        try:
+            numero = django_paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(paginador.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        inicio = (numero - 1) * django_paginator.per_page
+        fin = min(inicio + django_paginator.per_page, django_paginator.count)
+        paginador.request = request
+        paginador.page = Page(await leer(queryset[inicio:fin]), numero, django_paginator)
+        return list(paginador.page)
+
+    def get_paginated_response(self, data):
+        return self.paginador.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return PageNumberPagination().get_paginated_response_schema(schema)
+
+    def __getattr__(self, nombre):
+        # display_page_controls, to_html... los resuelve el paginador que se eligió para esta petición
+        return getattr(self.paginador, nombre)
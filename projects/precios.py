@@ -0,0 +1,169 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+
+from .cache import invalidar
+from .models import HistorialPrecio, ResumenPrecio, Skullectors
+from .search import _trozos
+
+
+PERIODOS = ('dia', 'mes')
+
+
+def inicio_periodo(fecha, periodo):
+    dia = timezone.localdate(fecha) if timezone.is_aware(fecha) else fecha.date()
+    return dia if periodo == 'dia' else dia.replace(day=1)
+
+
+def registrar_precios(observaciones, using='default'):
+    # observaciones: (skullector_id, precio, fecha). Se guardan en el historial y se suman a los resúmenes
+    # diarios y mensuales en la misma transacción: una lectura del resumen existente (bloqueado) por lote
+    # y un bulk_update/bulk_create, no una consulta por observación
+    observaciones = [(pk, Decimal(precio), fecha) for pk, precio, fecha in observaciones]
+    if not observaciones:
+        return
+
+    nuevos = defaultdict(list)
+    for pk, precio, fecha in observaciones:
+        for periodo in PERIODOS:
+            nuevos[(pk, periodo, inicio_periodo(fecha, periodo))].append((fecha, precio))
+
+    with transaction.atomic(using=using):
+        HistorialPrecio.objects.using(using).bulk_create(
+            [HistorialPrecio(skullector_id=pk, precio=precio, fecha=fecha) for pk, precio, fecha in observaciones],
+            batch_size=1000,
+        )
+        existentes = {}
+        for trozo in _trozos({pk for pk, _, _ in observaciones}):
+            resumenes = ResumenPrecio.objects.using(using).select_for_update().filter(
+                skullector_id__in=trozo, inicio__in={inicio for _, _, inicio in nuevos},
+            )
+            existentes.update({(r.skullector_id, r.periodo, r.inicio): r for r in resumenes})
+
+        crear, actualizar = [], []
+        for clave, precios in nuevos.items():
+            precios.sort()
+            resumen = existentes.get(clave)
+            if resumen is None:
+                pk, periodo, inicio = clave
+                resumen = ResumenPrecio(
+                    skullector_id=pk, periodo=periodo, inicio=inicio, minimo=precios[0][1], maximo=precios[0][1],
+                    suma=0, observaciones=0, ultimo=precios[-1][1], fecha_ultimo=precios[-1][0],
+                )
+                crear.append(resumen)
+            else:
+                actualizar.append(resumen)
+            for fecha, precio in precios:
+                resumen.minimo = min(resumen.minimo, precio)
+                resumen.maximo = max(resumen.maximo, precio)
+                resumen.suma += precio
+                resumen.observaciones += 1
+                # Una observación atrasada no cambia el último precio del periodo
+                if fecha >= resumen.fecha_ultimo:
+                    resumen.ultimo, resumen.fecha_ultimo = precio, fecha
+
+        ResumenPrecio.objects.using(using).bulk_create(crear, batch_size=1000)
+        ResumenPrecio.objects.using(using).bulk_update(
+            actualizar, ['minimo', 'maximo', 'suma', 'observaciones', 'ultimo', 'fecha_ultimo'], batch_size=1000,
+        )
+    invalidar(ResumenPrecio)
+
+
+def ultimos_precios(ids, using='default'):
+    # Último precio registrado de cada skullector, sacado de sus resúmenes mensuales
+    ultimos = {}
+    for trozo in _trozos(set(ids)):
+        filas = ResumenPrecio.objects.using(using).filter(skullector_id__in=trozo, periodo='mes').order_by('skullector_id', '-fecha_ultimo')
+        for pk, ultimo in filas.values_list('skullector_id', 'ultimo'):
+            ultimos.setdefault(pk, ultimo)
+    return ultimos
+
+
+def sincronizar_precios(ids, using='default'):
+    # Registra el precioMercado actual de las skullectors indicadas si no es el último que consta.
+    # 0 es el valor por defecto del serializador (sin precio), no una observación
+    actuales = {}
+    for trozo in _trozos(set(ids)):
+        actuales.update(
+            Skullectors.objects.using(using).filter(pk__in=trozo, precioMercado__gt=0).values_list('pk', 'precioMercado')
+        )
+    if not actuales:
+        return
+    ultimos = ultimos_precios(actuales, using=using)
+    ahora = timezone.now()
+    registrar_precios(
+        [(pk, precio, ahora) for pk, precio in actuales.items() if ultimos.get(pk) != precio], using=using,
+    )
+
+
+def _decimal(params, nombre):
+    valor = params.get(nombre, None)
+    if valor is None:
+        return None
+    try:
+        numero = Decimal(valor)
+    except InvalidOperation:
+        numero = None
+    if numero is None or not numero.is_finite():
+        raise ValidationError(f"El parámetro '{nombre}' debe ser un número")
+    return numero
+
+
+def filtrar_precio(queryset, params, campo='precioMercado'):
+    # ?precio_min= y ?precio_max= (incluidos) sobre el precio de mercado actual, indexado
+    minimo = _decimal(params, 'precio_min')
+    if minimo is not None:
+        queryset = queryset.filter(**{f'{campo}__gte': minimo})
+    maximo = _decimal(params, 'precio_max')
+    if maximo is not None:
+        queryset = queryset.filter(**{f'{campo}__lte': maximo})
+    return queryset
+
+
+def _fecha(params, nombre):
+    valor = params.get(nombre, None)
+    if valor is None:
+        return None
+    try:
+        return datetime.date.fromisoformat(valor)
+    except ValueError:
+        raise ValidationError(f"El parámetro '{nombre}' debe ser una fecha AAAA-MM-DD")
+
+
+def filtrar_resumenes(resumenes, params):
+    # ?periodo=dia|mes (mes por defecto), ?desde= y ?hasta= (AAAA-MM-DD, incluidos) sobre el inicio del periodo
+    periodo = params.get('periodo', 'mes')
+    if periodo not in PERIODOS:
+        raise ValidationError("El parámetro 'periodo' debe ser 'dia' o 'mes'")
+    resumenes = resumenes.filter(periodo=periodo)
+    desde = _fecha(params, 'desde')
+    if desde is not None:
+        resumenes = resumenes.filter(inicio__gte=desde if periodo == 'dia' else desde.replace(day=1))
+    hasta = _fecha(params, 'hasta')
+    if hasta is not None:
+        resumenes = resumenes.filter(inicio__lte=hasta)
+    return resumenes.order_by('inicio')
+
+
+def tendencia_precios(resumenes):
+    # Los resúmenes de varias skullectors sumados por periodo: mínimo, máximo y media de todas las observaciones
+    filas = resumenes.values('inicio').annotate(
+        precio_minimo=Min('minimo'), precio_maximo=Max('maximo'), precio_suma=Sum('suma'),
+        total_observaciones=Sum('observaciones'), skullectors=Count('skullector', distinct=True),
+    ).order_by('inicio')
+    return [
+        {
+            'inicio': fila['inicio'],
+            'minimo': fila['precio_minimo'],
+            'maximo': fila['precio_maximo'],
+            'media': fila['precio_suma'] / fila['total_observaciones'],
+            'observaciones': fila['total_observaciones'],
+            'skullectors': fila['skullectors'],
+        }
+        for fila in filas
+    ]
@@ -0,0 +1,78 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# orjson y msgpack son opcionales: sin orjson se usa el JSON de DRF y sin msgpack no se
+# ofrece application/msgpack (ver REST_FRAMEWORK en settings.py)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Lo que orjson/msgpack no saben convertir (Decimal, date, time, timedelta, lazy strings, QuerySet...)
+# y los datetime se convierten igual que con el JSONRenderer de DRF, así los formatos dan los mismos datos
+_convertir = JSONEncoder().default
+
+
+class OrjsonRenderer(JSONRenderer):
+    # Mismo application/json que el JSONRenderer de DRF y la misma salida byte a byte, pero con orjson.
+    # Si se pide indentación (API navegable, "; indent=4") o no está orjson, se usa el de DRF
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=_convertir, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        # Como DRF: \u2028 y \u2029 escapados para que el JSON sea también JavaScript válido
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_convertir, use_bin_type=True)
+
+
+class OrjsonParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        contenido = stream.read() if stream is not None else b''
+        try:
+            if encoding.lower().replace('-', '') != 'utf8':
+                contenido = contenido.decode(encoding)
+            return orjson.loads(contenido)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        contenido = stream.read() if stream is not None else b''
+        try:
+            return msgpack.unpackb(contenido, raw=False)
+        except (ValueError, TypeError, msgpack.UnpackException) as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
@@ -0,0 +1,96 @@
+import re
+import unicodedata
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+
+def normalizar_texto(texto):
+    # minúsculas y sin tildes, igual para el documento guardado que para lo que se busca
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+
+def tabla_fts(modelo):
+    return f'{modelo._meta.db_table}_fts'
+
+
+def buscar_personajes(queryset, termino):
+    # Devuelve el queryset filtrado por ?q= y ordenado por relevancia (anotada como 'relevancia')
+    termino = normalizar_texto(termino)
+    palabras = re.findall(r'\w+', termino)
+    if not palabras:
+        return queryset
+
+    tabla = queryset.model._meta.db_table
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'postgresql':
+        # Mismas expresiones que los índices GIN creados en la migración 0008
+        vector = f"to_tsvector('spanish'::regconfig, \"{tabla}\".\"busqueda\")"
+        consulta = "plainto_tsquery('spanish'::regconfig, %s)"
+        coincide = RawSQL(
+            f"({vector} @@ {consulta} OR %s <%% \"{tabla}\".\"busqueda\")",
+            [termino, termino], output_field=BooleanField()
+        )
+        relevancia = RawSQL(
+            f"GREATEST(ts_rank({vector}, {consulta}), word_similarity(%s, \"{tabla}\".\"busqueda\"))",
+            [termino, termino], output_field=FloatField()
+        )
+    elif vendor == 'sqlite':
+        fts = tabla_fts(queryset.model)
+        # Cada palabra como prefijo entre comillas: no se interpreta la sintaxis de FTS5 que escriba el usuario
+        match = ' '.join(f'"{palabra}"*' for palabra in palabras)
+        coincide = RawSQL(
+            f"\"{tabla}\".\"id\" IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)",
+            [match], output_field=BooleanField()
+        )
+        relevancia = RawSQL(
+            f"(SELECT -bm25({fts}) FROM {fts} WHERE {fts} MATCH %s AND rowid = \"{tabla}\".\"id\")",
+            [match], output_field=FloatField()
+        )
+    else:
+        filtro = Q()
+        for palabra in palabras:
+            filtro &= Q(busqueda__contains=palabra)
+        return queryset.filter(filtro).annotate(relevancia=Value(1.0, output_field=FloatField())).order_by('id')
+
+    return queryset.filter(coincide).annotate(relevancia=relevancia).order_by('-relevancia', 'id')
+
+
+def _trozos(ids, tamanio=500):
+    ids = list(ids)
+    for inicio in range(0, len(ids), tamanio):
+        yield ids[inicio:inicio + tamanio]
+
+
+def indexar_personajes(ids, using='default'):
+    # En PostgreSQL el índice es una expresión sobre la columna y se mantiene solo;
+    # en SQLite la tabla FTS5 hay que mantenerla a mano
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    from .models import Personajes
+    tabla = Personajes._meta.db_table
+    fts = tabla_fts(Personajes)
+    with connection.cursor() as cursor:
+        for trozo in _trozos(ids):
+            marcadores = ', '.join(['%s'] * len(trozo))
+            cursor.execute(f"DELETE FROM {fts} WHERE rowid IN ({marcadores})", trozo)
+            cursor.execute(
+                f"INSERT INTO {fts} (rowid, busqueda) SELECT id, busqueda FROM {tabla} WHERE id IN ({marcadores})", trozo
+            )
+
+
+def desindexar_personajes(ids, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    from .models import Personajes
+    fts = tabla_fts(Personajes)
+    with connection.cursor() as cursor:
+        for trozo in _trozos(ids):
+            marcadores = ', '.join(['%s'] * len(trozo))
+            cursor.execute(f"DELETE FROM {fts} WHERE rowid IN ({marcadores})", trozo)
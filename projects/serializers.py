@@ -1,8 +1,11 @@
 from rest_framework import serializers
-from .models import Personajes, Mascotas, Ediciones, Skullectors, Foto, Usuario
+from .models import Personajes, Mascotas, Ediciones, Skullectors, Foto, Usuario, ResumenPrecio
 from rest_framework import serializers
 from django.contrib.auth import authenticate, get_user_model
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt import serializers as jwt_serializers
+
+from .imagenes import urls_variantes
+from .tokens import RefreshToken, purga_programada
 
 # Usuario = get_user_model()
 
@@ -37,6 +40,8 @@ class PersonajesSerializer(serializers.ModelSerializer):
     class Meta:
         model = Personajes
         fields = ('id', 'nombre', 'monstruo', 'lanzamiento', 'cumpleanios', 'ciudadNatal', 'edad', 'fotos', 'frase', 'colorFav', 'sexo')
+        # Sin UniqueTogetherValidator: el duplicado lo detecta la restricción única al insertar (guardar_unico)
+        validators = []
 
 class MascotasCompletaSerializer(serializers.ModelSerializer):
     nombre = serializers.CharField(required=True)
@@ -46,6 +51,7 @@ class MascotasCompletaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Mascotas
         fields = ('id', 'nombre', 'tipo', 'fotos', 'duenio')
+        validators = []
 
 class SkullectorSerializer(serializers.ModelSerializer):
     serie = serializers.CharField(required=True)
@@ -76,6 +82,7 @@ class SkullectorCompletaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Skullectors
         fields = ('id', 'serie', 'lanzamiento', 'descripcion', 'fotos', 'limitada', 'inspiracion', 'certificado', 'precioOriginal', 'precioMercado', 'muneca')
+        validators = []
 
 
 class EdicionCompletaSerializer(serializers.ModelSerializer):
@@ -108,10 +115,77 @@ class CompletoSerializer(serializers.ModelSerializer):
 
 
 
+# Serializadores planos para las cargas masivas (/bulk/): las FK van como id y se comprueban
+# todas juntas en la vista, en lugar de una consulta por fila
+class PersonajesBulkSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    sexo = serializers.ChoiceField(choices=['Masculino', 'Femenino'], default='Femenino')
+
+    class Meta:
+        model = Personajes
+        fields = ('id', 'nombre', 'monstruo', 'lanzamiento', 'cumpleanios', 'ciudadNatal', 'edad', 'frase', 'colorFav', 'sexo')
+        # Los duplicados los descarta BulkMixin con una consulta por lote, no una por fila
+        validators = []
+
+
+class MascotasBulkSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    duenio = serializers.IntegerField(source='duenio_id', required=False, allow_null=True)
+
+    class Meta:
+        model = Mascotas
+        fields = ('id', 'nombre', 'tipo', 'duenio')
+        validators = []
+
+
+class EdicionesBulkSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    generacion = serializers.ChoiceField(choices=[1, 2, 3])
+    muneca = serializers.IntegerField(source='muneca_id', required=False, allow_null=True)
+
+    class Meta:
+        model = Ediciones
+        fields = ('id', 'serie', 'lanzamiento', 'generacion', 'muneca')
+
+
+class SkullectorsBulkSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    muneca = serializers.IntegerField(source='muneca_id', required=False, allow_null=True)
+
+    class Meta:
+        model = Skullectors
+        fields = ('id', 'serie', 'lanzamiento', 'descripcion', 'limitada', 'inspiracion', 'certificado', 'precioOriginal', 'precioMercado', 'muneca')
+        validators = []
+
+
+class ResumenPrecioSerializer(serializers.ModelSerializer):
+    media = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = ResumenPrecio
+        fields = ('periodo', 'inicio', 'minimo', 'maximo', 'media', 'ultimo', 'observaciones')
+
+
+class TendenciaPrecioSerializer(serializers.Serializer):
+    inicio = serializers.DateField()
+    minimo = serializers.DecimalField(max_digits=10, decimal_places=2)
+    maximo = serializers.DecimalField(max_digits=10, decimal_places=2)
+    media = serializers.DecimalField(max_digits=10, decimal_places=2)
+    observaciones = serializers.IntegerField()
+    skullectors = serializers.IntegerField()
+
+
 class UserSerializer(serializers.ModelSerializer):
+    # URLs de los recortes de la foto por formato y ancho, para que el cliente baje el más pequeño que le sirva.
+    # Vacío mientras se generan (justo después de subirla)
+    profile_picture_variantes = serializers.SerializerMethodField()
+
     class Meta:
         model = Usuario
-        fields = ['id','username','email','first_name','last_name','profile_picture','description','gender','pronouns','is_staff',]
+        fields = ['id','username','email','first_name','last_name','profile_picture','profile_picture_variantes','description','gender','pronouns','is_staff',]
+
+    def get_profile_picture_variantes(self, obj):
+        return urls_variantes(obj.profile_picture_variantes, self.context.get('request'))
 
 
 
@@ -143,11 +217,14 @@ class RegisterSerializer(serializers.ModelSerializer):
         description = validated_data.pop('description', '')
         gender = validated_data.pop('gender', '')
         pronouns = validated_data.pop('pronouns', '')
+        # RegisterView la trae ya cifrada desde el pool; si no, create_user la cifra como siempre
+        password_cifrada = validated_data.pop('password_cifrada', None)
 
         user = Usuario.objects.create_user(
             username=validated_data['username'],
             email=validated_data['email'],
             password=validated_data['password'],
+            password_cifrada=password_cifrada,
             profile_picture=profile_picture,
             description=description,
             gender=gender,
@@ -199,11 +276,24 @@ class LoginSerializer(serializers.Serializer):
         user = authenticate(username=email, password=password)
         if user is None:
             raise serializers.ValidationError("Credenciales incorrectas")
-        
-        refresh = RefreshToken.for_user(user)
-        return {
-            'refresh': str(refresh),
-            'access': str(refresh.access_token),
-            'user': UserSerializer(user).data
-        }
+        return respuesta_login(user)
+
+
+def respuesta_login(user):
+    refresh = RefreshToken.for_user(user)
+    return {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+        'user': UserSerializer(user).data
+    }
+
+
+
+# token/refresh/: la lista negra se mira en el filtro de tokens.py y, de vez en cuando, se purgan los caducados
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    token_class = RefreshToken
 
+    def validate(self, attrs):
+        datos = super().validate(attrs)
+        purga_programada()
+        return datos
@@ -0,0 +1,130 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .autenticacion import olvidar_usuario
+from .cache import invalidar
+from .documentos import personajes_afectados, reconstruir_documentos
+from .imagenes import programar_variantes
+from .models import Personajes, Mascotas, Ediciones, Skullectors, Foto, Usuario
+from .precios import sincronizar_precios
+from .search import desindexar_personajes, indexar_personajes
+from .tokens import lista_negra
+
+
+@receiver(post_save, sender=Personajes)
+def indexar_personaje(sender, instance, using, **kwargs):
+    indexar_personajes([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Personajes)
+def desindexar_personaje(sender, instance, using, **kwargs):
+    desindexar_personajes([instance.pk], using=using)
+
+
+# Cada precio de mercado nuevo queda en el historial y en los resúmenes diarios/mensuales
+@receiver(post_save, sender=Skullectors)
+def registrar_precio_mercado(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        sincronizar_precios([instance.pk], using=using)
+
+
+# Personajes que se están borrando en este hilo: sus hijos caen en cascada antes que ellos y no hay que
+# regenerarles el documento (que ya se ha borrado)
+_borrando = threading.local()
+
+
+def _personajes_borrandose():
+    if not hasattr(_borrando, 'ids'):
+        _borrando.ids = set()
+    return _borrando.ids
+
+
+@receiver(pre_delete, sender=Personajes)
+def marcar_personaje_borrandose(sender, instance, **kwargs):
+    _personajes_borrandose().add(instance.pk)
+
+
+@receiver(post_delete, sender=Personajes)
+def desmarcar_personaje_borrandose(sender, instance, **kwargs):
+    _personajes_borrandose().discard(instance.pk)
+
+
+# Documentos precalculados de /todos/: antes de escribir se apunta a qué personajes pertenecía la fila
+# (una mascota puede cambiar de dueño) y después se reconstruyen esos y los actuales
+@receiver(pre_save, sender=Mascotas)
+@receiver(pre_save, sender=Ediciones)
+@receiver(pre_save, sender=Skullectors)
+@receiver(pre_save, sender=Foto)
+@receiver(pre_delete, sender=Mascotas)
+@receiver(pre_delete, sender=Ediciones)
+@receiver(pre_delete, sender=Skullectors)
+@receiver(pre_delete, sender=Foto)
+def recordar_personajes_afectados(sender, instance, using, **kwargs):
+    instance._personajes_afectados = personajes_afectados(sender, [instance.pk], using=using) if instance.pk is not None else set()
+
+
+@receiver(post_save, sender=Personajes)
+@receiver(post_save, sender=Mascotas)
+@receiver(post_save, sender=Ediciones)
+@receiver(post_save, sender=Skullectors)
+@receiver(post_save, sender=Foto)
+def reconstruir_documento(sender, instance, using, **kwargs):
+    afectados = getattr(instance, '_personajes_afectados', set()) | personajes_afectados(sender, [instance.pk], using=using)
+    reconstruir_documentos(afectados, using=using)
+
+
+@receiver(post_delete, sender=Mascotas)
+@receiver(post_delete, sender=Ediciones)
+@receiver(post_delete, sender=Skullectors)
+@receiver(post_delete, sender=Foto)
+def reconstruir_documento_tras_borrar(sender, instance, using, **kwargs):
+    afectados = getattr(instance, '_personajes_afectados', set()) - _personajes_borrandose()
+    reconstruir_documentos(afectados, using=using)
+
+
+# La versión de la caché sube después de reconstruir los documentos (los receptores se llaman en el orden en
+# que se registran): una lectura entre medias cachearía el documento viejo con la versión nueva
+@receiver(post_save, sender=Personajes)
+@receiver(post_save, sender=Mascotas)
+@receiver(post_save, sender=Ediciones)
+@receiver(post_save, sender=Skullectors)
+@receiver(post_save, sender=Foto)
+@receiver(post_delete, sender=Personajes)
+@receiver(post_delete, sender=Mascotas)
+@receiver(post_delete, sender=Ediciones)
+@receiver(post_delete, sender=Skullectors)
+@receiver(post_delete, sender=Foto)
+def invalidar_cache_catalogo(sender, **kwargs):
+    invalidar(sender)
+
+
+# Usuario cacheado por CachedJWTAuthentication: cualquier cambio (desactivarlo, otra contraseña...) o su borrado
+# obliga a leerlo otra vez de la base de datos
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def olvidar_usuario_autenticado(sender, instance, **kwargs):
+    olvidar_usuario(instance.pk)
+
+
+# Foto de perfil nueva o cambiada (registro, PATCH de usuarios/...): sus variantes se generan fuera de la petición
+@receiver(post_save, sender=Usuario)
+def generar_variantes_foto_perfil(sender, instance, raw=False, **kwargs):
+    if not raw:
+        programar_variantes(instance)
+
+
+# Filtros de la lista negra de cada proceso: cualquier fila nueva (logout, rotación, el admin de token_blacklist)
+# sube el contador de cambios y cualquier borrado la generación, una vez confirmada la transacción
+@receiver(post_save, sender=BlacklistedToken)
+def avisar_token_en_lista_negra(sender, created, **kwargs):
+    if created:
+        transaction.on_commit(lista_negra.anotar)
+
+
+@receiver(post_delete, sender=BlacklistedToken)
+def reiniciar_lista_negra(sender, **kwargs):
+    transaction.on_commit(lista_negra.reiniciar)
@@ -1,3 +1,1617 @@
-from django.test import TestCase
+import csv
+import functools
+import gzip
+import http.server
+import importlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import brotli
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import msgpack
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from . import asincrono, lectura, middleware
+from .models import Personajes, Mascotas, Ediciones, Skullectors, Foto, Usuario, DocumentoCatalogo, ResumenPrecio, hash_url
+from .fechas import parsear_cumpleanios, parsear_lanzamiento
+from .hashing import pool_hashing
+from .management.commands.bench_carga import rutas
+from .precios import registrar_precios
+from .renderers import OrjsonRenderer
+from .serializers import CompletoSerializer
+from .tokens import FiltroBloom, ListaNegra, RefreshToken, lista_negra
+
+
+def crear_personaje(n):
+    personaje = Personajes.objects.create(
+        nombre=f'Personaje {n}', monstruo='Vampiro', lanzamiento='2010-07',
+        cumpleanios='05-13', ciudadNatal='Transilvania', edad=1600 + n,
+        frase='Frase', colorFav='Rosa', sexo='Femenino'
+    )
+    Foto.objects.create(url=f'https://fotos.example.com/personajes/{n}.png', munieca=personaje)
+    mascota = Mascotas.objects.create(nombre=f'Mascota {n}', tipo='Murcielago', duenio=personaje)
+    Foto.objects.create(url=f'https://fotos.example.com/mascotas/{n}.png', mascota=mascota)
+    edicion = Ediciones.objects.create(muneca=personaje, serie='Basic', lanzamiento='2010-07', generacion=1)
+    Foto.objects.create(url=f'https://fotos.example.com/ediciones/{n}.png', edicion=edicion)
+    skullector = Skullectors.objects.create(
+        muneca=personaje, serie='Skullector', lanzamiento='2021-10', descripcion=f'Edición de coleccionista {n}',
+        precioOriginal='45.00', precioMercado='90.00'
+    )
+    Foto.objects.create(url=f'https://fotos.example.com/skullectors/{n}.png', skullector=skullector)
+    return personaje
+
+
+class CatalogoTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(username='lector', email='lector@example.com', password='clave-segura-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(consultas), respuesta
+
+
+class CompletoConsultasTests(CatalogoTestCase):
+    def test_consultas_constantes_por_pagina(self):
+        for n in range(2):
+            crear_personaje(n)
+        pocas, respuesta = self.contar_consultas('/api/v1/todos/')
+        self.assertEqual(len(respuesta.data['results']), 2)
+
+        for n in range(2, 10):
+            crear_personaje(n)
+        muchas, respuesta = self.contar_consultas('/api/v1/todos/')
+        self.assertEqual(len(respuesta.data['results']), 10)
+
+        self.assertEqual(pocas, muchas)
+
+    def test_detalle_sin_consultas_por_relacion(self):
+        personaje = crear_personaje(0)
+        Foto.objects.create(url='https://fotos.example.com/personajes/extra.png', munieca=personaje)
+        Mascotas.objects.create(nombre='Otra', tipo='Gato', duenio=personaje)
+        Ediciones.objects.create(muneca=personaje, serie='Sweet 1600', lanzamiento='2011-01', generacion=1)
+        consultas, respuesta = self.contar_consultas(f'/api/v1/todos/{personaje.id}/')
+        self.assertEqual(len(respuesta.data['fotos']), 2)
+        self.assertEqual(len(respuesta.data['mascota']), 2)
+        self.assertEqual(len(respuesta.data['ediciones']), 2)
+        self.assertEqual(respuesta.data['ediciones'][0]['fotos'][0]['url'], 'https://fotos.example.com/ediciones/0.png')
+        # agregado del ETag + personaje con su documento precalculado
+        self.assertEqual(consultas, 2)
+
+
+class PaginacionCursorTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        fecha = timezone.now()
+        # Varias filas con la misma fecha_subida para comprobar el desempate por id
+        for n in range(25):
+            Personajes.objects.create(
+                nombre=f'Personaje {n:02d}', monstruo='Zombie', lanzamiento='2010-07', edad=15,
+                fecha_subida=fecha - timedelta(minutes=n // 3)
+            )
+
+    def recorrer(self, url):
+        ids = []
+        while url:
+            respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertNotIn('count', respuesta.data)
+            ids.extend(fila['id'] for fila in respuesta.data['results'])
+            url = respuesta.data['next']
+        return ids
+
+    def test_recorre_todas_las_filas_sin_repetir(self):
+        ids = self.recorrer('/api/v1/personajes/?paginacion=cursor')
+        esperado = list(Personajes.objects.order_by('-fecha_subida', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, esperado)
+
+    def test_ordering_indexado(self):
+        ids = self.recorrer('/api/v1/personajes/?paginacion=cursor&ordering=nombre')
+        esperado = list(Personajes.objects.order_by('nombre', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, esperado)
+
+    def test_pagina_anterior(self):
+        primera = self.client.get('/api/v1/personajes/?paginacion=cursor')
+        segunda = self.client.get(primera.data['next'])
+        anterior = self.client.get(segunda.data['previous'])
+        self.assertEqual(anterior.data['results'], primera.data['results'])
+        self.assertIsNone(anterior.data['previous'])
+
+    def test_ordering_sin_indice_rechazado(self):
+        respuesta = self.client.get('/api/v1/personajes/?paginacion=cursor&ordering=edad')
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_cursor_invalido(self):
+        respuesta = self.client.get('/api/v1/personajes/?cursor=no-es-un-cursor')
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_paginacion_por_numero_sigue_por_defecto(self):
+        respuesta = self.client.get('/api/v1/personajes/?page=3')
+        self.assertEqual(respuesta.data['count'], 25)
+        self.assertEqual(len(respuesta.data['results']), 5)
+
+
+class BusquedaPersonajesTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.draculaura = Personajes.objects.create(
+            nombre='Draculaura', monstruo='Vampiro', lanzamiento='2010-07', edad=1600,
+            ciudadNatal='Transilvania', frase='¡Oh, Dios mío!', colorFav='Rosa'
+        )
+        self.clawdeen = Personajes.objects.create(
+            nombre='Clawdeen Wolf', monstruo='Mujer lobo', lanzamiento='2010-07', edad=15,
+            ciudadNatal='Nueva Salem', frase='Una chica tiene que tener estilo', colorFav='Morado'
+        )
+        self.lagoona = Personajes.objects.create(
+            nombre='Lagoona Blue', monstruo='Monstruo marino', lanzamiento='2010-07', edad=15,
+            ciudadNatal='Gran Barrera de Coral', frase='Rosa no, azul', colorFav='Azul'
+        )
+
+    def ids(self, url):
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return [fila['id'] for fila in respuesta.data['results']]
+
+    def test_documento_normalizado(self):
+        self.draculaura.refresh_from_db()
+        self.assertIn('oh, dios mio!', self.draculaura.busqueda)
+        self.assertIn('transilvania', self.draculaura.busqueda)
+
+    def test_migracion_rellena_por_lotes(self):
+        migracion = importlib.import_module('projects.migrations.0008_busqueda_personajes')
+        esperado = dict(Personajes.objects.values_list('id', 'busqueda'))
+        Personajes.objects.update(busqueda='')
+        with mock.patch('projects.operaciones.LOTE', 2):
+            migracion.rellenar_busqueda(apps, connection.schema_editor())
+        self.assertEqual(dict(Personajes.objects.values_list('id', 'busqueda')), esperado)
+
+    def test_busqueda_sin_tildes_y_por_prefijo(self):
+        self.assertEqual(self.ids('/api/v1/personajes/?q=TRANSILV'), [self.draculaura.id])
+        self.assertEqual(self.ids('/api/v1/todos/?q=mío'), [self.draculaura.id])
+
+    def test_todas_las_palabras(self):
+        # "rosa" aparece en el color favorito de Draculaura y en la frase de Lagoona
+        self.assertEqual(set(self.ids('/api/v1/personajes/?q=rosa')), {self.draculaura.id, self.lagoona.id})
+        self.assertEqual(self.ids('/api/v1/personajes/?q=azul rosa'), [self.lagoona.id])
+
+    def test_ordenado_por_relevancia(self):
+        vampira = Personajes.objects.create(
+            nombre='Vampira', monstruo='Vampiro', lanzamiento='2012-01', edad=16, frase='Vampiro', colorFav='Vampiro'
+        )
+        self.assertEqual(self.ids('/api/v1/personajes/?q=vampiro'), [vampira.id, self.draculaura.id])
+        self.assertEqual(self.ids('/api/v1/personajes/?q=vampiro&ordering=id'), [self.draculaura.id, vampira.id])
+
+    def test_indice_al_dia_tras_editar_y_borrar(self):
+        self.clawdeen.frase = 'Aúúú a la luna'
+        self.clawdeen.save()
+        self.assertEqual(self.ids('/api/v1/personajes/?q=luna'), [self.clawdeen.id])
+        self.clawdeen.delete()
+        self.assertEqual(self.ids('/api/v1/personajes/?q=luna'), [])
+
+    def test_sintaxis_fts_no_rompe(self):
+        self.assertEqual(self.ids('/api/v1/personajes/?q="OR NEAR(*'), [])
+
+
+class CacheRespuestasTests(CatalogoTestCase):
+    def test_acierto_tras_el_primer_fallo(self):
+        crear_personaje(0)
+        primera = self.client.get('/api/v1/personajes/?sexo=Femenino&page=1')
+        self.assertEqual(primera['X-Cache'], 'MISS')
+        # Mismos parámetros en otro orden: misma entrada
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self.client.get('/api/v1/personajes/?page=1&sexo=Femenino')
+        self.assertEqual(segunda['X-Cache'], 'HIT')
+        self.assertEqual(len(consultas), 0)
+        self.assertEqual(segunda.data, primera.data)
+
+    def test_foto_invalida_todos(self):
+        personaje = crear_personaje(0)
+        self.client.get(f'/api/v1/todos/{personaje.id}/')
+        self.assertEqual(self.client.get(f'/api/v1/todos/{personaje.id}/')['X-Cache'], 'HIT')
+
+        Foto.objects.create(url='https://fotos.example.com/nueva.png', mascota=personaje.mascota.get())
+        respuesta = self.client.get(f'/api/v1/todos/{personaje.id}/')
+        self.assertEqual(respuesta['X-Cache'], 'MISS')
+        self.assertEqual(len(respuesta.data['mascota'][0]['fotos']), 2)
+
+    def test_mascota_invalida_todos_pero_no_ediciones(self):
+        personaje = crear_personaje(0)
+        # Sin fotos: al borrarla no hay borrado en cascada de Foto
+        mascota = Mascotas.objects.create(nombre='Conde Fabuloso', tipo='Murcielago', duenio=personaje)
+        self.client.get('/api/v1/todos/')
+        self.client.get('/api/v1/ediciones/')
+        mascota.delete()
+        self.assertEqual(self.client.get('/api/v1/todos/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/v1/ediciones/')['X-Cache'], 'HIT')
+
+    def test_estadisticas(self):
+        self.client.get('/api/v1/mascotas/')
+        self.client.get('/api/v1/mascotas/')
+        self.assertEqual(self.client.get('/api/v1/cache/estadisticas/').status_code, 403)
+
+        self.usuario.is_staff = True
+        self.usuario.save()
+        respuesta = self.client.get('/api/v1/cache/estadisticas/')
+        self.assertEqual(respuesta.data, {'aciertos': 1, 'fallos': 1, 'ratio_aciertos': 0.5})
+
+
+class PeticionesCondicionalesTests(CatalogoTestCase):
+    def test_etag_y_304(self):
+        crear_personaje(0)
+        respuesta = self.client.get('/api/v1/personajes/')
+        self.assertIn('ETag', respuesta)
+        self.assertIn('Last-Modified', respuesta)
+
+        with CaptureQueriesContext(connection) as consultas:
+            no_modificado = self.client.get('/api/v1/personajes/', HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(no_modificado.status_code, 304)
+        self.assertEqual(no_modificado.content, b'')
+        self.assertEqual(len(consultas), 0)
+
+        no_modificado = self.client.get('/api/v1/personajes/', HTTP_IF_MODIFIED_SINCE=respuesta['Last-Modified'])
+        self.assertEqual(no_modificado.status_code, 304)
+
+    def test_etag_distinto_por_pagina_y_filtro(self):
+        for n in range(12):
+            crear_personaje(n)
+        primera = self.client.get('/api/v1/personajes/')
+        segunda = self.client.get('/api/v1/personajes/?page=2')
+        self.assertNotEqual(primera['ETag'], segunda['ETag'])
+        respuesta = self.client.get('/api/v1/personajes/?page=2', HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_borrado_cambia_el_etag(self):
+        crear_personaje(0)
+        otro = crear_personaje(1)
+        etag = self.client.get('/api/v1/todos/')['ETag']
+        otro.delete()
+        respuesta = self.client.get('/api/v1/todos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.data['results']), 1)
+
+    def test_detalle_cambia_con_foto_anidada(self):
+        personaje = crear_personaje(0)
+        respuesta = self.client.get(f'/api/v1/todos/{personaje.id}/')
+        self.assertEqual(self.client.get(f'/api/v1/todos/{personaje.id}/', HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+        Foto.objects.create(url='https://fotos.example.com/otra.png', munieca=personaje)
+        self.assertEqual(self.client.get(f'/api/v1/todos/{personaje.id}/', HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 200)
+
+    def test_detalle_inexistente(self):
+        self.assertEqual(self.client.get('/api/v1/personajes/999/').status_code, 404)
+
+
+class BulkTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.usuario.is_staff = True
+        self.usuario.save()
+
+    def test_crear_en_lote_con_resultados_por_elemento(self):
+        existente = crear_personaje(0)
+        filas = [
+            {'nombre': 'Frankie Stein', 'monstruo': 'Frankenstein', 'lanzamiento': '2010-07', 'edad': 15},
+            {'nombre': 'Ghoulia Yelps', 'monstruo': 'Zombie', 'lanzamiento': '2010-07', 'edad': 16, 'sexo': 'Otro'},
+            {'nombre': existente.nombre, 'monstruo': existente.monstruo, 'lanzamiento': existente.lanzamiento,
+             'edad': existente.edad, 'sexo': existente.sexo},
+            {'nombre': 'Frankie Stein', 'monstruo': 'Frankenstein', 'lanzamiento': '2010-07', 'edad': 15},
+        ]
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post('/api/v1/personajes/bulk/', filas, format='json')
+        self.assertEqual(respuesta.status_code, 207)
+        self.assertEqual([r['estado'] for r in respuesta.data['resultados']], [201, 400, 409, 409])
+        self.assertIn('sexo', respuesta.data['resultados'][1]['errores'])
+        # duplicados + savepoint + INSERT + índice de búsqueda + documentos (personajes con sus precargas y
+        # upsert) (+ liberar savepoint), no una consulta por fila
+        self.assertLessEqual(len(consultas), 13)
+
+        frankie = Personajes.objects.get(id=respuesta.data['resultados'][0]['id'])
+        self.assertEqual(frankie.busqueda, 'frankie stein frankenstein')
+        self.assertEqual(self.client.get('/api/v1/personajes/?q=frankie').data['count'], 1)
+
+    def test_fk_inexistente(self):
+        personaje = crear_personaje(0)
+        filas = [
+            {'serie': 'Dead Tired', 'lanzamiento': '2011-03', 'generacion': 1, 'muneca': personaje.id},
+            {'serie': 'Dawn of the Dance', 'lanzamiento': '2011-06', 'generacion': 1, 'muneca': 9999},
+        ]
+        respuesta = self.client.post('/api/v1/ediciones/bulk/', filas, format='json')
+        self.assertEqual([r['estado'] for r in respuesta.data['resultados']], [201, 400])
+        self.assertEqual(personaje.ediciones.count(), 2)
+
+    def test_actualizar_y_borrar_en_lote(self):
+        uno, dos = crear_personaje(0), crear_personaje(1)
+        self.client.get('/api/v1/personajes/')
+        respuesta = self.client.patch('/api/v1/personajes/bulk/', [
+            {'id': uno.id, 'frase': 'Nueva frase'},
+            {'id': dos.id, 'ciudadNatal': 'Salem'},
+            {'id': 9999, 'frase': 'No existe'},
+        ], format='json')
+        self.assertEqual([r['estado'] for r in respuesta.data['resultados']], [200, 200, 404])
+        uno.refresh_from_db()
+        dos.refresh_from_db()
+        self.assertEqual(uno.frase, 'Nueva frase')
+        self.assertEqual(uno.ciudadNatal, 'Transilvania')
+        self.assertIn('salem', dos.busqueda)
+        # bulk_update no dispara señales: la caché se invalida a mano
+        self.assertEqual(self.client.get('/api/v1/personajes/')['X-Cache'], 'MISS')
+
+        respuesta = self.client.delete('/api/v1/personajes/bulk/', [uno.id, {'id': 9999}, 'x'], format='json')
+        self.assertEqual([r['estado'] for r in respuesta.data['resultados']], [204, 404, 400])
+        self.assertFalse(Personajes.objects.filter(id=uno.id).exists())
+
+    def test_solo_administradores(self):
+        self.usuario.is_staff = False
+        self.usuario.save()
+        respuesta = self.client.post('/api/v1/mascotas/bulk/', [{'nombre': 'Watzit', 'tipo': 'Perro'}], format='json')
+        self.assertEqual(respuesta.status_code, 403)
+
+    def test_requiere_lista(self):
+        respuesta = self.client.post('/api/v1/skullectors/bulk/', {'serie': 'x'}, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class ExportarTests(CatalogoTestCase):
+    def test_ndjson_en_trozos(self):
+        for n in range(5):
+            crear_personaje(n)
+        with self.settings(CATALOGO_EXPORT_TROZO=2):
+            with CaptureQueriesContext(connection) as consultas:
+                respuesta = self.client.get('/api/v1/todos/exportar/')
+                lineas = b''.join(respuesta.streaming_content).decode('utf-8').splitlines()
+        self.assertTrue(respuesta.streaming)
+        self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        filas = [json.loads(linea) for linea in lineas]
+        self.assertEqual([fila['id'] for fila in filas], sorted(Personajes.objects.values_list('id', flat=True)))
+        self.assertEqual(filas[0]['skullectors'][0]['fotos'][0]['url'], 'https://fotos.example.com/skullectors/0.png')
+        # 3 trozos, cada uno una consulta (personajes con sus documentos)
+        self.assertEqual(len(consultas), 3)
+
+    def test_csv_con_filtros(self):
+        crear_personaje(0)
+        crear_personaje(1)
+        respuesta = self.client.get('/api/v1/todos/exportar/?formato=csv&nombre=Personaje 1')
+        filas = list(csv.DictReader(io.StringIO(b''.join(respuesta.streaming_content).decode('utf-8'))))
+        self.assertEqual(len(filas), 1)
+        self.assertEqual(filas[0]['nombre'], 'Personaje 1')
+        self.assertEqual(filas[0]['fotos'], 'https://fotos.example.com/personajes/1.png')
+        self.assertEqual(json.loads(filas[0]['mascota'])[0]['nombre'], 'Mascota 1')
+
+    def test_formato_desconocido(self):
+        self.assertEqual(self.client.get('/api/v1/todos/exportar/?formato=xml').status_code, 400)
+
+
+class DocumentosCatalogoTests(CatalogoTestCase):
+    def completo(self, personaje):
+        personaje = Personajes.objects.completo().get(id=personaje.id)
+        return json.loads(json.dumps(CompletoSerializer(personaje).data))
+
+    def documento(self, personaje):
+        return json.loads(DocumentoCatalogo.objects.get(personaje=personaje).datos)
+
+    def test_respuesta_igual_que_el_serializador(self):
+        personaje = crear_personaje(0)
+        respuesta = self.client.get(f'/api/v1/todos/{personaje.id}/')
+        self.assertEqual(respuesta.content, json.dumps(self.completo(personaje), ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    def test_se_reconstruye_al_cambiar_relaciones(self):
+        personaje = crear_personaje(0)
+        otro = crear_personaje(1)
+        mascota = personaje.mascota.get()
+        mascota.duenio = otro
+        mascota.save()
+        Foto.objects.filter(munieca=personaje).delete()
+        Foto.objects.create(url='https://fotos.example.com/personajes/nueva.png', munieca=personaje)
+        Skullectors.objects.filter(muneca=personaje).delete()
+        for p in (personaje, otro):
+            self.assertEqual(self.documento(p), self.completo(p))
+        self.assertEqual(len(self.documento(otro)['mascota']), 2)
+
+    def test_bulk_actualiza_documentos(self):
+        self.usuario.is_staff = True
+        self.usuario.save()
+        personaje = crear_personaje(0)
+        otro = crear_personaje(1)
+        edicion = personaje.ediciones.get()
+        respuesta = self.client.patch('/api/v1/ediciones/bulk/', [{'id': edicion.id, 'serie': 'Dawn of the Dance', 'muneca': otro.id}], format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.documento(personaje)['ediciones'], [])
+        self.assertEqual(self.documento(otro), self.completo(otro))
+
+    def test_cache_se_invalida_despues_de_reconstruir(self):
+        personaje = crear_personaje(0)
+        orden = mock.Mock()
+        with mock.patch('projects.signals.reconstruir_documentos', orden.reconstruir), \
+                mock.patch('projects.signals.invalidar', orden.invalidar):
+            personaje.frase = 'Otra frase'
+            personaje.save()
+            personaje.ediciones.get().delete()
+        nombres = [llamada[0] for llamada in orden.mock_calls]
+        # Guardar el personaje, borrar la edición y la foto que cae con ella: cada vez, primero el documento
+        self.assertEqual(nombres, ['reconstruir', 'invalidar'] * 3)
+
+    def test_borrar_personaje_borra_su_documento(self):
+        personaje = crear_personaje(0)
+        personaje.delete()
+        self.assertFalse(DocumentoCatalogo.objects.exists())
+
+    def test_sin_documento_se_serializa_al_vuelo(self):
+        personaje = crear_personaje(0)
+        DocumentoCatalogo.objects.all().delete()
+        respuesta = self.client.get(f'/api/v1/todos/{personaje.id}/')
+        self.assertEqual(respuesta.data, self.completo(personaje))
+
+    def test_sin_documentos_no_hay_consultas_por_fila(self):
+        for n in range(6):
+            crear_personaje(n)
+        DocumentoCatalogo.objects.all().delete()
+        with self.settings(CATALOGO_CACHE_ACTIVA=False):
+            consultas, respuesta = self.contar_consultas('/api/v1/todos/')
+            self.assertEqual(len(respuesta.data['results']), 6)
+            self.assertLessEqual(consultas, 12)
+            with CaptureQueriesContext(connection) as exportar:
+                b''.join(self.client.get('/api/v1/todos/exportar/').streaming_content)
+            self.assertLessEqual(len(exportar), 12)
+
+    def test_comando_rellena_los_que_faltan(self):
+        personaje, otro = crear_personaje(0), crear_personaje(1)
+        DocumentoCatalogo.objects.filter(personaje=personaje).delete()
+        DocumentoCatalogo.objects.filter(personaje=otro).update(datos='{}')
+        salida = io.StringIO()
+        call_command('reconstruir_documentos', faltan=True, stdout=salida)
+        self.assertIn('1 documentos reconstruidos', salida.getvalue())
+        self.assertEqual(self.documento(personaje), self.completo(personaje))
+        # Los que ya tenían documento no se tocan
+        self.assertEqual(DocumentoCatalogo.objects.get(personaje=otro).datos, '{}')
+
+    def test_comando_verifica_y_reconstruye(self):
+        personaje = crear_personaje(0)
+        crear_personaje(1)
+        DocumentoCatalogo.objects.filter(personaje=personaje).update(datos='{}')
+        with self.assertRaises(CommandError):
+            call_command('reconstruir_documentos', verificar=True, stdout=io.StringIO(), stderr=io.StringIO())
+        call_command('reconstruir_documentos', trozo=1, stdout=io.StringIO())
+        call_command('reconstruir_documentos', verificar=True, stdout=io.StringIO())
+        self.assertEqual(self.documento(personaje), self.completo(personaje))
+
+
+class ImportarCatalogoTests(TestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+
+    def fichero(self, nombre, contenido):
+        ruta = os.path.join(self.directorio.name, nombre)
+        with open(ruta, 'w', encoding='utf-8') as f:
+            f.write(contenido)
+        return ruta
+
+    def importar(self, *args, **kwargs):
+        salida, errores = io.StringIO(), io.StringIO()
+        call_command('importar_catalogo', *args, stdout=salida, stderr=errores, **kwargs)
+        return salida.getvalue(), errores.getvalue()
+
+    def test_upsert_idempotente(self):
+        registros = [
+            {'nombre': 'Cleo de Nile', 'monstruo': 'Momia', 'lanzamiento': '2010-07', 'edad': 5842, 'sexo': 'Femenino'},
+            {'nombre': 'Deuce Gorgon', 'monstruo': 'Gorgona', 'lanzamiento': '2010-07', 'edad': 16, 'sexo': 'Masculino'},
+            {'nombre': 'Erróneo', 'monstruo': 'x', 'lanzamiento': '2010-07', 'edad': 'muchos'},
+        ]
+        ruta = self.fichero('personajes.jsonl', '\n'.join(json.dumps(r) for r in registros))
+        salida, errores = self.importar('personajes', ruta, lote=2)
+        self.assertIn('filas/s', salida)
+        self.assertIn('Registro 3', errores)
+        self.assertEqual(Personajes.objects.count(), 2)
+
+        registros[0]['frase'] = 'Soy la reina'
+        ruta = self.fichero('personajes.jsonl', '\n'.join(json.dumps(r) for r in registros[:2]))
+        self.importar('personajes', ruta)
+        self.assertEqual(Personajes.objects.count(), 2)
+        cleo = Personajes.objects.get(nombre='Cleo de Nile')
+        self.assertEqual(cleo.frase, 'Soy la reina')
+        self.assertIn('soy la reina', cleo.busqueda)
+
+    def test_upsert_solo_cambia_los_campos_presentes(self):
+        cleo = Personajes.objects.create(
+            nombre='Cleo de Nile', monstruo='Momia', lanzamiento='2010-07', edad=5842, sexo='Femenino',
+            ciudadNatal='El Cairo', colorFav='Dorado', frase='Original', cumpleanios='01-06',
+        )
+        registros = [
+            {'nombre': 'Cleo de Nile', 'monstruo': 'Momia', 'lanzamiento': '2010-07', 'edad': 5842, 'sexo': 'Femenino', 'frase': 'Nueva'},
+            # Otra fila del lote con las columnas que le faltan a la primera
+            {'nombre': 'Deuce Gorgon', 'monstruo': 'Gorgona', 'lanzamiento': '2010-07', 'edad': 16, 'sexo': 'Masculino',
+             'ciudadNatal': 'Salem', 'colorFav': 'Verde', 'cumpleanios': '03-20'},
+        ]
+        self.importar('personajes', self.fichero('personajes.jsonl', '\n'.join(json.dumps(r) for r in registros)))
+        actualizada = Personajes.objects.get(pk=cleo.pk)
+        self.assertEqual(actualizada.frase, 'Nueva')
+        self.assertEqual((actualizada.ciudadNatal, actualizada.colorFav, actualizada.cumpleanios), ('El Cairo', 'Dorado', '01-06'))
+        self.assertEqual(actualizada.fecha_subida, cleo.fecha_subida)
+        self.assertIn('el cairo', actualizada.busqueda)
+        self.assertEqual(actualizada.fecha_cumpleanios.isoformat(), '2000-01-06')
+        self.assertEqual(Personajes.objects.get(nombre='Deuce Gorgon').ciudadNatal, 'Salem')
+
+    def test_csv_con_fk_por_nombre_o_id(self):
+        personaje = crear_personaje(0)
+        ruta = self.fichero('mascotas.csv', (
+            'nombre,tipo,duenio\n'
+            f'Count Fabulous,Murcielago,{personaje.nombre}\n'
+            f'Watzit,Perro,{personaje.id}\n'
+            'Huerfana,Gato,Nadie\n'
+        ))
+        _, errores = self.importar('mascotas', ruta)
+        self.assertIn('Registro 3', errores)
+        self.assertEqual(set(personaje.mascota.values_list('nombre', flat=True)), {'Mascota 0', 'Count Fabulous', 'Watzit'})
+
+        self.importar('mascotas', ruta)
+        self.assertEqual(Mascotas.objects.count(), 3)
+
+    def test_fotos_por_url(self):
+        personaje = crear_personaje(0)
+        ruta = self.fichero('fotos.jsonl', json.dumps({'url': 'https://fotos.example.com/personajes/0.png', 'munieca': personaje.id}))
+        self.importar('fotos', ruta)
+        _, errores = self.importar('fotos', ruta)
+        self.assertEqual(errores, '')
+        self.assertEqual(personaje.fotos.count(), 1)
+
+    def test_restriccion_incumplida_no_tira_el_lote(self):
+        ruta = self.fichero('ediciones.jsonl', '\n'.join(json.dumps(r) for r in [
+            {'serie': 'Basic', 'lanzamiento': '2010-07', 'generacion': 1},
+            {'serie': 'Mala', 'lanzamiento': '2010-07', 'generacion': 7},
+        ]))
+        _, errores = self.importar('ediciones', ruta)
+        self.assertIn('Registro 2', errores)
+        self.assertEqual(list(Ediciones.objects.values_list('serie', flat=True)), ['Basic'])
+
+    def test_reanudar_desde_checkpoint(self):
+        registros = [{'nombre': f'Mascota {n}', 'tipo': 'Gato'} for n in range(5)]
+        ruta = self.fichero('mascotas.jsonl', '\n'.join(json.dumps(r) for r in registros))
+        with open(f'{ruta}.checkpoint', 'w', encoding='utf-8') as f:
+            json.dump({'modelo': 'mascotas', 'archivo': os.path.abspath(ruta), 'posicion': 3}, f)
+        salida, _ = self.importar('mascotas', ruta, reanudar=True)
+        self.assertIn('Reanudando', salida)
+        self.assertEqual(sorted(Mascotas.objects.values_list('nombre', flat=True)), ['Mascota 3', 'Mascota 4'])
+        self.assertFalse(os.path.exists(f'{ruta}.checkpoint'))
+
+
+class LecturaRapidaTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        for n in range(3):
+            crear_personaje(n)
+        # Nulos, FK vacías y decimales con céntimos
+        Personajes.objects.create(nombre='Sin datos', monstruo='Fantasma', lanzamiento='2011-01', sexo='Masculino')
+        Ediciones.objects.create(serie='Huérfana', lanzamiento='2012-02', generacion=2)
+        Skullectors.objects.create(serie='Sin dueña', lanzamiento='2022-01', descripcion='Suelta', precioOriginal='19.99', limitada=True)
+
+    def comparar(self, url):
+        with self.settings(CATALOGO_CACHE_ACTIVA=False, CATALOGO_LECTURA_RAPIDA=False):
+            esperado = self.client.get(url)
+        with self.settings(CATALOGO_CACHE_ACTIVA=False):
+            consultas, obtenido = self.contar_consultas(url)
+        self.assertEqual(obtenido.content, esperado.content)
+        return consultas
+
+    def test_misma_salida_byte_a_byte(self):
+        for url in ('/api/v1/personajes/', '/api/v1/mascotas/', '/api/v1/ediciones/', '/api/v1/skullectors/',
+                    '/api/v1/personajes/?ordering=-nombre', '/api/v1/ediciones/?generacion=1',
+                    '/api/v1/skullectors/?paginacion=cursor&ordering=serie', '/api/v1/personajes/?q=personaje'):
+            with self.subTest(url=url):
+                self.comparar(url)
+
+    def test_consultas_constantes(self):
+        pocas = self.comparar('/api/v1/mascotas/')
+        for n in range(3, 8):
+            crear_personaje(n)
+        self.assertEqual(self.comparar('/api/v1/mascotas/'), pocas)
+
+    def test_benchmark(self):
+        salida = io.StringIO()
+        call_command('bench_lectura', filas=10, repeticiones=1, stdout=salida)
+        for nombre in ('todos', 'personajes', 'mascotas', 'ediciones', 'skullectors'):
+            self.assertIn(nombre, salida.getvalue())
+        self.assertIn('documentos', salida.getvalue())
+        self.assertIn('filas/s', salida.getvalue())
+
+
+class CamposExpandTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.personajes = [crear_personaje(n) for n in range(3)]
+
+    def get(self, url):
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        with self.settings(CATALOGO_CACHE_ACTIVA=False, CATALOGO_LECTURA_RAPIDA=False):
+            # El camino con serializador (y queryset optimizado) da exactamente lo mismo
+            self.assertEqual(self.client.get(url).content, respuesta.content)
+        return respuesta
+
+    def test_fields_recorta_columnas_y_anidados(self):
+        fila = self.get('/api/v1/mascotas/?fields=id,nombre,duenio.nombre').data['results'][0]
+        self.assertEqual(list(fila), ['id', 'nombre', 'duenio'])
+        self.assertEqual(fila['duenio'], {'nombre': 'Personaje 0'})
+
+    def test_nombres_inventados_no_crean_planes(self):
+        base = self.get('/api/v1/mascotas/?fields=id,nombre,duenio.nombre&expand=duenio').content
+        planes = lectura._compilar.cache_info().currsize
+        with self.settings(CATALOGO_CACHE_ACTIVA=False):
+            for n in range(20):
+                url = f'/api/v1/mascotas/?fields=id,nombre,duenio.nombre,falso{n},duenio.otro{n}&expand=duenio,nada{n}'
+                self.assertEqual(self.client.get(url).content, base)
+        self.assertEqual(lectura._compilar.cache_info().currsize, planes)
+        self.assertLessEqual(lectura._compilar.cache_info().maxsize, lectura.PLANES_MAX)
+
+    def test_expand_vacio_deja_solo_ids(self):
+        fila = self.get('/api/v1/mascotas/?expand=').data['results'][0]
+        self.assertEqual(fila['duenio'], self.personajes[0].id)
+        self.assertEqual(fila['fotos'], ['https://fotos.example.com/mascotas/0.png'])
+
+        fila = self.get('/api/v1/mascotas/?expand=duenio').data['results'][0]
+        self.assertEqual(fila['duenio']['nombre'], 'Personaje 0')
+        self.assertEqual(fila['duenio']['fotos'], ['https://fotos.example.com/personajes/0.png'])
+
+    def test_todos_para_movil(self):
+        url = '/api/v1/todos/?fields=id,nombre,fotos&expand='
+        consultas, respuesta = self.contar_consultas(url)
+        self.assertEqual(respuesta.data['results'][0], {
+            'id': self.personajes[0].id, 'nombre': 'Personaje 0', 'fotos': ['https://fotos.example.com/personajes/0.png'],
+        })
+        # agregado del ETag + COUNT + personajes + fotos: nada de mascotas, ediciones ni skullectors
+        self.assertEqual(consultas, 4)
+        self.get(url)
+
+    def test_detalle_solo_carga_lo_pedido(self):
+        edicion = self.personajes[1].ediciones.get()
+        url = f'/api/v1/ediciones/{edicion.id}/?fields=id,serie,muneca.nombre&expand=muneca'
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.data, {'id': edicion.id, 'serie': 'Basic', 'muneca': {'nombre': 'Personaje 1'}})
+        # agregado del ETag + la edición con su personaje en un JOIN, sin columnas de más
+        self.assertEqual(len(consultas), 2)
+        self.assertNotIn('frase', consultas[-1]['sql'])
+        self.assertNotIn('lanzamiento', consultas[-1]['sql'])
+        self.get(url)
+
+    def test_cache_separada_por_seleccion(self):
+        self.get('/api/v1/personajes/')
+        respuesta = self.client.get('/api/v1/personajes/?fields=id')
+        self.assertEqual(respuesta['X-Cache'], 'MISS')
+        self.assertEqual(list(respuesta.data['results'][0]), ['id'])
+
+
+class RenderersTests(CatalogoTestCase):
+    def test_orjson_igual_que_drf(self):
+        datos = {
+            'precio': Decimal('45.10'),
+            'fecha': timezone.now(),
+            'dia': timezone.now().date(),
+            'texto': 'Transilvania ñ \u2028 "comillas"',
+            'fotos': [{'url': 'https://fotos.example.com/1.png'}, {'url': 'https://fotos.example.com/2.png'}],
+            'nada': None,
+            3: [1.5, True],
+        }
+        self.assertEqual(OrjsonRenderer().render(datos), JSONRenderer().render(datos))
+
+    def test_messagepack_por_accept(self):
+        crear_personaje(0)
+        json_respuesta = self.client.get('/api/v1/skullectors/')
+        respuesta = self.client.get('/api/v1/skullectors/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(respuesta['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(respuesta.content), json.loads(json_respuesta.content))
+        self.assertNotEqual(respuesta['ETag'], json_respuesta['ETag'])
+        self.assertIn('Accept', respuesta['Vary'])
+
+        revalidada = self.client.get('/api/v1/skullectors/', HTTP_ACCEPT='application/msgpack', HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(revalidada.status_code, 304)
+        # El ETag de MessagePack no vale para la versión JSON
+        self.assertEqual(self.client.get('/api/v1/skullectors/', HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 200)
+
+    def test_parsers(self):
+        self.usuario.is_staff = True
+        self.usuario.save()
+        filas = [{'nombre': 'Frankie Stein', 'monstruo': 'Frankenstein', 'lanzamiento': '2010-07', 'edad': 15}]
+        respuesta = self.client.post('/api/v1/personajes/bulk/', msgpack.packb(filas), content_type='application/msgpack')
+        self.assertEqual(respuesta.status_code, 201)
+        respuesta = self.client.post('/api/v1/personajes/bulk/', b'[{"nombre": ', content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_benchmark(self):
+        crear_personaje(0)
+        salida = io.StringIO()
+        call_command('bench_formatos', filas=10, repeticiones=1, stdout=salida)
+        for formato in ('json (DRF)', 'orjson', 'msgpack'):
+            self.assertIn(formato, salida.getvalue())
+
+
+class CompresionTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        for n in range(5):
+            crear_personaje(n)
+        self.plano = self.client.get('/api/v1/todos/')
+
+    def test_gzip_y_brotli_segun_accept_encoding(self):
+        respuesta = self.client.get('/api/v1/todos/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(respuesta.content), self.plano.content)
+        self.assertIn('Accept-Encoding', respuesta['Vary'])
+        self.assertTrue(respuesta['ETag'].startswith('W/'))
+
+        respuesta = self.client.get('/api/v1/todos/', HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(respuesta['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(respuesta.content), self.plano.content)
+
+        respuesta = self.client.get('/api/v1/todos/', HTTP_ACCEPT_ENCODING='br;q=0, gzip;q=0.5')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertFalse(self.client.get('/api/v1/todos/', HTTP_ACCEPT_ENCODING='identity').has_header('Content-Encoding'))
+
+    def test_respuestas_pequenias_sin_comprimir(self):
+        respuesta = self.client.get('/api/v1/personajes/?fields=id', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(respuesta.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', respuesta['Vary'])
+
+    def test_streaming(self):
+        respuesta = self.client.get('/api/v1/todos/exportar/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        lineas = gzip.decompress(b''.join(respuesta.streaming_content)).decode('utf-8').splitlines()
+        self.assertEqual(len(lineas), 5)
+
+    def test_aciertos_reutilizan_lo_comprimido(self):
+        with mock.patch('projects.middleware.comprimir', wraps=middleware.comprimir) as comprimir:
+            primera = self.client.get('/api/v1/todos/', HTTP_ACCEPT_ENCODING='gzip')
+            segunda = self.client.get('/api/v1/todos/', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(segunda['X-Cache'], 'HIT')
+            self.assertEqual(segunda.content, primera.content)
+            self.assertEqual(comprimir.call_count, 1)
+
+            # Un acierto ya comprimido ni se renderiza: sale tal cual con las mismas cabeceras
+            with mock.patch.object(OrjsonRenderer, 'render', autospec=True, side_effect=OrjsonRenderer.render) as render:
+                tercera = self.client.get('/api/v1/todos/', HTTP_ACCEPT_ENCODING='gzip')
+            render.assert_not_called()
+            self.assertEqual(tercera.content, primera.content)
+            for cabecera in ('Content-Type', 'Content-Encoding', 'Content-Length', 'ETag', 'Vary'):
+                self.assertEqual(tercera[cabecera], primera[cabecera])
+
+            # Otro formato u otra codificación son otras entradas
+            self.client.get('/api/v1/todos/', HTTP_ACCEPT_ENCODING='br')
+            self.client.get('/api/v1/todos/', HTTP_ACCEPT_ENCODING='gzip', HTTP_ACCEPT='application/msgpack')
+            self.assertEqual(comprimir.call_count, 3)
+
+    def test_etag_debil_sigue_validando(self):
+        respuesta = self.client.get('/api/v1/todos/', HTTP_ACCEPT_ENCODING='gzip')
+        revalidada = self.client.get('/api/v1/todos/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(revalidada.status_code, 304)
+
+
+class FacetasTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.personajes = [crear_personaje(n) for n in range(4)]
+        Ediciones.objects.create(muneca=self.personajes[0], serie='Sweet 1600', lanzamiento='2011-01', generacion=2)
+        self.personajes[1].sexo = 'Masculino'
+        self.personajes[1].monstruo = 'Hombre lobo'
+        self.personajes[1].save()
+        Skullectors.objects.filter(muneca=self.personajes[2]).update(limitada=True)
+        Mascotas.objects.filter(duenio=self.personajes[3]).update(tipo='Gato')
+
+    def facetas(self, url):
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.data
+
+    def test_recuentos(self):
+        datos = self.facetas('/api/v1/todos/facetas/')
+        self.assertEqual(datos['total'], 4)
+        facetas = datos['facetas']
+        self.assertEqual(facetas['generacion'], [{'valor': 1, 'total': 4}, {'valor': 2, 'total': 1}])
+        self.assertEqual(facetas['sexo'], [{'valor': 'Femenino', 'total': 3}, {'valor': 'Masculino', 'total': 1}])
+        self.assertEqual(facetas['monstruo'], [{'valor': 'Vampiro', 'total': 3}, {'valor': 'Hombre lobo', 'total': 1}])
+        self.assertEqual(facetas['limitada'], [{'valor': False, 'total': 3}, {'valor': True, 'total': 1}])
+        self.assertEqual(facetas['tipoMascota'], [{'valor': 'Murcielago', 'total': 3}, {'valor': 'Gato', 'total': 1}])
+
+    def test_mismos_filtros_que_el_listado(self):
+        url = '/api/v1/personajes/facetas/?sexo=Femenino&q=personaje'
+        datos = self.facetas(url)
+        self.assertEqual(datos['total'], self.client.get('/api/v1/personajes/?sexo=Femenino&q=personaje').data['count'])
+        self.assertEqual(datos['facetas']['sexo'], [{'valor': 'Femenino', 'total': 3}])
+        self.assertEqual(self.facetas('/api/v1/skullectors/facetas/?serie=Skullector')['facetas']['limitada'],
+                         [{'valor': False, 'total': 3}, {'valor': True, 'total': 1}])
+        self.assertEqual(self.client.get('/api/v1/todos/facetas/?generacion=x').status_code, 400)
+
+    def test_consultas_agrupadas_y_cache(self):
+        url = '/api/v1/todos/facetas/?generacion=1'
+        consultas, _ = self.contar_consultas(url)
+        # total + una agrupación por faceta
+        self.assertEqual(consultas, 1 + 6)
+        consultas, _ = self.contar_consultas(url + '&page=2&ordering=nombre')
+        self.assertEqual(consultas, 0)
+
+        # update() no dispara señales: se guarda una mascota para que suba la versión
+        Mascotas.objects.filter(duenio=self.personajes[0]).update(tipo='Gato')
+        Mascotas.objects.first().save()
+        datos = self.facetas(url)
+        self.assertEqual(datos['facetas']['tipoMascota'][0], {'valor': 'Gato', 'total': 2})
+
+
+class ClavesNaturalesTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.usuario.is_staff = True
+        self.usuario.save()
+        self.datos = {'nombre': 'Draculaura', 'monstruo': 'Vampiro', 'lanzamiento': '2010-07', 'edad': 1600, 'sexo': 'Femenino', 'frase': 'Hola'}
+
+    def test_duplicado_lo_detecta_la_restriccion(self):
+        self.assertEqual(self.client.post('/api/v1/personajes/', self.datos, format='json').status_code, 201)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post('/api/v1/personajes/', self.datos, format='json')
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.data['error'], 'Este personaje ya existe')
+        # Ningún exists() antes del INSERT: el primer SQL es el propio INSERT
+        self.assertTrue(next(c['sql'] for c in consultas if 'projects_personajes' in c['sql']).startswith('INSERT'))
+        self.assertEqual(Personajes.objects.filter(nombre='Draculaura').count(), 1)
+
+    def test_upsert_actualiza_el_existente(self):
+        creado = self.client.post('/api/v1/personajes/', self.datos, format='json').data
+        respuesta = self.client.post('/api/v1/personajes/?upsert=true', {**self.datos, 'frase': 'Adiós'}, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['id'], creado['id'])
+        self.assertEqual(Personajes.objects.get(id=creado['id']).frase, 'Adiós')
+
+        skullector = {'serie': 'Skullector', 'lanzamiento': '2021-10', 'descripcion': 'Cazafantasmas', 'limitada': False, 'certificado': False}
+        self.assertEqual(self.client.post('/api/v1/skullectors/', skullector, format='json').status_code, 201)
+        respuesta = self.client.post('/api/v1/skullectors/?upsert=1', {**skullector, 'limitada': True}, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(Skullectors.objects.get(descripcion='Cazafantasmas').limitada)
+
+    def test_otras_restricciones_no_son_conflictos(self):
+        respuesta = self.client.post('/api/v1/personajes/', {**self.datos, 'sexo': 'Otro'}, format='json')
+        self.assertEqual(respuesta.status_code, 500)
+        self.assertFalse(Personajes.objects.exists())
+
+    def test_sin_edad_tambien_es_unico(self):
+        datos = {campo: valor for campo, valor in self.datos.items() if campo != 'edad'}
+        Personajes.objects.create(**datos)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Personajes.objects.create(**datos)
+        Personajes.objects.create(**datos, edad=1)
+
+    def test_actualizar_a_una_clave_existente_es_conflicto(self):
+        primero = self.client.post('/api/v1/personajes/', self.datos, format='json').data
+        otro = self.client.post('/api/v1/personajes/', {**self.datos, 'nombre': 'Clawdeen'}, format='json').data
+        for metodo in (self.client.patch, self.client.put):
+            respuesta = metodo(f"/api/v1/personajes/{otro['id']}/", {**self.datos, 'frase': 'Copia'}, format='json')
+            self.assertEqual(respuesta.status_code, 409)
+            self.assertEqual(respuesta.data, {'error': 'Este personaje ya existe'})
+        self.assertEqual(Personajes.objects.get(id=otro['id']).nombre, 'Clawdeen')
+        # Cambiar otros campos del mismo registro sigue funcionando
+        respuesta = self.client.patch(f"/api/v1/personajes/{primero['id']}/", {'frase': 'Otra'}, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+
+        skullector = {'serie': 'Skullector', 'lanzamiento': '2021-10', 'limitada': False, 'certificado': False}
+        self.client.post('/api/v1/skullectors/', {**skullector, 'descripcion': 'Una'}, format='json')
+        segunda = self.client.post('/api/v1/skullectors/', {**skullector, 'descripcion': 'Otra'}, format='json').data
+        respuesta = self.client.patch(f"/api/v1/skullectors/{segunda['id']}/", {'descripcion': 'Una'}, format='json')
+        self.assertEqual(respuesta.status_code, 409)
+
+        duenia = Personajes.objects.get(id=primero['id'])
+        Mascotas.objects.create(nombre='Count Fabulous', tipo='Murcielago', duenio=duenia)
+        mascota = Mascotas.objects.create(nombre='Otra', tipo='Murcielago', duenio=duenia)
+        respuesta = self.client.patch(f'/api/v1/mascotas/{mascota.id}/', {'nombre': 'Count Fabulous'}, format='json')
+        self.assertEqual(respuesta.status_code, 409)
+
+    def test_mascotas_de_distintos_duenios(self):
+        primera, segunda = crear_personaje(0), crear_personaje(1)
+        mascota = {'nombre': 'Count Fabulous', 'tipo': 'Murcielago'}
+        respuesta = self.client.post('/api/v1/mascotas/bulk/', [
+            {**mascota, 'duenio': primera.id}, {**mascota, 'duenio': segunda.id}, {**mascota, 'duenio': primera.id},
+        ], format='json')
+        self.assertEqual([r['estado'] for r in respuesta.data['resultados']], [201, 201, 409])
+        self.assertEqual(Mascotas.objects.filter(nombre='Count Fabulous').count(), 2)
+        # Sin dueño también son únicas
+        Mascotas.objects.create(**mascota)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Mascotas.objects.create(**mascota)
+
+    def test_migracion_no_borra_duplicados(self):
+        migracion = importlib.import_module('projects.migrations.0010_claves_naturales')
+        # Una clave que sí admiten las restricciones actuales para poder tener duplicados en la base de datos
+        claves = (('Mascotas', ('tipo',), 'duenio_id', (('Foto', 'mascota'),)),)
+        crear_personaje(0)
+        crear_personaje(1)
+        with mock.patch.object(migracion, 'CLAVES', claves):
+            with self.assertRaisesMessage(RuntimeError, 'Mascotas'):
+                migracion.fusionar_duplicados(apps, connection.schema_editor())
+            self.assertEqual(Mascotas.objects.count(), 2)
+
+            with self.settings(CATALOGO_FUSIONAR_DUPLICADOS=True), self.assertLogs(migracion.logger, 'WARNING') as registro:
+                migracion.fusionar_duplicados(apps, connection.schema_editor())
+        conservada = Mascotas.objects.get()
+        self.assertIn(f'Mascotas {conservada.id}', registro.output[0])
+        self.assertEqual(Foto.objects.filter(mascota=conservada).count(), 2)
+
+
+class FechasLanzamientoTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.personajes = [crear_personaje(n) for n in range(4)]
+        for personaje, lanzamiento in zip(self.personajes, ['2010-07', '2010-12', '2012-03', '03/2013']):
+            personaje.lanzamiento = lanzamiento
+            personaje.save()
+
+    def test_columnas_derivadas(self):
+        personaje = Personajes.objects.get(id=self.personajes[3].id)
+        self.assertEqual(personaje.fecha_lanzamiento.isoformat(), '2013-03-01')
+        self.assertEqual(personaje.fecha_cumpleanios.isoformat(), '2000-05-13')
+        self.assertEqual(Ediciones.objects.first().fecha_lanzamiento.isoformat(), '2010-07-01')
+        self.assertEqual(parsear_cumpleanios('29/02').isoformat(), '2000-02-29')
+        self.assertIsNone(parsear_lanzamiento('julio'))
+
+    def test_migracion_rellena_por_lotes(self):
+        migracion = importlib.import_module('projects.migrations.0011_fechas_lanzamiento')
+
+        def fechas():
+            return {
+                nombre: list(apps.get_model('projects', nombre).objects.order_by('id').values_list(*(fecha for _, fecha, _ in columnas)))
+                for nombre, columnas in migracion.FECHAS.items()
+            }
+        esperado = fechas()
+        for nombre, columnas in migracion.FECHAS.items():
+            apps.get_model('projects', nombre).objects.update(**{fecha: None for _, fecha, _ in columnas})
+        with mock.patch('projects.operaciones.LOTE', 3):
+            migracion.rellenar_fechas(apps, connection.schema_editor())
+        self.assertEqual(fechas(), esperado)
+        self.assertEqual(esperado['Personajes'][3], (date(2013, 3, 1), date(2000, 5, 13)))
+
+    def test_update_fields_incluye_derivadas(self):
+        personaje = self.personajes[0]
+        for objeto in (personaje, personaje.ediciones.get(), personaje.skullectors.get()):
+            objeto.lanzamiento = '2015-02'
+            objeto.save(update_fields=['lanzamiento'])
+            self.assertEqual(type(objeto).objects.get(pk=objeto.pk).fecha_lanzamiento.isoformat(), '2015-02-01')
+
+    def test_filtro_por_rango(self):
+        respuesta = self.client.get('/api/v1/personajes/?lanzamiento_desde=2010-08&lanzamiento_hasta=2012&ordering=-fecha_lanzamiento')
+        self.assertEqual([p['lanzamiento'] for p in respuesta.data['results']], ['2012-03', '2010-12'])
+        self.assertEqual(self.client.get('/api/v1/todos/?lanzamiento_hasta=2010').data['count'], 2)
+        self.assertEqual(self.client.get('/api/v1/skullectors/?lanzamiento_desde=2021-10').data['count'], 4)
+        self.assertEqual(self.client.get('/api/v1/personajes/?lanzamiento_desde=ayer').status_code, 400)
+
+    def test_cronologia(self):
+        datos = self.client.get('/api/v1/personajes/cronologia/').data
+        self.assertEqual(datos['periodos'], [
+            {'periodo': '2010-07', 'total': 1}, {'periodo': '2010-12', 'total': 1},
+            {'periodo': '2012-03', 'total': 1}, {'periodo': '2013-03', 'total': 1},
+        ])
+        datos = self.client.get('/api/v1/todos/cronologia/?por=anio&lanzamiento_hasta=2012').data
+        self.assertEqual(datos['periodos'], [{'periodo': '2010', 'total': 2}, {'periodo': '2012', 'total': 1}])
+        self.assertEqual(datos['total'], 3)
+        self.assertEqual(self.client.get('/api/v1/ediciones/cronologia/?por=dia').status_code, 400)
+
+
+class HistorialPreciosTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.personajes = [crear_personaje(n) for n in range(2)]
+        self.skullector = Skullectors.objects.get(muneca=self.personajes[0])
+
+    def test_cada_precio_nuevo_se_registra(self):
+        for precio in ('120.00', '120.00', '80.00'):
+            self.skullector.precioMercado = Decimal(precio)
+            self.skullector.save()
+        # 90 al crearla, 120 (una sola vez: repetir el precio no es una observación nueva) y 80
+        self.assertEqual(list(self.skullector.historial_precios.order_by('id').values_list('precio', flat=True)),
+                         [Decimal('90.00'), Decimal('120.00'), Decimal('80.00')])
+        mes = ResumenPrecio.objects.get(skullector=self.skullector, periodo='mes')
+        self.assertEqual((mes.minimo, mes.maximo, mes.ultimo, mes.observaciones), (Decimal('80'), Decimal('120'), Decimal('80'), 3))
+        self.assertEqual(mes.media.quantize(Decimal('0.01')), Decimal('96.67'))
+
+    def test_resumenes_por_lote(self):
+        ahora = timezone.now()
+        registrar_precios([
+            (self.skullector.id, '100', ahora - timedelta(days=40)),
+            (self.skullector.id, '110', ahora),
+            (self.skullector.id, '70', ahora - timedelta(minutes=1)),
+        ])
+        meses = ResumenPrecio.objects.filter(skullector=self.skullector, periodo='mes').order_by('inicio')
+        self.assertEqual([m.observaciones for m in meses][-1], 3)
+        # La observación atrasada no pasa a ser la última del mes
+        self.assertEqual(meses.last().ultimo, Decimal('110'))
+        self.assertEqual(meses.last().minimo, Decimal('70'))
+
+    def test_endpoints(self):
+        self.skullector.precioMercado = Decimal('110.00')
+        self.skullector.save()
+        datos = self.client.get(f'/api/v1/skullectors/{self.skullector.id}/precios/?periodo=dia').data
+        self.assertEqual(len(datos), 1)
+        self.assertEqual((datos[0]['minimo'], datos[0]['maximo'], datos[0]['media'], datos[0]['ultimo']), ('90.00', '110.00', '100.00', '110.00'))
+        self.assertEqual(self.client.get(f'/api/v1/skullectors/{self.skullector.id}/precios/?periodo=semana').status_code, 400)
+
+        tendencia = self.client.get('/api/v1/skullectors/tendencias/').data
+        self.assertEqual(len(tendencia), 1)
+        self.assertEqual((tendencia[0]['minimo'], tendencia[0]['maximo'], tendencia[0]['skullectors']), ('90.00', '110.00', 2))
+
+        self.assertEqual(self.client.get('/api/v1/skullectors/?precio_min=100').data['count'], 1)
+        self.assertEqual(self.client.get('/api/v1/skullectors/?precio_min=50&precio_max=95').data['count'], 1)
+        self.assertEqual(self.client.get('/api/v1/skullectors/?precio_max=mucho').status_code, 400)
+
+    def test_bulk_registra_precios(self):
+        self.usuario.is_staff = True
+        self.usuario.save()
+        self.client.patch('/api/v1/skullectors/bulk/', [{'id': self.skullector.id, 'precioMercado': '150.00'}], format='json')
+        self.assertEqual(self.skullector.historial_precios.latest('fecha').precio, Decimal('150.00'))
+
+
+class AutenticacionCacheadaTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        crear_personaje(0)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.usuario).access_token}')
+
+    def consultas_usuario(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get('/api/v1/personajes/')
+        return respuesta.status_code, sum(1 for consulta in consultas if 'projects_usuario' in consulta['sql'])
+
+    def test_sin_consultas_de_usuario_con_la_cache_caliente(self):
+        self.assertEqual(self.consultas_usuario(), (200, 1))
+        self.assertEqual(self.consultas_usuario(), (200, 0))
+        self.assertEqual(self.consultas_usuario(), (200, 0))
+
+    def test_desactivar_invalida(self):
+        self.consultas_usuario()
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertEqual(self.client.get('/api/v1/personajes/').status_code, 401)
+
+    def test_cambio_de_contrasenia_invalida(self):
+        self.consultas_usuario()
+        self.usuario.set_password('otra-clave-segura-456')
+        self.usuario.save()
+        self.assertEqual(self.consultas_usuario(), (200, 1))
+
+    def test_borrar_usuario(self):
+        self.consultas_usuario()
+        self.usuario.delete()
+        self.assertEqual(self.client.get('/api/v1/personajes/').status_code, 401)
+
+
+# Worker A comprueba un refresh token (y construye su filtro), worker B (otro proceso, con su propia caché en
+# memoria) lo pone en la lista negra con un logout y A lo vuelve a comprobar
+SCRIPT_DOS_PROCESOS = '''
+import multiprocessing
+import django
+django.setup()
+from django.core.management import call_command
+from django.db import connection
+from rest_framework_simplejwt.exceptions import TokenError
+from projects.models import Usuario
+from projects.tokens import RefreshToken
+
+def worker_b(token):
+    RefreshToken(token).blacklist()
+
+call_command('migrate', verbosity=0)
+usuario = Usuario.objects.create_user(username='dos', email='dos@example.com', password='clave-segura-123')
+token = str(RefreshToken.for_user(usuario))
+RefreshToken(token)
+connection.close()
+proceso = multiprocessing.get_context('fork').Process(target=worker_b, args=(token,))
+proceso.start()
+proceso.join()
+assert proceso.exitcode == 0
+try:
+    RefreshToken(token)
+    print('A: BLACKLISTED TOKEN ACCEPTED')
+except TokenError:
+    print('A: rechazado')
+'''
+
+
+class ListaNegraTokensTests(CatalogoTestCase):
+    def login(self):
+        respuesta = self.client.post('/api/v1/login/', {'email': 'lector@example.com', 'password': 'clave-segura-123'}, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()['refresh']
+
+    def test_migracion_indice_caducidad(self):
+        migracion = importlib.import_module('projects.migrations.0013_indice_caducidad_tokens')
+        editor = connection.schema_editor()
+
+        def indices():
+            with connection.cursor() as cursor:
+                return connection.introspection.get_constraints(cursor, OutstandingToken._meta.db_table)
+
+        self.assertEqual(indices()['outstandingtoken_expires_idx']['columns'], ['expires_at'])
+        # Idempotente en los dos sentidos y con el SQL del motor (sin IF NOT EXISTS)
+        migracion.crear_indice(apps, editor)
+        migracion.borrar_indice(apps, editor)
+        migracion.borrar_indice(apps, editor)
+        self.assertNotIn('outstandingtoken_expires_idx', indices())
+        migracion.crear_indice(apps, editor)
+        self.assertIn('outstandingtoken_expires_idx', indices())
+
+    def test_filtro_bloom(self):
+        filtro = FiltroBloom(1000)
+        for n in range(1000):
+            filtro.add(f'jti-{n}')
+        self.assertTrue(all(f'jti-{n}' in filtro for n in range(1000)))
+        falsos = sum(1 for n in range(10000) if f'otro-{n}' in filtro)
+        self.assertLess(falsos, 300)
+
+    def test_rotacion_y_logout(self):
+        refresh = self.login()
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post('/api/v1/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        # El refresh usado queda en la lista negra tras la rotación
+        self.assertEqual(self.client.post('/api/v1/token/refresh/', {'refresh': refresh}, format='json').status_code, 401)
+
+        nuevo = respuesta.data['refresh']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/v1/logout/', {'refresh': nuevo}, format='json').status_code, 200)
+        self.assertEqual(self.client.post('/api/v1/token/refresh/', {'refresh': nuevo}, format='json').status_code, 401)
+
+    @override_settings(JWT_LISTA_NEGRA_FILTRO=True)
+    def test_sin_consultas_para_tokens_validos(self):
+        lista_negra.contiene('calentar')
+        with self.assertNumQueries(0):
+            self.assertFalse(lista_negra.contiene('jti-que-no-esta'))
+
+    def test_cache_local_consulta_la_base_de_datos(self):
+        # Con LocMemCache (la de por defecto) un "no está" del filtro no vale: otro worker puede haberlo añadido
+        lista_negra.contiene('calentar')
+        with self.assertNumQueries(1):
+            self.assertFalse(lista_negra.contiene('jti-que-no-esta'))
+
+    def test_varios_procesos_con_cache_local(self):
+        # Dos procesos con su propia LocMemCache sobre la misma base de datos: el logout en uno vale en el otro
+        with tempfile.TemporaryDirectory() as carpeta:
+            entorno = {**os.environ, 'HOST': f"sqlite:///{os.path.join(carpeta, 'db.sqlite3')}", 'DJANGO_SETTINGS_MODULE': 'backendMattel.settings'}
+            resultado = subprocess.run(
+                [sys.executable, '-c', SCRIPT_DOS_PROCESOS], env=entorno, cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=300,
+            )
+        self.assertEqual(resultado.returncode, 0, resultado.stderr)
+        self.assertIn('A: rechazado', resultado.stdout)
+
+    @override_settings(JWT_LISTA_NEGRA_FILTRO=True)
+    def test_otros_procesos_ven_los_tokens_nuevos(self):
+        otro_proceso = ListaNegra()
+        token = RefreshToken(self.login())
+        self.assertFalse(otro_proceso.contiene(token['jti']))
+        with self.captureOnCommitCallbacks(execute=True):
+            token.blacklist()
+        self.assertTrue(otro_proceso.contiene(token['jti']))
+
+    @override_settings(JWT_LISTA_NEGRA_FILTRO=True)
+    def test_otros_procesos_ven_filas_creadas_fuera_del_token(self):
+        # Como las crea el admin de token_blacklist: sin pasar por RefreshToken.blacklist()
+        otro_proceso = ListaNegra()
+        token = RefreshToken(self.login())
+        self.assertFalse(otro_proceso.contiene(token['jti']))
+        with self.captureOnCommitCallbacks(execute=True):
+            BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+        self.assertTrue(otro_proceso.contiene(token['jti']))
+
+    @override_settings(JWT_LISTA_NEGRA_FILTRO=True)
+    def test_filas_que_confirman_tarde(self):
+        # Una fila con un id mucho menor que las ya leídas (su transacción confirmó después) no se pierde
+        otro_proceso = ListaNegra()
+        caduca = timezone.now() + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            alto = OutstandingToken.objects.create(jti='alto', token='x', user=self.usuario, expires_at=caduca)
+            BlacklistedToken.objects.create(id=1000, token=alto)
+        self.assertTrue(otro_proceso.contiene('alto'))
+        self.assertFalse(otro_proceso.contiene('tarde'))
+        with self.captureOnCommitCallbacks(execute=True):
+            tarde = OutstandingToken.objects.create(jti='tarde', token='x', user=self.usuario, expires_at=caduca)
+            BlacklistedToken.objects.create(id=10, token=tarde)
+        self.assertTrue(otro_proceso.contiene('tarde'))
+
+    def test_purga_por_lotes(self):
+        ahora = timezone.now()
+        for n in range(5):
+            caducado = OutstandingToken.objects.create(jti=f'viejo-{n}', token='x', user=self.usuario, expires_at=ahora - timedelta(days=1))
+            BlacklistedToken.objects.create(token=caducado)
+        OutstandingToken.objects.create(jti='vigente', token='x', user=self.usuario, expires_at=ahora + timedelta(days=1))
+
+        call_command('purgar_tokens', lote=2, stdout=io.StringIO())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['vigente'])
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+
+class HashingPoolTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        pool_hashing.cerrar()
+
+    def tearDown(self):
+        pool_hashing.cerrar()
+        super().tearDown()
+
+    def login(self, password='clave-segura-123'):
+        return self.client.post('/api/v1/login/', {'email': 'lector@example.com', 'password': password}, format='json')
+
+    def test_login(self):
+        respuesta = self.login()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['user']['email'], 'lector@example.com')
+        self.assertIn('access', respuesta.json())
+
+        respuesta = self.login('otra-clave')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json(), {'non_field_errors': ['Credenciales incorrectas']})
+        respuesta = self.client.post('/api/v1/login/', {'email': 'no-es-un-email', 'password': 'x'}, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('email', respuesta.json())
+
+    def test_registro(self):
+        datos = {'username': 'nueva', 'email': 'nueva@example.com', 'password': 'clave-segura-456'}
+        respuesta = self.client.post('/api/v1/register/', datos, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertTrue(Usuario.objects.get(email='nueva@example.com').check_password('clave-segura-456'))
+        # Repetido: los errores del serializador, sin llegar a cifrar nada
+        self.assertEqual(self.client.post('/api/v1/register/', datos, format='json').status_code, 400)
+
+    @override_settings(HASHING_HILOS=1, HASHING_COLA=0)
+    def test_pool_lleno_responde_503(self):
+        liberar = threading.Event()
+        ocupado = pool_hashing.enviar(liberar.wait)
+        try:
+            respuesta = self.login()
+            self.assertEqual(respuesta.status_code, 503)
+            self.assertEqual(respuesta['Retry-After'], '1')
+        finally:
+            liberar.set()
+            ocupado.result()
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(HASHING_HILOS=0)
+    def test_sin_pool(self):
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(HASHING_HILOS=1, HASHING_COLA=0)
+    def test_authenticate_sincrono_no_usa_el_pool(self):
+        # El admin y cualquier authenticate() síncrono siguen con el ModelBackend de Django aunque el pool esté lleno
+        liberar = threading.Event()
+        ocupado = pool_hashing.enviar(liberar.wait)
+        try:
+            self.assertEqual(authenticate(username='lector@example.com', password='clave-segura-123'), self.usuario)
+        finally:
+            liberar.set()
+            ocupado.result()
+
+    def test_login_fallido_envia_la_senial(self):
+        recibidas = []
+
+        def receptor(sender, credentials, request, **kwargs):
+            recibidas.append((sender, credentials))
+        user_login_failed.connect(receptor)
+        try:
+            self.assertEqual(self.login('otra-clave').status_code, 400)
+            self.assertEqual(self.login().status_code, 200)
+        finally:
+            user_login_failed.disconnect(receptor)
+        self.assertEqual(recibidas, [('django.contrib.auth', {'username': 'lector@example.com', 'password': '********************'})])
+
+
+class LecturaAsincronaTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        for n in range(3):
+            crear_personaje(n)
+        Personajes.objects.create(nombre='Sin datos', monstruo='Fantasma', lanzamiento='2011-01', sexo='Masculino')
+
+    def comparar(self, ruta):
+        with self.settings(CATALOGO_CACHE_ACTIVA=False):
+            esperado = self.client.get(f'/api/v1/{ruta}', HTTP_ACCEPT='application/json')
+            obtenido = self.client.get(f'/api/v1/asincrono/{ruta}')
+        self.assertEqual(obtenido.status_code, esperado.status_code)
+        datos = obtenido.json()
+        for enlace in ('next', 'previous'):
+            if isinstance(datos, dict) and datos.get(enlace):
+                datos[enlace] = datos[enlace].replace('/asincrono/', '/')
+        self.assertEqual(datos, esperado.json())
+
+    def test_misma_salida(self):
+        personaje = Personajes.objects.order_by('id').first()
+        skullector = Skullectors.objects.order_by('id').first()
+        for ruta in ('todos/', 'personajes/', 'mascotas/', 'ediciones/', 'skullectors/',
+                     'personajes/?ordering=-nombre', 'skullectors/?precio_min=10', 'skullectors/?paginacion=cursor&ordering=serie',
+                     'personajes/?q=personaje', 'todos/?fields=nombre,ediciones&expand=ediciones', 'mascotas/?expand=',
+                     f'personajes/{personaje.id}/', f'todos/{personaje.id}/', f'skullectors/{skullector.id}/',
+                     'personajes/999999/', 'personajes/abc/', 'ediciones/?lanzamiento_desde=xx'):
+            with self.subTest(ruta=ruta):
+                self.comparar(ruta)
+
+    def test_cache_y_autenticacion(self):
+        self.assertEqual(self.client.get('/api/v1/asincrono/personajes/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/v1/asincrono/personajes/')['X-Cache'], 'HIT')
+        self.assertEqual(APIClient().get('/api/v1/asincrono/personajes/').status_code, 401)
+
+    def test_paralelo_segun_la_base_de_datos(self):
+        # SQLite, o dentro de una transacción (la de cada test), va en serie; si se fuerza, en paralelo
+        self.assertFalse(asincrono.paralelo('default'))
+        with mock.patch.dict(settings.DATABASES['default'], ENGINE='django.db.backends.postgresql'):
+            self.assertFalse(asincrono.paralelo('default'))
+            with mock.patch.object(connection, 'in_atomic_block', False):
+                self.assertTrue(asincrono.paralelo('default'))
+        with self.settings(CATALOGO_ASYNC_PARALELO=True):
+            self.assertTrue(asincrono.paralelo('default'))
+
+    def test_cada_hilo_reutiliza_su_conexion(self):
+        creadas = []
+        crear = connections.create_connection
+
+        def contar(alias):
+            creadas.append(alias)
+            return crear(alias)
+
+        with mock.patch.object(connections, 'create_connection', side_effect=contar), ThreadPoolExecutor(1) as hilo:
+            for _ in range(3):
+                self.assertEqual(hilo.submit(asincrono._leer_en_hilo, BlacklistedToken.objects.all()).result(), [])
+            hilo.submit(lambda: asincrono._hilo.conexiones.pop('default').close()).result()
+        self.assertEqual(creadas, ['default'])
+
+
+def imagen_png(ancho=300, alto=200, color=(200, 30, 120, 255)):
+    salida = io.BytesIO()
+    Image.new('RGBA', (ancho, alto), color).save(salida, 'PNG')
+    return SimpleUploadedFile('foto.png', salida.getvalue(), content_type='image/png')
+
+
+class VariantesFotoPerfilTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.TemporaryDirectory()
+        self.ajustes = self.settings(MEDIA_ROOT=self.media.name, IMAGENES_HILOS=0, IMAGENES_PERFIL_ANCHOS=(64, 128, 256, 512))
+        self.ajustes.enable()
+
+    def tearDown(self):
+        self.ajustes.disable()
+        self.media.cleanup()
+        super().tearDown()
+
+    def registrar(self):
+        datos = {'username': 'con_foto', 'email': 'foto@example.com', 'password': 'clave-segura-456', 'profile_picture': imagen_png()}
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = APIClient().post('/api/v1/register/', datos, format='multipart')
+        self.assertEqual(respuesta.status_code, 201)
+        return Usuario.objects.get(email='foto@example.com')
+
+    def test_registro_genera_variantes(self):
+        usuario = self.registrar()
+        # Nombre con el hash del contenido
+        self.assertRegex(usuario.profile_picture.name, r'^profile_images/[0-9a-f]{16}\.png$')
+        variantes = usuario.profile_picture_variantes
+        self.assertEqual(variantes['origen'], usuario.profile_picture.name)
+        # 512 no cabe en una foto de 200 px de alto
+        self.assertEqual(sorted(variantes['webp'], key=int), ['64', '128'])
+        for formato, tipo in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            for ancho, ruta in variantes[formato].items():
+                with Image.open(os.path.join(self.media.name, ruta)) as imagen:
+                    self.assertEqual((imagen.format, imagen.size), (tipo, (int(ancho), int(ancho))))
+
+        datos = self.client.get(f'/api/v1/usuarios/{usuario.pk}/').json()
+        self.assertTrue(datos['profile_picture_variantes']['webp']['64'].endswith(variantes['webp']['64']))
+
+    def test_servir_con_cache_inmutable(self):
+        usuario = self.registrar()
+        ruta = usuario.profile_picture_variantes['webp']['64']
+        respuesta = self.client.get(f'/media/{ruta}')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'image/webp')
+        self.assertIn('immutable', respuesta['Cache-Control'])
+        self.assertEqual(self.client.get(f'/media/{ruta}', HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+        self.assertEqual(self.client.get('/media/profile_images/no-existe.png').status_code, 404)
+
+    def test_cambiar_y_quitar_foto(self):
+        usuario = self.registrar()
+        anterior = usuario.profile_picture_variantes
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.patch(f'/api/v1/usuarios/{usuario.pk}/', {'profile_picture': imagen_png(color=(0, 0, 255, 255))}, format='multipart')
+        self.assertEqual(respuesta.status_code, 200)
+        usuario.refresh_from_db()
+        self.assertNotEqual(usuario.profile_picture_variantes['webp'], anterior['webp'])
+
+        usuario.profile_picture = None
+        usuario.save()
+        usuario.refresh_from_db()
+        self.assertEqual(usuario.profile_picture_variantes, {})
+
+    def test_comando_procesar_imagenes(self):
+        usuario = self.registrar()
+        Usuario.objects.filter(pk=usuario.pk).update(profile_picture_variantes={})
+        salida = io.StringIO()
+        call_command('procesar_imagenes', stdout=salida)
+        self.assertIn('1 fotos procesadas', salida.getvalue())
+        usuario.refresh_from_db()
+        self.assertEqual(usuario.profile_picture_variantes['origen'], usuario.profile_picture.name)
+
+
+class ClaveFotoTests(CatalogoTestCase):
+    def test_url_unica_por_su_hash(self):
+        personaje = crear_personaje(0)
+        foto = personaje.fotos.get()
+        self.assertIsInstance(foto.pk, int)
+        self.assertEqual(foto.url_hash, hash_url(foto.url))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Foto.objects.create(url=foto.url, mascota=personaje.mascota.get())
+
+        foto.url = 'https://fotos.example.com/personajes/otra.png'
+        foto.save(update_fields=['url'])
+        self.assertEqual(Foto.objects.get(pk=foto.pk).url_hash, hash_url(foto.url))
+
+    def test_bench_fotos(self):
+        salida = io.StringIO()
+        call_command('bench_fotos', fotos=40, lote=2, consultas=2, stdout=salida)
+        self.assertIn('índices', salida.getvalue())
+        self.assertNotIn('bench_fotos_id', connection.introspection.table_names())
+
+
+def descargar_sin_red(url, timeout, limite):
+    # IMAGENES_FOTOS_DESCARGADOR de prueba
+    return imagen_png(ancho=500, alto=250).read()
+
+
+class ServidorFotos(http.server.SimpleHTTPRequestHandler):
+    # Sirve el directorio de la prueba y cuenta las peticiones, como si fuera el servidor de las fotos
+    peticiones = 0
+
+    def do_GET(self):
+        type(self).peticiones += 1
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+class ProxyFotosTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.TemporaryDirectory()
+        self.remoto = tempfile.TemporaryDirectory()
+        self.ajustes = self.settings(MEDIA_ROOT=self.media.name, IMAGENES_FOTOS_ANCHOS=(160, 320, 1024))
+        self.ajustes.enable()
+        with open(os.path.join(self.remoto.name, 'foto.png'), 'wb') as f:
+            f.write(imagen_png(ancho=600, alto=300).read())
+        with open(os.path.join(self.remoto.name, 'rota.png'), 'wb') as f:
+            f.write(b'no es una imagen')
+        ServidorFotos.peticiones = 0
+        self.servidor = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), functools.partial(ServidorFotos, directory=self.remoto.name)
+        )
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        self.base = f'http://127.0.0.1:{self.servidor.server_address[1]}'
+        self.personaje = Personajes.objects.create(nombre='Frankie Stein', monstruo='Frankenstein', lanzamiento='2010-07')
+
+    def tearDown(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+        self.ajustes.disable()
+        self.media.cleanup()
+        self.remoto.cleanup()
+        super().tearDown()
+
+    def pedir(self, url, etag=None, **params):
+        cabeceras = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return APIClient().get('/api/v1/imagenes/', {'url': url, **params}, **cabeceras)
+
+    def test_descarga_una_vez_y_sirve_variantes(self):
+        url = f'{self.base}/foto.png'
+        Foto.objects.create(url=url, munieca=self.personaje)
+        respuesta = self.pedir(url, ancho=160)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'image/webp')
+        self.assertIn('immutable', respuesta['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(respuesta.streaming_content))) as imagen:
+            self.assertEqual(imagen.size, (160, 80))
+
+        # Más ancho que el original: se queda a su tamaño
+        respuesta = self.pedir(url, ancho=1024, formato='jpeg')
+        with Image.open(io.BytesIO(b''.join(respuesta.streaming_content))) as imagen:
+            self.assertEqual((imagen.format, imagen.size), ('JPEG', (600, 300)))
+        self.assertEqual(self.pedir(url, etag=respuesta['ETag'], ancho=160).status_code, 200)
+        self.assertEqual(self.pedir(url, etag=respuesta['ETag'], ancho=1024, formato='jpeg').status_code, 304)
+        self.assertEqual(ServidorFotos.peticiones, 1)
+
+    def test_errores(self):
+        Foto.objects.create(url=f'{self.base}/rota.png', munieca=self.personaje)
+        Foto.objects.create(url=f'{self.base}/no-existe.png', munieca=self.personaje)
+        self.assertEqual(self.pedir(f'{self.base}/foto.png').status_code, 404)
+        self.assertEqual(self.pedir(f'{self.base}/rota.png', ancho=200).status_code, 400)
+        self.assertEqual(self.pedir(f'{self.base}/rota.png').status_code, 502)
+        self.assertEqual(self.pedir(f'{self.base}/no-existe.png').status_code, 502)
+
+    def test_descargador_configurable(self):
+        url = 'https://fotos.example.com/personajes/frankie.png'
+        Foto.objects.create(url=url, munieca=self.personaje)
+        with self.settings(IMAGENES_FOTOS_DESCARGADOR='projects.tests.descargar_sin_red'):
+            self.assertEqual(self.pedir(url, ancho=320).status_code, 200)
+
+    def test_comando_precargar_fotos(self):
+        Foto.objects.create(url=f'{self.base}/foto.png', munieca=self.personaje)
+        Foto.objects.create(url=f'{self.base}/rota.png', munieca=self.personaje)
+        salida, errores = io.StringIO(), io.StringIO()
+        call_command('precargar_fotos', hilos=2, stdout=salida, stderr=errores)
+        self.assertIn('1 fotos procesadas, 0 ya estaban, 1 con errores', salida.getvalue())
+        self.assertIn('rota.png', errores.getvalue())
+
+        call_command('precargar_fotos', stdout=salida, stderr=io.StringIO())
+        self.assertIn('0 fotos procesadas, 1 ya estaban, 1 con errores', salida.getvalue())
+        self.assertEqual(self.pedir(f'{self.base}/foto.png', ancho=320).status_code, 200)
+        self.assertEqual(ServidorFotos.peticiones, 3)
+
+
+class PruebaCargaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_generar_catalogo(self):
+        opciones = dict(personajes=4, mascotas=0.5, ediciones=2, skullectors=0.5, fotos=1, precios=2, lote=3, stdout=io.StringIO())
+        call_command('generar_catalogo', **opciones)
+        self.assertEqual(
+            [modelo.objects.count() for modelo in (Personajes, Mascotas, Ediciones, Skullectors, Foto, DocumentoCatalogo)],
+            [4, 2, 8, 2, 16, 4],
+        )
+        self.assertEqual(ResumenPrecio.objects.filter(periodo='dia').count(), 4)
+        personaje = Personajes.objects.first()
+        self.assertEqual(personaje.fecha_lanzamiento, parsear_lanzamiento(personaje.lanzamiento))
+
+        # Se puede volver a ejecutar: la numeración sigue y no choca con las claves únicas
+        call_command('generar_catalogo', **opciones)
+        self.assertEqual(Personajes.objects.count(), 8)
+        self.assertEqual(Foto.objects.count(), 32)
+
+    def test_bench_carga_mide_todas_las_rutas(self):
+        call_command('generar_catalogo', personajes=3, precios=2, stdout=io.StringIO())
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'carga.json')
+            salida, errores = io.StringIO(), io.StringIO()
+            # Con concurrencia 1 las peticiones van por la conexión de la transacción del test
+            call_command('bench_carga', peticiones=2, concurrencia=1, salida=ruta, stdout=salida, stderr=errores)
+            self.assertEqual(errores.getvalue(), '')
+            with open(ruta, encoding='utf-8') as f:
+                datos = json.load(f)
+
+            self.assertEqual(set(datos['rutas']), rutas())
+            self.assertEqual(datos['filas']['personajes'], 3)
+            for nombre, resultado in datos['rutas'].items():
+                self.assertEqual(resultado['peticiones'], 2)
+                self.assertTrue(all(codigo.startswith('2') for codigo in resultado['codigos']), (nombre, resultado['codigos']))
+                self.assertGreaterEqual(resultado['p99_ms'], resultado['p50_ms'])
+            self.assertGreater(datos['rutas']['personajes-list']['consultas'], 0)
+            self.assertFalse(Usuario.objects.filter(email__endswith='@bench-carga.example.com').exists())
+
+            salida = io.StringIO()
+            call_command('bench_carga', 'personajes-list', 'logout', peticiones=2, concurrencia=1, comparar=ruta, stdout=salida)
+            self.assertIn('| req/s', salida.getvalue())
+            self.assertNotIn('usuarios-list', salida.getvalue())
@@ -0,0 +1,176 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from .cache import PREFIJO
+
+
+# Generación de la lista negra: cambia al borrar filas (purga, admin...) y obliga a cada proceso a rehacer su
+# filtro desde la base de datos. Cambios: sube con cada fila añadida y cada proceso se trae solo las nuevas.
+# Los dos los suben los receptores de BlacklistedToken (signals.py), la fila venga de donde venga
+CLAVE_GENERACION = f'{PREFIJO}:tokens:generacion'
+CLAVE_CAMBIOS = f'{PREFIJO}:tokens:cambios'
+CLAVE_PURGA = f'{PREFIJO}:tokens:purga'
+
+# Cachés que no se comparten entre procesos: los contadores de una no avisan de lo que añaden los demás
+CACHES_LOCALES = (LocMemCache, DummyCache)
+
+
+def filtro_activo():
+    activo = getattr(settings, 'JWT_LISTA_NEGRA_FILTRO', None)
+    if activo is None:
+        return not isinstance(caches['default'], CACHES_LOCALES)
+    return bool(activo)
+
+
+class FiltroBloom:
+    # Conjunto aproximado: "no está" es seguro, "está" puede ser un falso positivo (con probabilidad `error`
+    # mientras no se pase de `capacidad` elementos)
+
+    def __init__(self, capacidad, error=0.01):
+        self.capacidad = max(int(capacidad), 1)
+        self.bits_totales = max(int(math.ceil(-self.capacidad * math.log(error) / math.log(2) ** 2)), 8)
+        self.funciones = max(int(round(self.bits_totales / self.capacidad * math.log(2))), 1)
+        self.bits = bytearray((self.bits_totales + 7) // 8)
+        self.elementos = 0
+
+    def _posiciones(self, valor):
+        resumen = hashlib.blake2b(valor.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(resumen[:8], 'big')
+        h2 = int.from_bytes(resumen[8:], 'big') | 1
+        return [(h1 + i * h2) % self.bits_totales for i in range(self.funciones)]
+
+    def add(self, valor):
+        for posicion in self._posiciones(valor):
+            self.bits[posicion >> 3] |= 1 << (posicion & 7)
+        self.elementos += 1
+
+    def __contains__(self, valor):
+        return all(self.bits[posicion >> 3] & (1 << (posicion & 7)) for posicion in self._posiciones(valor))
+
+    def lleno(self):
+        return self.elementos > self.capacidad
+
+
+class ListaNegra:
+    # JTI en la lista negra de simplejwt, en un filtro de Bloom por proceso. Comprobar un token no consulta la
+    # base de datos salvo que el filtro diga que puede estar (entonces decide un exists() por jti, indexado).
+    # El filtro se mantiene al día con dos contadores en la caché compartida (ver CLAVE_GENERACION/CAMBIOS);
+    # sin caché compartida (filtro_activo) no se usa y decide siempre la base de datos
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filtro = None
+        self.generacion = None
+        self.cambios = None
+        # Último id leído y cuántas filas hay hasta él: si la base de datos tiene más es que alguna confirmó
+        # después de leer otras con ids mayores
+        self.hasta_id = 0
+        self.filas = 0
+
+    def _reconstruir(self, generacion, cambios):
+        # Una sola consulta (también las caducadas, que la purga mantiene en pocas) para que hasta_id y filas
+        # salgan de la misma foto de la tabla
+        filas = list(BlacklistedToken.objects.values_list('id', 'token__jti', 'token__expires_at'))
+        ahora = timezone.now()
+        vigentes = [jti for _, jti, caduca in filas if caduca > ahora]
+        self.filtro = FiltroBloom(max(2 * len(vigentes), getattr(settings, 'JWT_LISTA_NEGRA_CAPACIDAD', 10000)))
+        for jti in vigentes:
+            self.filtro.add(jti)
+        self.hasta_id = max((pk for pk, _, _ in filas), default=0)
+        self.filas = len(filas)
+        self.generacion, self.cambios = generacion, cambios
+
+    def _sincronizar(self):
+        # False si la caché no es compartida o no guarda nada: sin contadores no se sabe qué han añadido
+        # otros procesos y se consulta siempre la base de datos
+        if not filtro_activo():
+            return False
+        contadores = cache.get_many([CLAVE_GENERACION, CLAVE_CAMBIOS])
+        generacion = contadores.get(CLAVE_GENERACION)
+        if generacion is None:
+            cache.add(CLAVE_GENERACION, time.time_ns(), None)
+            generacion = cache.get(CLAVE_GENERACION)
+            if generacion is None:
+                return False
+        cambios = contadores.get(CLAVE_CAMBIOS)
+
+        if self.filtro is None or generacion != self.generacion or self.filtro.lleno():
+            self._reconstruir(generacion, cambios)
+        elif cambios != self.cambios:
+            nuevas = list(BlacklistedToken.objects.filter(id__gt=self.hasta_id).values_list('id', 'token__jti'))
+            hasta_id = max((pk for pk, _ in nuevas), default=self.hasta_id)
+            # Una fila con id por debajo de hasta_id que confirmó tarde no sale en `nuevas` pero sí en el
+            # recuento: entonces se rehace el filtro entero en vez de perderla
+            if BlacklistedToken.objects.filter(id__lte=hasta_id).count() != self.filas + len(nuevas):
+                self._reconstruir(generacion, cambios)
+            else:
+                for _, jti in nuevas:
+                    self.filtro.add(jti)
+                self.hasta_id = hasta_id
+                self.filas += len(nuevas)
+                self.cambios = cambios
+        return True
+
+    def contiene(self, jti):
+        with self.lock:
+            if self._sincronizar() and jti not in self.filtro:
+                return False
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def anotar(self):
+        try:
+            cache.incr(CLAVE_CAMBIOS)
+        except ValueError:
+            cache.add(CLAVE_CAMBIOS, time.time_ns(), None)
+
+    def reiniciar(self):
+        cache.set(CLAVE_GENERACION, time.time_ns(), None)
+
+
+lista_negra = ListaNegra()
+
+
+class RefreshToken(tokens.RefreshToken):
+    # El RefreshToken de simplejwt, pero la lista negra se consulta en el filtro antes que en la base de datos
+
+    def check_blacklist(self):
+        if lista_negra.contiene(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+
+def purgar_tokens(lote=1000, maximo_lotes=None):
+    # Borra por lotes los tokens caducados (y con ellos sus entradas de la lista negra, en cascada; el receptor
+    # de post_delete reinicia los filtros). Devuelve cuántos se han borrado
+    borrados = 0
+    lotes = 0
+    while maximo_lotes is None or lotes < maximo_lotes:
+        ids = list(OutstandingToken.objects.filter(expires_at__lte=timezone.now()).order_by('id').values_list('id', flat=True)[:lote])
+        if not ids:
+            break
+        with transaction.atomic():
+            OutstandingToken.objects.filter(id__in=ids).delete()
+        borrados += len(ids)
+        lotes += 1
+    return borrados
+
+
+def purga_programada():
+    # Un lote de purga como mucho cada JWT_PURGA_INTERVALO segundos entre todos los procesos (el primero que
+    # se lleva la marca de la caché); el resto lo hace el comando purgar_tokens desde cron
+    intervalo = getattr(settings, 'JWT_PURGA_INTERVALO', 3600)
+    if intervalo and cache.add(CLAVE_PURGA, True, intervalo):
+        purgar_tokens(getattr(settings, 'JWT_PURGA_LOTE', 1000), maximo_lotes=1)
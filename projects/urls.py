@@ -3,8 +3,11 @@ from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
 from .api import (
     CompletoViewSet, PersonajesViewSet, MascotasViewSet,
-    EdicionesViewSet, SkullectorViewSet, RegisterView, LogoutView, LoginView, UsuarioViewSet
+    EdicionesViewSet, SkullectorViewSet, RegisterView, LogoutView, LoginView, UsuarioViewSet,
+    CacheEstadisticasView
 )
+from .asincrono import LecturaAsincrona
+from .views import imagen_foto
 
 router = routers.DefaultRouter()
 
@@ -20,6 +23,22 @@ urlpatterns = [
     path('login/', LoginView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('cache/estadisticas/', CacheEstadisticasView.as_view(), name='cache_estadisticas'),
+    path('imagenes/', imagen_foto, name='imagen_foto'),
 ]
 
+# Lecturas del catálogo con el ORM async (ver asincrono.py): mismas respuestas que list/retrieve del router
+for recurso, viewset, basename in (
+    ('todos', CompletoViewSet, 'completo'),
+    ('personajes', PersonajesViewSet, 'personajes'),
+    ('mascotas', MascotasViewSet, 'mascotas'),
+    ('ediciones', EdicionesViewSet, 'ediciones'),
+    ('skullectors', SkullectorViewSet, 'skullectors'),
+):
+    vista = LecturaAsincrona.as_view(viewset=viewset, basename=basename)
+    urlpatterns += [
+        path(f'asincrono/{recurso}/', vista, name=f'asincrono-{basename}-list'),
+        path(f'asincrono/{recurso}/<pk>/', vista, name=f'asincrono-{basename}-detail'),
+    ]
+
 urlpatterns += router.urls
\ No newline at end of file
@@ -1,7 +1,77 @@
+import mimetypes
+import os
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse
 from django.shortcuts import render
 from django.contrib.auth.forms import UserCreationForm
+
+from . import fotos
+from .imagenes import CARPETA, es_inmutable
+from .models import Foto, hash_url
  
 # Create your views here.
 
 def documentation(request):
     return render(request, 'signup.html')
+
+
+def _servir_imagen(request, nombre, etag=None):
+    # Con etag, la imagen no cambia nunca: caché de un año, immutable y 304 si el cliente ya la tiene
+    try:
+        archivo = default_storage.open(nombre, 'rb')
+    except (FileNotFoundError, IsADirectoryError, SuspiciousFileOperation):
+        raise Http404("La imagen no existe")
+
+    if etag is not None and etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        archivo.close()
+        respuesta = HttpResponseNotModified()
+    else:
+        tipo = mimetypes.guess_type(nombre)[0] or 'application/octet-stream'
+        respuesta = FileResponse(archivo, content_type=tipo)
+    if etag is not None:
+        respuesta['Cache-Control'] = 'public, max-age=31536000, immutable'
+        respuesta['ETag'] = etag
+    else:
+        respuesta['Cache-Control'] = 'public, max-age=3600'
+    return respuesta
+
+
+# Fotos de perfil y sus variantes (ver imagenes.py). Las que llevan el hash del contenido en el nombre no
+# cambian nunca
+def imagen_perfil(request, ruta):
+    etag = f'"{os.path.basename(ruta)}"' if es_inmutable(ruta) else None
+    return _servir_imagen(request, f'{CARPETA}/{ruta}', etag)
+
+
+# Proxy de las fotos del catálogo (ver fotos.py), sin autenticación como el resto de imágenes:
+#   GET /api/v1/imagenes/?url=<Foto.url>&ancho=<de IMAGENES_FOTOS_ANCHOS, el mayor por defecto>&formato=webp|jpeg
+# La primera petición de una foto la descarga y genera sus variantes; el comando precargar_fotos lo adelanta
+def imagen_foto(request):
+    url = request.GET.get('url')
+    if not url:
+        return JsonResponse({"error": "Falta el parámetro url"}, status=400)
+    disponibles = fotos.anchos()
+    try:
+        ancho = int(request.GET.get('ancho', disponibles[-1]))
+    except ValueError:
+        ancho = None
+    formato = request.GET.get('formato', 'webp')
+    if ancho not in disponibles or formato not in fotos.EXTENSIONES:
+        return JsonResponse({
+            "error": "Variante no disponible",
+            "detalles": f"ancho: {', '.join(map(str, disponibles))}; formato: {', '.join(fotos.EXTENSIONES)}",
+        }, status=400)
+
+    if not fotos.en_cache(url):
+        # Solo URLs del catálogo: el proxy no descarga cualquier cosa que le pidan
+        if not Foto.objects.filter(url_hash=hash_url(url), url=url).exists():
+            return JsonResponse({"error": "La foto no existe"}, status=404)
+        try:
+            fotos.cachear(url)
+        except fotos.ErrorDescarga as e:
+            return JsonResponse({"error": "No se ha podido descargar la imagen", "detalles": str(e)}, status=502)
+
+    nombre = fotos.ruta_variante(url, ancho, formato)
+    return _servir_imagen(request, nombre, f'"{nombre.replace("/", "-")}"')